@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, stream_with_context,
+                   g, has_request_context)
 from models.pacientes import PacientesModel
 from models.atencion_medica import AtencionMedicaModel
 from models.experiencia import ExperienciaModel
@@ -6,7 +7,22 @@ from models.especialidad import EspecialidadModel
 from models.tipo_atencion import TipoAtencionModel
 from models.personal_medico import PersonalMedicoModel
 from models.contratos import ContratosManager
+from models.stats import HospitalStatsModel
+from models.rows import iter_json_response
+from models.pagination import KeysetPage, parse_page_args
+from models.atencion_import import IMPORT_CHUNK_SIZE
+from models.export import ExportModel, EXPORT_FORMATS, parse_export_args, iter_csv, iter_jsonl
+from models.unit_of_work import UnitOfWork, set_unit_of_work_provider, outside_unit_of_work
+from models.base import statement_registry
+from models.metrics import query_metrics
+from models.pool import all_pool_stats
+from models.outbox import CONTRATO_OUTBOX_ENABLED, contrato_outbox, get_contrato_outbox_worker
+from models.saga import saga_log, resume_abandoned_sagas
+from models.changes import change_log
 import os
+import sqlite3
+import tempfile
+import time
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -22,6 +38,170 @@ experiencia_model = ExperienciaModel()
 especialidad_model = EspecialidadModel()
 tipo_atencion_model = TipoAtencionModel()
 personal_medico_model = PersonalMedicoModel()
+hospital_stats_model = HospitalStatsModel()
+export_model = ExportModel()
+
+# ================== UNIDAD DE TRABAJO POR PETICIÓN ==================
+
+def request_unit_of_work():
+    """Unidad de trabajo de la petición actual; se crea al primer acceso a la base"""
+    if not has_request_context():
+        return None
+    if 'unit_of_work' not in g:
+        g.unit_of_work = UnitOfWork()
+    return g.unit_of_work
+
+# Todas las llamadas a modelos de una petición comparten una conexión por nodo
+if os.getenv('REQUEST_UNIT_OF_WORK', 'True').lower() in ('1', 'true', 'yes'):
+    set_unit_of_work_provider(request_unit_of_work)
+
+def response_failed(response):
+    """True si la respuesta es de error: estado >= 400 o JSON con success=False
+
+    La mayoría de las rutas de la API responden 200 con {'success': False} cuando el
+    modelo capturó el error, así que el estado por sí solo no basta.
+    """
+    if response.status_code >= 400:
+        return True
+    if response.is_json and not response.is_streamed:
+        payload = response.get_json(silent=True)
+        return isinstance(payload, dict) and payload.get('success') is False
+    return False
+
+@app.after_request
+def mark_failed_request(response):
+    # Una respuesta de error revierte lo escrito durante la petición
+    if response_failed(response):
+        g.request_failed = True
+    return response
+
+@app.teardown_request
+def finish_unit_of_work(exc):
+    """Confirma al final de la petición, o revierte si hubo excepción o respuesta de error"""
+    unit = g.pop('unit_of_work', None)
+    if unit is None:
+        return
+    success = exc is None and not g.pop('request_failed', False)
+    if not unit.finish(success=success):
+        print(f"🔄 {request.method} {request.path}: cambios de la petición revertidos")
+
+# Proceso que ya ejecutó warm_up() (cada worker lo ejecuta después del fork)
+_warmed_pid = None
+
+def warm_up():
+    """Inicializa el proceso: nodo, chequeo de salud, índices de búsqueda y catálogos
+
+    Abre conexiones e inicia hilos, por eso con workers preforked se llama en cada
+    worker después del fork (ver gunicorn.conf.py) y no al importar el módulo.
+    Devuelve los segundos que tomó; una segunda llamada en el mismo proceso no hace nada.
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return 0.0
+    _warmed_pid = os.getpid()
+    started = time.monotonic()
+    
+    # Detectar el nodo una sola vez al arrancar y mantenerlo actualizado en segundo plano
+    node_resolver = pacientes_model.get_node_resolver()
+    print(f"🏥 Nodo detectado al iniciar: {node_resolver.refresh()}")
+    node_resolver.start()
+    
+    # Índices de búsqueda en memoria: se construyen en segundo plano (mientras tanto se busca por SQL)
+    pacientes_model.warm_search_index()
+    personal_medico_model.warm_search_index()
+    
+    # Catálogos de referencia en memoria: /especialidad, /tipo-atencion y los formularios sin viajes a la base
+    if os.getenv('CATALOG_CACHE_WARMUP', 'True').lower() in ('1', 'true', 'yes'):
+        especialidad_model.warm_catalog_cache()
+        tipo_atencion_model.warm_catalog_cache()
+    
+    # Sagas (alta/baja de personal con contrato) que un proceso anterior dejó a medias
+    resumed = resume_abandoned_sagas()
+    if resumed:
+        print(f"🔄 {resumed} saga(s) abandonada(s) compensada(s)")
+    
+    # Cola local de contratos hacia Quito: cada worker la drena (las entradas se toman con lease)
+    if CONTRATO_OUTBOX_ENABLED:
+        get_contrato_outbox_worker().start()
+    
+    elapsed = time.monotonic() - started
+    print(f"⏱️ Proceso {os.getpid()} listo en {elapsed * 1000:.0f} ms")
+    return elapsed
+
+def get_app(warm=True):
+    """La aplicación del módulo, inicializada con warm_up() si warm=True
+
+    No es una fábrica: las rutas y los modelos son globales de este módulo, así que
+    cada llamada devuelve la misma instancia. warm=False deja warm_up() para después
+    del fork (wsgi.py).
+    """
+    if warm:
+        warm_up()
+    return app
+
+# Tamaño aproximado (caracteres) de cada bloque enviado al cliente al hacer streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Filas de la primera página renderizada; el resto llega por scroll infinito (KeysetLoader en main.js)
+FIRST_PAGE_SIZE = 100
+
+def stream_json_response(payload, key, rows, page=None):
+    """Envía {...payload, key: [filas], total: N, next_after: cursor} a medida que llegan las filas del cursor"""
+    def trailer(count):
+        return {
+            'total': count,
+            'next_after': page.next_after(rows.last(), count) if page else None
+        }
+    
+    def generate():
+        try:
+            fragments = iter_json_response(payload, key, rows, default=app.json.default,
+                                           trailer=trailer)
+            # El encabezado sale de inmediato: el primer byte no depende del tamaño de la vista
+            yield next(fragments)
+            yield from buffer_fragments(fragments)
+        finally:
+            # Respaldo: el cierre principal es call_on_close
+            rows.close()
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='application/json')
+    # Devuelve la conexión aunque el generador nunca arranque (HEAD, desconexión temprana)
+    response.call_on_close(rows.close)
+    return response
+
+def buffer_fragments(fragments):
+    """Agrupa fragmentos pequeños en bloques de ~STREAM_CHUNK_SIZE caracteres"""
+    buffer, size = [], 0
+    for fragment in fragments:
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def json_result(payload, status):
+    """Respuesta JSON de un cuerpo compartido con asgi.py (funciones *_result)"""
+    return jsonify(payload), status
+
+def page_args_error(e):
+    """Respuesta 400 para parámetros de paginación inválidos"""
+    return jsonify({
+        'success': False,
+        'error': f'Parámetros de paginación inválidos: {e}'
+    }), 400
+
+def change_version():
+    """Versión del registro de cambios antes de leer una lista (base de /api/<entidad>/changes)
+
+    None si el registro no está disponible: el cliente recarga la lista en lugar de pedir deltas.
+    """
+    try:
+        return change_log.version()
+    except sqlite3.Error as e:
+        print(f"⚠️ Registro de cambios no disponible: {e}")
+        return None
 
 @app.route('/')
 def index():
@@ -37,7 +217,7 @@ def hospital():
 def pacientes():
     """Módulo de gestión de pacientes - Carga desde Vista_Paciente"""
     try:
-        result = pacientes_model.get_all_pacientes()
+        result = pacientes_model.get_all_pacientes(limit=FIRST_PAGE_SIZE)
         
         return render_template('pacientes.html', 
                              pacientes=result['pacientes'] if result['success'] else [],
@@ -52,15 +232,20 @@ def pacientes():
 def api_pacientes():
     """API para obtener pacientes en formato JSON"""
     try:
-        result = pacientes_model.get_all_pacientes()
+        try:
+            after, limit = parse_page_args(request.args)
+        except ValueError as e:
+            return page_args_error(e)
+        
+        version = change_version()
+        result = pacientes_model.get_all_pacientes(stream=True, after=after, limit=limit)
         
         if result['success']:
-            return jsonify({
+            return stream_json_response({
                 'success': True,
                 'node': result['node'],
-                'pacientes': result['pacientes'],
-                'total': result['total']
-            })
+                'version': version
+            }, 'pacientes', result['pacientes'], result['page'])
         else:
             return jsonify({
                 'success': False,
@@ -99,6 +284,31 @@ def api_add_paciente():
         print(f"❌ ERROR API crear paciente: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/pacientes/batch', methods=['POST', 'PUT', 'DELETE'])
+def api_batch_pacientes():
+    """API para crear (POST), actualizar (PUT) o eliminar (DELETE) varios pacientes en un solo lote
+    
+    Cuerpo: {"pacientes": [...]}. Responde un resultado por fila en 'results'.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        pacientes = data.get('pacientes')
+        print(f"📦 DEBUG API: Lote {request.method} de {len(pacientes) if isinstance(pacientes, list) else 0} pacientes")
+        
+        if request.method == 'POST':
+            result = pacientes_model.create_pacientes_batch(pacientes)
+        elif request.method == 'PUT':
+            result = pacientes_model.update_pacientes_batch(pacientes)
+        else:
+            result = pacientes_model.delete_pacientes_batch(pacientes)
+        
+        print(f"📦 DEBUG API: Resultado lote: {result.get('message') or result.get('error')}")
+        return jsonify(result)
+            
+    except Exception as e:
+        print(f"❌ ERROR API lote de pacientes: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/pacientes/<int:id_hospital>/<int:id_paciente>', methods=['PUT'])
 def api_update_paciente(id_hospital, id_paciente):
     """API para actualizar un paciente usando stored procedure"""
@@ -139,59 +349,66 @@ def api_delete_paciente(id_hospital, id_paciente):
         print(f"❌ ERROR API eliminar paciente: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/pacientes/search')
-def api_search_pacientes():
-    """API para buscar pacientes (filtrado por hospital local)"""
+def search_pacientes_result(query):
+    """Búsqueda de pacientes (filtrado por hospital local); (respuesta, estado), también para asgi.py"""
     try:
-        query = request.args.get('q', '')
         if not query:
-            return jsonify({'success': False, 'error': 'Parámetro de búsqueda requerido'})
+            return {'success': False, 'error': 'Parámetro de búsqueda requerido'}, 200
         
         print(f"🔍 DEBUG API: Buscando pacientes con término: '{query}'")
         result = pacientes_model.search_pacientes(query)
         print(f"🔍 DEBUG API: Resultado búsqueda: {result.get('total', 0)} pacientes encontrados")
         
-        return jsonify(result)
+        return result, 200
             
     except Exception as e:
         print(f"❌ ERROR API buscar pacientes: {e}")
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'node': 'unknown'
-        })
+        }, 200
 
-@app.route('/api/pacientes/<int:id_hospital>/<int:id_paciente>', methods=['GET'])
-def api_get_paciente(id_hospital, id_paciente):
-    """API para obtener un paciente específico por ID"""
+@app.route('/api/pacientes/search')
+def api_search_pacientes():
+    """API para buscar pacientes (filtrado por hospital local)"""
+    return json_result(*search_pacientes_result(request.args.get('q', '')))
+
+def get_paciente_result(id_hospital, id_paciente):
+    """Un paciente por ID; (respuesta, estado), también para asgi.py"""
     try:
         print(f"🔍 DEBUG API: Obteniendo paciente H={id_hospital}, P={id_paciente}")
         
         paciente = pacientes_model.get_paciente_by_id(id_hospital, id_paciente)
         
         if paciente:
-            return jsonify({
+            return {
                 'success': True,
                 'paciente': paciente
-            })
+            }, 200
         else:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'Paciente no encontrado'
-            })
+            }, 200
             
     except Exception as e:
         print(f"❌ ERROR API obtener paciente: {e}")
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        })
+        }, 200
+
+@app.route('/api/pacientes/<int:id_hospital>/<int:id_paciente>', methods=['GET'])
+def api_get_paciente(id_hospital, id_paciente):
+    """API para obtener un paciente específico por ID"""
+    return json_result(*get_paciente_result(id_hospital, id_paciente))
 
 @app.route('/citas')
 def citas():
     """Módulo de atención médica y citas - Carga desde Vista_Atencion_Medica"""
     try:
-        result = atencion_medica_model.get_all_atenciones()
+        result = atencion_medica_model.get_all_atenciones(limit=FIRST_PAGE_SIZE)
         
         return render_template('citas.html', 
                              atenciones=result['atenciones'] if result['success'] else [],
@@ -206,15 +423,20 @@ def citas():
 def api_atenciones():
     """API para obtener atenciones médicas en formato JSON"""
     try:
-        result = atencion_medica_model.get_all_atenciones()
+        try:
+            after, limit = parse_page_args(request.args)
+        except ValueError as e:
+            return page_args_error(e)
+        
+        version = change_version()
+        result = atencion_medica_model.get_all_atenciones(stream=True, after=after, limit=limit)
         
         if result['success']:
-            return jsonify({
+            return stream_json_response({
                 'success': True,
                 'node': result['node'],
-                'atenciones': result['atenciones'],
-                'total': result['total']
-            })
+                'version': version
+            }, 'atenciones', result['atenciones'], result['page'])
         else:
             return jsonify({
                 'success': False,
@@ -249,6 +471,42 @@ def api_add_atencion():
         print(f"❌ ERROR API crear atención médica: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/atenciones/import', methods=['POST'])
+def api_import_atenciones():
+    """API para importar atenciones desde un CSV o Excel (campo 'archivo', multipart)
+    
+    Volver a subir el mismo archivo después de un fallo reanuda desde el último lote confirmado.
+    La importación ocupa el worker hasta terminar: es para archivos chicos; las cargas
+    nocturnas se hacen con import_atenciones.py.
+    """
+    upload_path = None
+    try:
+        archivo = request.files.get('archivo')
+        if archivo is None or not archivo.filename:
+            return jsonify({'success': False, 'error': 'Se requiere el archivo a importar (campo archivo)'})
+        
+        # El archivo se guarda en disco por bloques y se procesa fila por fila desde ahí
+        extension = os.path.splitext(archivo.filename)[1].lower()
+        with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as handle:
+            upload_path = handle.name
+            archivo.save(handle)
+        
+        chunk_size = request.form.get('chunk_size', type=int) or IMPORT_CHUNK_SIZE
+        print(f"📥 DEBUG API: Importando atenciones desde '{archivo.filename}'")
+        # Cada lote confirma por su cuenta: nada queda abierto en la unidad de la petición
+        with outside_unit_of_work():
+            result = atencion_medica_model.import_atenciones(upload_path, chunk_size=chunk_size)
+        print(f"📥 DEBUG API: Resultado importación: {result.get('inserted', 0)} insertadas, "
+              f"{result.get('rejected', 0)} rechazadas, {result.get('rows_per_second')} filas/s")
+        return jsonify(result)
+    
+    except Exception as e:
+        print(f"❌ ERROR API importar atenciones: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+    finally:
+        if upload_path:
+            os.remove(upload_path)
+
 @app.route('/api/atenciones/<int:id_hospital>/<int:id_atencion>', methods=['PUT'])
 def api_update_atencion(id_hospital, id_atencion):
     """API para actualizar una atención médica"""
@@ -281,29 +539,32 @@ def api_delete_atencion(id_hospital, id_atencion):
         print(f"❌ ERROR API eliminar atención médica: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/atenciones/search')
-def api_search_atenciones():
-    """API para buscar atenciones médicas"""
+def search_atenciones_result(query):
+    """Búsqueda de atenciones médicas; (respuesta, estado), también para asgi.py"""
     try:
-        query = request.args.get('q', '')
         if not query:
-            return jsonify({'success': False, 'error': 'Parámetro de búsqueda requerido'})
+            return {'success': False, 'error': 'Parámetro de búsqueda requerido'}, 200
         
         result = atencion_medica_model.search_atenciones(query)
         
-        return jsonify(result)
+        return result, 200
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'node': 'unknown'
-        })
+        }, 200
+
+@app.route('/api/atenciones/search')
+def api_search_atenciones():
+    """API para buscar atenciones médicas"""
+    return json_result(*search_atenciones_result(request.args.get('q', '')))
 
 @app.route('/personal')
 def personal():
     """Módulo de gestión de personal médico - Carga desde Vista_INF_Personal"""
     try:
-        result = personal_medico_model.get_all_personal_medico()
+        result = personal_medico_model.get_all_personal_medico(limit=FIRST_PAGE_SIZE)
         
         return render_template('personal.html', 
                              personal_medico=result['personal_medico'] if result['success'] else [],
@@ -318,10 +579,19 @@ def personal():
 def api_personal_medico():
     """API para obtener personal médico en formato JSON"""
     try:
-        result = personal_medico_model.get_all_personal_medico()
+        try:
+            after, limit = parse_page_args(request.args)
+        except ValueError as e:
+            return page_args_error(e)
+        
+        version = change_version()
+        result = personal_medico_model.get_all_personal_medico(stream=True, after=after, limit=limit)
         
         if result['success']:
-            return jsonify(result)
+            payload = {k: v for k, v in result.items() if k not in ('personal_medico', 'total', 'page')}
+            payload['version'] = version
+            return stream_json_response(payload, 'personal_medico', result['personal_medico'],
+                                        result['page'])
         else:
             return jsonify(result), 500
             
@@ -332,24 +602,27 @@ def api_personal_medico():
             'node': 'unknown'
         })
 
-@app.route('/api/personal-medico/search')
-def api_search_personal_medico():
-    """API para buscar personal médico"""
+def search_personal_medico_result(search_term):
+    """Búsqueda de personal médico; (respuesta, estado), también para asgi.py"""
     try:
-        search_term = request.args.get('q', '')
         result = personal_medico_model.search_personal_medico(search_term)
         
         if result['success']:
-            return jsonify(result)
+            return result, 200
         else:
-            return jsonify(result), 500
+            return result, 500
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'personal_medico': []
-        })
+        }, 200
+
+@app.route('/api/personal-medico/search')
+def api_search_personal_medico():
+    """API para buscar personal médico"""
+    return json_result(*search_personal_medico_result(request.args.get('q', '')))
 
 @app.route('/api/personal-medico/add', methods=['POST'])
 def api_add_personal_medico():
@@ -435,27 +708,24 @@ def api_delete_personal_medico(id_hospital, id_personal):
             'error': str(e)
         }), 500
 
-@app.route('/api/personal-medico-with-contrato', methods=['POST'])
-def api_create_personal_medico_with_contrato():
-    """API para crear personal médico + contrato integrado"""
+def create_personal_medico_with_contrato_result(data):
+    """Alta de personal médico + contrato a partir del JSON recibido; (respuesta, estado), también para asgi.py"""
     try:
-        data = request.get_json()
-        
         if not data:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'No se recibieron datos'
-            }), 400
+            }, 400
             
         personal_data = data.get('personal_data')
         salario = data.get('salario')
         fecha_contrato = data.get('fecha_contrato')
         
         if not personal_data or not salario:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'Faltan datos requeridos (personal_data y salario)'
-            }), 400
+            }, 400
         
         # Crear personal médico + contrato
         result = personal_medico_model.create_personal_medico_with_contrato(
@@ -463,15 +733,24 @@ def api_create_personal_medico_with_contrato():
         )
         
         if result['success']:
-            return jsonify(result)
+            return result, 200
         else:
-            return jsonify(result), 400
+            return result, 400
             
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
+
+@app.route('/api/personal-medico-with-contrato', methods=['POST'])
+def api_create_personal_medico_with_contrato():
+    """API para crear personal médico + contrato integrado"""
+    try:
+        data = request.get_json()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return json_result(*create_personal_medico_with_contrato_result(data))
 
 # ==================== RUTAS DE CONTRATOS ====================
 
@@ -480,7 +759,7 @@ def contratos():
     """Módulo de contratos - Carga desde tabla Contratos"""
     try:
         contratos_manager = ContratosManager()
-        contratos = contratos_manager.get_all_contratos()
+        contratos = contratos_manager.get_all_contratos(limit=FIRST_PAGE_SIZE)
         current_node = "Quito" if len(contratos) > 0 and contratos[0].get('ID_Hospital') == 1 else "Guayaquil"
         
         return render_template('contratos.html', 
@@ -495,13 +774,20 @@ def contratos():
 def api_contratos():
     """API para obtener todos los contratos"""
     try:
+        try:
+            after, limit = parse_page_args(request.args)
+            page = KeysetPage(ContratosManager.PAGE_KEY, after, limit)
+        except ValueError as e:
+            return page_args_error(e)
+        
         contratos_manager = ContratosManager()
-        contratos = contratos_manager.get_all_contratos()
+        contratos = contratos_manager.get_all_contratos(after=after, limit=limit)
         
         return jsonify({
             'success': True,
             'contratos': contratos,
-            'total': len(contratos)
+            'total': len(contratos),
+            'next_after': page.next_after(contratos[-1] if contratos else None, len(contratos))
         })
         
     except Exception as e:
@@ -511,26 +797,83 @@ def api_contratos():
             'contratos': []
         }), 500
 
-@app.route('/api/contratos/search')
-def api_search_contratos():
-    """API para buscar contratos"""
+def search_contratos_result(search_term):
+    """Búsqueda de contratos; (respuesta, estado), también para asgi.py"""
     try:
-        search_term = request.args.get('q', '')
         contratos_manager = ContratosManager()
         contratos = contratos_manager.search_contratos(search_term)
         
-        return jsonify({
+        return {
             'success': True,
             'contratos': contratos,
             'total': len(contratos)
-        })
+        }, 200
         
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'contratos': []
-        }), 500
+        }, 500
+
+@app.route('/api/contratos/search')
+def api_search_contratos():
+    """API para buscar contratos"""
+    return json_result(*search_contratos_result(request.args.get('q', '')))
+
+# ================== API CAMBIOS (DELTA) ==================
+
+# Entidad -> (método de lista que acepta keys, clave de las filas en la respuesta)
+CHANGE_SOURCES = {
+    'pacientes': (pacientes_model.get_all_pacientes, 'pacientes'),
+    'atenciones': (atencion_medica_model.get_all_atenciones, 'atenciones'),
+    'experiencias': (experiencia_model.get_all_experiencias, 'experiencias'),
+    'personal-medico': (personal_medico_model.get_all_personal_medico, 'personal_medico'),
+}
+
+@app.route('/api/<entity>/changes')
+def api_changes(entity):
+    """Filas que cambiaron desde la versión 'since' (la que devolvió la lista o el delta anterior)
+
+    'changed' son las claves (o prefijos de clave) tocadas y key las filas actuales que
+    coinciden: una clave sin filas fue eliminada. Con reset=True el cliente recarga la lista.
+    """
+    source = CHANGE_SOURCES.get(entity)
+    if source is None:
+        return jsonify({'success': False, 'error': f'Entidad sin registro de cambios: {entity}'}), 404
+    get_rows, key = source
+    
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'success': False, 'error': "El parámetro 'since' debe ser una versión (entero)"}), 400
+    
+    try:
+        delta = change_log.changes_since(entity, since)
+        if delta['reset'] or not delta['keys']:
+            return jsonify({'success': True, 'version': delta['version'], 'reset': delta['reset'],
+                            'changed': [], key: []})
+        
+        result = get_rows(compact=True, keys=delta['keys'])
+        if not result['success']:
+            return jsonify({'success': False, 'error': result['error']}), 500
+        return jsonify({
+            'success': True,
+            'version': delta['version'],
+            'reset': False,
+            'changed': delta['keys'],
+            key: result[key].to_dicts(),
+            'node': result['node']
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/contratos/outbox')
+def api_contratos_outbox():
+    """Estado de la cola local de escrituras de contratos hacia Quito"""
+    try:
+        return jsonify({'success': True, 'enabled': CONTRATO_OUTBOX_ENABLED, **contrato_outbox.status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/contratos/add', methods=['POST'])
 def api_add_contrato():
@@ -574,7 +917,7 @@ def api_delete_contrato(id_hospital, id_personal):
 def experiencia():
     """Módulo de experiencia médica - Carga desde Vista_Experiencia"""
     try:
-        result = experiencia_model.get_all_experiencias()
+        result = experiencia_model.get_all_experiencias(limit=FIRST_PAGE_SIZE)
         
         return render_template('experiencia.html', 
                              experiencias=result['experiencias'] if result['success'] else [],
@@ -589,15 +932,20 @@ def experiencia():
 def api_experiencias():
     """API para obtener experiencias en formato JSON"""
     try:
-        result = experiencia_model.get_all_experiencias()
+        try:
+            after, limit = parse_page_args(request.args)
+        except ValueError as e:
+            return page_args_error(e)
+        
+        version = change_version()
+        result = experiencia_model.get_all_experiencias(stream=True, after=after, limit=limit)
         
         if result['success']:
-            return jsonify({
+            return stream_json_response({
                 'success': True,
                 'node': result['node'],
-                'experiencias': result['experiencias'],
-                'total': result['total']
-            })
+                'version': version
+            }, 'experiencias', result['experiencias'], result['page'])
         else:
             return jsonify({
                 'success': False,
@@ -676,23 +1024,26 @@ def api_delete_experiencia(id_hospital, id_personal, cargo):
         print(f"❌ ERROR API eliminar experiencia: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/experiencias/search')
-def api_search_experiencias():
-    """API para buscar experiencias"""
+def search_experiencias_result(query):
+    """Búsqueda de experiencias; (respuesta, estado), también para asgi.py"""
     try:
-        query = request.args.get('q', '')
         if not query:
-            return jsonify({'success': False, 'error': 'Parámetro de búsqueda requerido'})
+            return {'success': False, 'error': 'Parámetro de búsqueda requerido'}, 200
         
         result = experiencia_model.search_experiencias(query)
         
-        return jsonify(result)
+        return result, 200
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e),
             'node': 'unknown'
-        })
+        }, 200
+
+@app.route('/api/experiencias/search')
+def api_search_experiencias():
+    """API para buscar experiencias"""
+    return json_result(*search_experiencias_result(request.args.get('q', '')))
 
 @app.route('/especialidad')
 def especialidad():
@@ -941,63 +1292,89 @@ def api_delete_tipo_atencion(id_tipo):
             'error': str(e)
         }), 500
 
+# ================== API EXPORTACIÓN ==================
+
+@app.route('/api/<entity>/export', methods=['GET'])
+def api_export(entity):
+    """API para exportar una entidad completa en CSV o JSONL (streaming, memoria acotada)
+    
+    Parámetros: format=csv|jsonl, ID_Hospital (opcional, por defecto ambos hospitales
+    leídos en paralelo desde sus nodos), desde/hasta (AAAA-MM-DD) en entidades con fecha.
+    """
+    try:
+        export_format, filters = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Parámetros de exportación inválidos: {e}'}), 400
+    
+    result = export_model.open_export(entity, filters)
+    if not result['success']:
+        return jsonify({'success': False, 'error': result['error']}), result['status']
+    
+    export = result['export']
+    print(f"📤 DEBUG API: Exportando {entity} ({export_format}) desde {', '.join(result['nodes'])}")
+    
+    def generate():
+        try:
+            if export_format == 'csv':
+                yield from iter_csv(export.columns, export.rows)
+            else:
+                yield from buffer_fragments(iter_jsonl(export.columns, export.rows))
+        except Exception as e:
+            # Los encabezados ya se enviaron: solo queda cortar la respuesta
+            print(f"❌ ERROR API exportar {entity}: {e}")
+            raise
+        finally:
+            # Respaldo: el cierre principal es call_on_close
+            export.close()
+    
+    response = app.response_class(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={entity}.{export_format}'}
+    )
+    # El servidor cierra la respuesta aunque el generador no arranque (HEAD, desconexión temprana)
+    response.call_on_close(export.close)
+    return response
+
 # ================== API ESTADÍSTICAS HOSPITAL ==================
 
+def hospital_stats_result():
+    """Estadísticas del hospital; (respuesta, estado), también para asgi.py"""
+    result = hospital_stats_model.get_hospital_stats()
+    return result, 200 if result['success'] else 500
+
 @app.route('/api/hospital/stats', methods=['GET'])
 def api_hospital_stats():
-    """API para obtener estadísticas del hospital (datos reales) - Usando SELECT COUNT directo"""
-    try:
-        stats = {}
-        
-        print("📊 DEBUG: Obteniendo estadísticas con SELECT COUNT...")
-        
-        # Función helper para obtener conteos
-        def get_count(query):
-            try:
-                result = pacientes_model.execute_query(query)
-                if result and isinstance(result, list) and len(result) > 0:
-                    # El resultado de COUNT(*) viene en la primera columna del primer registro
-                    count_value = list(result[0].values())[0]
-                    return int(count_value) if count_value is not None else 0
-                return 0
-            except Exception as e:
-                print(f"❌ Error en consulta COUNT: {e}")
-                return 0
-        
-        # 1. Totales generales
-        stats['total_pacientes'] = get_count("SELECT COUNT(*) FROM Vista_Paciente")
-        stats['total_citas'] = get_count("SELECT COUNT(*) FROM Vista_Atencion_Medica")
-        stats['total_personal'] = get_count("SELECT COUNT(*) FROM Vista_INF_Personal")
-        stats['total_especialidades'] = get_count("SELECT COUNT(*) FROM Especialidad")
-        
-        # 2. Quito (ID_Hospital = 1)
-        stats['quito'] = {
-            'pacientes': get_count("SELECT COUNT(*) FROM Vista_Paciente WHERE ID_Hospital = 1"),
-            'citas': get_count("SELECT COUNT(*) FROM Vista_Atencion_Medica WHERE ID_Hospital = 1"),
-            'personal_medico': get_count("SELECT COUNT(*) FROM Vista_INF_Personal WHERE ID_Hospital = 1")
-        }
-        
-        # 3. Guayaquil (ID_Hospital = 2)
-        stats['guayaquil'] = {
-            'pacientes': get_count("SELECT COUNT(*) FROM Vista_Paciente WHERE ID_Hospital = 2"),
-            'citas': get_count("SELECT COUNT(*) FROM Vista_Atencion_Medica WHERE ID_Hospital = 2"),
-            'personal_medico': get_count("SELECT COUNT(*) FROM Vista_INF_Personal WHERE ID_Hospital = 2")
-        }
-        
-        print(f"📊 DEBUG: Estadísticas calculadas: {stats}")
-        
-        return jsonify({
-            'success': True,
-            'stats': stats
-        })
-        
+    """API para obtener estadísticas del hospital (conteos agrupados por nodo, cacheados en memoria)"""
+    return json_result(*hospital_stats_result())
+
+# ================== API DIAGNÓSTICO ==================
+
+@app.route('/api/db/statements', methods=['GET'])
+def api_db_statements():
+    """Tiempos de las consultas con nombre (STATEMENTS) de este proceso, las más costosas primero"""
+    return jsonify({'success': True, 'statements': statement_registry.stats(), 'pid': os.getpid()})
+
+@app.route('/api/db/sagas', methods=['GET'])
+def api_db_sagas():
+    """Sagas por estado y las que siguen en curso o no se pudieron compensar"""
+    try:
+        return jsonify({'success': True, **saga_log.status()})
     except Exception as e:
-        print(f"❌ Error al obtener estadísticas del hospital: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Histogramas de latencia por consulta, nodo y fase, consultas lentas y estado del pool
+
+    Formato de texto de Prometheus; cada proceso worker expone sus propias métricas,
+    identificadas por la etiqueta pid.
+    """
+    return app.response_class(query_metrics.render(all_pool_stats()),
+                              mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Servidor de desarrollo; en producción usar gunicorn -c gunicorn.conf.py
+    get_app().run(debug=os.getenv('FLASK_DEBUG', 'True').lower() in ('1', 'true', 'yes'),
+                     host='0.0.0.0', port=5000)
 
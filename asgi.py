@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+⚡ MODO ASGI - Sistema Hospitalario
+Sirve la misma aplicación con un event loop: las rutas que esperan al linked server
+(búsquedas, estadísticas, alta de personal con contrato) son corrutinas y la espera
+ocurre en un executor acotado (DB_ASYNC_WORKERS), sin ocupar un worker por petición.
+Sus cuerpos son las mismas funciones *_result que usan las vistas de app.py.
+El resto de las rutas se atiende con la aplicación Flask a través de WsgiToAsgi.
+
+Uso (requiere asgiref y uvicorn):
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (get_app, search_pacientes_result, search_atenciones_result, search_experiencias_result,
+                 search_personal_medico_result, search_contratos_result, get_paciente_result,
+                 create_personal_medico_with_contrato_result, hospital_stats_result)
+from models.aio import get_async_executor, run_blocking
+
+app = get_app()
+
+# Rutas atendidas de forma asíncrona: (método, patrón) -> corrutina
+_routes = []
+
+
+def route(method, pattern):
+    """Registra una ruta async; los grupos con nombre del patrón llegan como argumentos"""
+    def decorator(handler):
+        _routes.append((method, re.compile(f'^{pattern}$'), handler))
+        return handler
+    return decorator
+
+
+class AsyncRequest:
+    """Datos mínimos de la petición para las rutas async"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {key: values[0] for key, values in
+                     parse_qs(scope.get('query_string', b'').decode('utf-8')).items()}
+        self.body = body
+
+    def get_json(self):
+        return json.loads(self.body) if self.body else None
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, payload, status=200):
+    # Mismo serializador que jsonify (fechas, decimales) para respuestas idénticas a Flask
+    body = app.json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# ================== RUTAS ASYNC ==================
+# Los cuerpos son los mismos que usan las vistas Flask (funciones *_result de app.py);
+# aquí solo se cambia la espera: corren en el executor y el event loop queda libre.
+
+@route('GET', r'/api/pacientes/search')
+async def search_pacientes(request):
+    return await run_blocking(search_pacientes_result, request.args.get('q', ''))
+
+
+@route('GET', r'/api/atenciones/search')
+async def search_atenciones(request):
+    return await run_blocking(search_atenciones_result, request.args.get('q', ''))
+
+
+@route('GET', r'/api/experiencias/search')
+async def search_experiencias(request):
+    return await run_blocking(search_experiencias_result, request.args.get('q', ''))
+
+
+@route('GET', r'/api/personal-medico/search')
+async def search_personal_medico(request):
+    return await run_blocking(search_personal_medico_result, request.args.get('q', ''))
+
+
+@route('GET', r'/api/contratos/search')
+async def search_contratos(request):
+    return await run_blocking(search_contratos_result, request.args.get('q', ''))
+
+
+@route('GET', r'/api/pacientes/(?P<id_hospital>\d+)/(?P<id_paciente>\d+)')
+async def get_paciente(request, id_hospital, id_paciente):
+    return await run_blocking(get_paciente_result, int(id_hospital), int(id_paciente))
+
+
+@route('POST', r'/api/personal-medico-with-contrato')
+async def create_personal_medico_with_contrato(request):
+    return await run_blocking(create_personal_medico_with_contrato_result, request.get_json())
+
+
+@route('GET', r'/api/hospital/stats')
+async def hospital_stats(request):
+    return await run_blocking(hospital_stats_result)
+
+
+# ================== APLICACIÓN ASGI ==================
+
+_wsgi_application = WsgiToAsgi(app)
+
+
+async def _lifespan(receive, send):
+    """Arranque y cierre del servidor ASGI (get_app() ya inicializó el proceso)"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            get_async_executor().shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Despacha a una ruta async si coincide; si no, a la aplicación Flask"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http':
+        for method, pattern, handler in _routes:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                request = AsyncRequest(scope, await _read_body(receive))
+                try:
+                    payload, status = await handler(request, **match.groupdict())
+                except Exception as e:
+                    print(f"❌ ERROR ASGI {request.method} {request.path}: {e}")
+                    payload, status = {'success': False, 'error': str(e)}, 500
+                await _send_json(send, payload, status)
+                return
+
+    await _wsgi_application(scope, receive, send)
@@ -21,13 +21,8 @@ def test_contrato_insertion():
         print(f"   Nodo detectado: {current_node}")
         
         if current_node:
-            connection = contratos_manager.get_connection()
-            if connection:
+            with contratos_manager.connection(current_node):
                 print("   ✅ Conexión establecida correctamente")
-                connection.close()
-            else:
-                print("   ❌ Error al establecer conexión")
-                return
         else:
             print("   ❌ No se pudo detectar ningún nodo")
             return
@@ -25,13 +25,8 @@ def test_personal_medico_with_contratos():
         print(f"   Nodo detectado: {current_node}")
         
         if current_node:
-            connection = personal_model.get_connection()
-            if connection:
+            with personal_model.connection(current_node):
                 print("   ✅ Conexión establecida correctamente")
-                connection.close()
-            else:
-                print("   ❌ Error al establecer conexión")
-                return
         else:
             print("   ❌ No se pudo detectar ningún nodo")
             return
@@ -117,19 +117,15 @@ def debug_personal_medico_completo():
 def delete_personal_medico_sp(personal_manager, hospital_id, personal_id):
     """Eliminar personal médico usando SP_Delete_PersonalMedico"""
     try:
-        connection = personal_manager.get_connection()
-        if not connection:
-            return False
+        with personal_manager.connection() as connection:
+            cursor = connection.cursor()
             
-        cursor = connection.cursor()
-        
-        # Ejecutar SP de eliminación con transacción distribuida
-        cursor.execute("{CALL SP_Delete_PersonalMedico (?, ?)}", 
-                     (hospital_id, personal_id))
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
+            # Ejecutar SP de eliminación con transacción distribuida
+            cursor.execute("{CALL SP_Delete_PersonalMedico (?, ?)}", 
+                         (hospital_id, personal_id))
+            
+            connection.commit()
+            cursor.close()
         
         return True
         
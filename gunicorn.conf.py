@@ -0,0 +1,55 @@
+"""
+🏭 CONFIGURACIÓN DE PRODUCCIÓN (gunicorn) - Sistema Hospitalario
+Varios procesos worker con hilos; el código se carga una vez en el maestro (preload_app)
+y cada worker abre su pool de conexiones, su chequeo de nodo y sus catálogos después
+del fork (post_worker_init). Los workers no comparten memoria: los IDs duplicados se
+reintentan y las cachés e índices siguen el registro de cambios de outbox/.
+
+Uso:
+    gunicorn -c gunicorn.conf.py wsgi:application
+Recarga sin cortar peticiones:
+    kill -HUP <pid maestro>     # workers nuevos (re-ejecutan warm_up), los viejos terminan lo que tienen en curso
+"""
+
+import multiprocessing
+import os
+import time
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# Hilos por worker: las peticiones esperan sobre todo a SQL Server
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# Peticiones lentas (exportaciones, importaciones) antes de reiniciar el worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# Segundos que un worker viejo tiene para terminar sus peticiones en una recarga
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# Reinicio periódico de workers (0 = nunca); el jitter evita que reinicien todos a la vez
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+
+_started_at = time.monotonic()
+
+
+def when_ready(server):
+    server.log.info(f"⏱️ Maestro listo en {(time.monotonic() - _started_at) * 1000:.0f} ms "
+                    f"({workers} workers x {threads} hilos en {bind})")
+
+
+def post_worker_init(worker):
+    # Después del fork: conexiones, hilo de salud del nodo e índices propios del worker
+    from app import warm_up
+    elapsed = warm_up()
+    worker.log.info(f"⏱️ Worker {worker.pid} inicializado en {elapsed * 1000:.0f} ms")
+
+
+def worker_exit(server, worker):
+    from models.pool import close_all_pools
+    close_all_pools()
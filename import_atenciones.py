@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+📥 IMPORTACIÓN MASIVA DE ATENCIONES - Sistema Hospitalario
+Carga un CSV o Excel (.xlsx) de atenciones en Vista_Atencion_Medica por lotes.
+Es la vía para las cargas nocturnas: POST /api/atenciones/import ocupa un worker
+mientras dura y está pensada para archivos chicos.
+
+Uso:
+    python import_atenciones.py archivo.csv [--nodo quito|guayaquil] [--lote 500]
+
+Si la importación se interrumpe, ejecutar el mismo comando con el mismo archivo
+la reanuda desde el último lote confirmado.
+
+Cada atención usa un ID del rango del nodo (ID_RANGES de AtencionMedicaModel): un
+archivo con más filas válidas que IDs libres se detiene con "Rango de IDs de atención
+agotado" y se continúa con el mismo comando después de ampliar el rango.
+"""
+
+import argparse
+import json
+import sys
+
+from models.atencion_medica import AtencionMedicaModel
+from models.atencion_import import IMPORT_CHUNK_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa atenciones médicas desde CSV o Excel')
+    parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx')
+    parser.add_argument('--nodo', choices=['quito', 'guayaquil'],
+                        help='Nodo destino (por defecto el detectado)')
+    parser.add_argument('--lote', type=int, default=IMPORT_CHUNK_SIZE,
+                        help=f'Filas por lote de INSERT (por defecto {IMPORT_CHUNK_SIZE})')
+    args = parser.parse_args()
+
+    print(f"📥 Importando atenciones desde {args.archivo}...")
+    result = AtencionMedicaModel().import_atenciones(args.archivo, node=args.nodo, chunk_size=args.lote)
+
+    if result['success']:
+        print(f"✅ Importación completa: {result['inserted']} insertadas, {result['rejected']} rechazadas "
+              f"({result['rows_per_second']} filas/s)")
+    else:
+        print(f"❌ {result['error']}")
+
+    for error in result.get('errors', []):
+        print(f"   ⚠️ Fila {error['fila']}: {error['error']}")
+    print(json.dumps({key: value for key, value in result.items() if key != 'errors'}, indent=2))
+
+    return 0 if result['success'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
 # Models package for database operations
 
+from .base import DatabaseConnection
 from .contratos import ContratosManager
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Hilos que ejecutan pyodbc para el modo ASGI; las peticiones que esperan turno son
+# corrutinas (baratas), no hilos bloqueados
+DB_ASYNC_WORKERS = int(os.getenv('DB_ASYNC_WORKERS', '20'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_executor_after_fork():
+    """Los hilos del executor no sobreviven al fork: el hijo crea el suyo en el primer uso"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def get_async_executor():
+    """Obtiene (o crea) el executor acotado donde corren las llamadas async a la base"""
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_ASYNC_WORKERS, thread_name_prefix='db-async')
+        return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta una función bloqueante (pyodbc) en el executor sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), functools.partial(func, *args, **kwargs))
@@ -0,0 +1,383 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+
+from .stats import invalidate_stats
+from .changes import record_change
+from .tipo_atencion import TipoAtencionModel
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Filas por lote de INSERT (cada lote es una transacción y un punto de reanudación)
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+# Carpeta donde se guarda el progreso de cada archivo importado
+IMPORT_CHECKPOINT_DIR = os.getenv('IMPORT_CHECKPOINT_DIR', 'import_checkpoints')
+# Errores de validación que se guardan en el reporte (el resto solo se cuentan)
+MAX_REPORTED_ERRORS = 100
+
+# Columnas esperadas en el archivo (ID_Hospital e ID_Atención los asigna el nodo)
+IMPORT_COLUMNS = ('ID_Personal', 'ID_Paciente', 'ID_Tipo', 'Fecha', 'Diagnostico', 'Descripción', 'Tratamiento')
+COLUMN_ALIASES = {'Descripcion': 'Descripción', 'Diagnóstico': 'Diagnostico'}
+TEXT_LIMITS = {'Diagnostico': 255, 'Descripción': 255, 'Tratamiento': 255}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
+
+INSERT_ATENCION = """
+    INSERT INTO Vista_Atencion_Medica (
+        ID_Hospital, ID_Atención, ID_Personal, ID_Paciente, ID_Tipo,
+        Fecha, Diagnostico, Descripción, Tratamiento
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class IdRangeExhaustedError(Exception):
+    """El rango de IDs de atención del nodo no tiene lugar para la siguiente fila válida"""
+
+
+def file_digest(path):
+    """SHA-256 del archivo leído por bloques; identifica la importación para reanudarla"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_csv_rows(path):
+    """Filas de un CSV como dicts, leídas de a una (detecta ',', ';' o tabulador)"""
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.DictReader(handle, dialect=dialect)
+
+
+def iter_excel_rows(path):
+    """Filas de la primera hoja de un .xlsx como dicts (openpyxl en modo solo lectura)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para importar Excel instale openpyxl (pip install openpyxl)")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        for values in rows:
+            if any(value is not None for value in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_import_rows(path):
+    """Filas del archivo según su extensión (.csv/.txt o .xlsx/.xlsm)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.csv', '.txt'):
+        return iter_csv_rows(path)
+    if extension in ('.xlsx', '.xlsm'):
+        return iter_excel_rows(path)
+    raise ValueError(f"Formato no soportado: {extension or 'sin extensión'} (use CSV o Excel .xlsx)")
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Fecha inválida: {text}")
+
+
+def parse_int(value, column):
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{column} debe ser un número entero")
+    if not number.is_integer():
+        raise ValueError(f"{column} debe ser un número entero")
+    return int(number)
+
+
+class ImportCheckpoint:
+    """Progreso de una importación guardado en disco (JSON, escritura atómica)"""
+
+    def __init__(self, job_id, directory=IMPORT_CHECKPOINT_DIR):
+        self.path = os.path.join(directory, f"{job_id}.json")
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {
+                'rows_done': 0,
+                'inserted': 0,
+                'rejected': 0,
+                'errors': [],
+                'pending': None,
+                'finished': False
+            }
+
+    def save(self, state):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(state, handle)
+        os.replace(temp_path, self.path)
+
+
+class AtencionImport:
+    """Importa un archivo de atenciones al hospital del nodo por lotes con fast_executemany
+
+    Cada lote se inserta en su propia transacción. Antes de insertar, el checkpoint guarda
+    los IDs del lote como 'pending'; al reanudar se comprueba en la base si ese lote llegó
+    a confirmarse, así un corte entre el COMMIT y el guardado no duplica filas.
+
+    Cada fila necesita un ID del rango del nodo (ID_RANGES de AtencionMedicaModel), así
+    que ningún lote supera los IDs libres: cuando el rango se agota la importación se
+    detiene con lo insertado hasta ahí confirmado y se reanuda al ampliar el rango.
+    """
+
+    def __init__(self, model, path, node, chunk_size=IMPORT_CHUNK_SIZE, progress=print):
+        self.model = model
+        self.path = path
+        self.node = node
+        self.chunk_size = max(1, chunk_size)
+        self.progress = progress or (lambda message: None)
+        self.hospital_id = model.get_hospital_id_by_node(node)
+        self.job_id = file_digest(path)
+        self.checkpoint = ImportCheckpoint(self.job_id)
+
+    def _load_lookups(self):
+        """IDs válidos para las claves foráneas, leídos una vez por importación"""
+        pacientes = self.model.execute_query(
+            "SELECT ID_Paciente FROM Vista_Paciente WHERE ID_Hospital = ?",
+            (self.hospital_id,), node=self.node, compact=True
+        )
+        personal = self.model.execute_query(
+            "SELECT ID_Personal FROM Vista_INF_Personal WHERE ID_Hospital = ?",
+            (self.hospital_id,), node=self.node, compact=True
+        )
+        # Tipo_Atención sale de la caché del catálogo
+        tipos = TipoAtencionModel().get_all_tipos_atencion(self.node)
+        if pacientes is None or personal is None or not tipos['success']:
+            return None
+        return {
+            'ID_Paciente': {row[0] for row in pacientes.rows},
+            'ID_Personal': {row[0] for row in personal.rows},
+            'ID_Tipo': {tipo['ID_Tipo'] for tipo in tipos['tipos_atencion']}
+        }
+
+    def _validate(self, raw, lookups):
+        """Fila del archivo -> tupla para el INSERT (sin ID_Hospital ni ID_Atención)"""
+        row = {COLUMN_ALIASES.get(key.strip(), key.strip()): value
+               for key, value in raw.items() if key}
+        values = []
+        for column in IMPORT_COLUMNS:
+            value = row.get(column)
+            if value is None or str(value).strip() == '':
+                raise ValueError(f"Campo requerido faltante: {column}")
+
+            if column in lookups:
+                value = parse_int(value, column)
+                if value not in lookups[column]:
+                    raise ValueError(f"{column} {value} no existe")
+            elif column == 'Fecha':
+                value = parse_date(value)
+            else:
+                value = str(value).strip()
+                if len(value) > TEXT_LIMITS[column]:
+                    raise ValueError(f"{column} supera {TEXT_LIMITS[column]} caracteres")
+            values.append(value)
+        return tuple(values)
+
+    def _resolve_pending(self, state):
+        """Decide si el último lote en curso antes de un corte quedó confirmado en la base"""
+        pending = state.get('pending')
+        if not pending:
+            return True
+
+        ids = pending['ids']
+        results = self.model.execute_query(
+            """
+            SELECT ID_Atención FROM Vista_Atencion_Medica
+            WHERE ID_Hospital = ? AND ID_Atención BETWEEN ? AND ?
+            """,
+            (self.hospital_id, min(ids), max(ids)), node=self.node, compact=True
+        )
+        if results is None:
+            return False
+
+        existing = {row[0] for row in results.rows}
+        if all(id_value in existing for id_value in ids):
+            self._commit_window(state, pending, len(ids))
+            self.progress(f"♻️ Lote pendiente ya confirmado: se continúa desde la fila {state['rows_done']}")
+        state['pending'] = None
+        self.checkpoint.save(state)
+        return True
+
+    def _commit_window(self, state, window, inserted):
+        """Suma al estado confirmado las filas leídas desde el último lote"""
+        state['rows_done'] = window['rows_done']
+        state['inserted'] += inserted
+        state['rejected'] += window['rejected']
+        room = MAX_REPORTED_ERRORS - len(state['errors'])
+        state['errors'].extend(window['errors'][:max(0, room)])
+
+    def _capacity(self):
+        """IDs de atención libres en el rango del nodo (tope del próximo lote)"""
+        available = self.model.available_ids(self.node)
+        if available is None:
+            raise RuntimeError(f"No se pudieron leer los IDs libres del rango del nodo {self.node}")
+        return available
+
+    def _range_exhausted_error(self, state):
+        range_config = self.model.ID_RANGES.get(self.node, {})
+        return (f"Rango de IDs de atención agotado en el nodo {self.node} "
+                f"({range_config.get('min', '?')} - {range_config.get('max', '?')}): "
+                f"se importaron {state['inserted']} filas hasta la fila {state['rows_done'] + 1} del archivo. "
+                f"Amplíe el rango o libere IDs y vuelva a ejecutar la importación para continuar.")
+
+    def _insert_chunk(self, chunk, state, window):
+        ids = self.model.reserve_ids(self.node, len(chunk))
+        if ids is None:
+            raise RuntimeError(f"No hay {len(chunk)} IDs de atención disponibles en el rango del nodo {self.node}")
+
+        params = [(self.hospital_id, id_atencion, *values) for id_atencion, values in zip(ids, chunk)]
+        state['pending'] = dict(window, ids=ids)
+        self.checkpoint.save(state)
+
+        try:
+            # Conexión propia: cada lote se confirma ya (el checkpoint depende de ello)
+            with self.model.connection(self.node, shared=False) as connection:
+                cursor = connection.cursor()
+                try:
+                    # Requerido para modificar una vista particionada distribuida
+                    cursor.execute("SET XACT_ABORT ON")
+                    cursor.fast_executemany = True
+                    self.model.execute_cursor(cursor, INSERT_ATENCION, params, node=self.node,
+                                              statement='atenciones_import_chunk', many=True)
+                    connection.commit()
+                finally:
+                    cursor.close()
+        except Exception:
+            # 'pending' queda en el checkpoint: al reanudar se verifica si el COMMIT llegó
+            self.model.release_ids(ids, resync=True)
+            raise
+
+        state['pending'] = None
+        self._commit_window(state, window, len(chunk))
+        self.checkpoint.save(state)
+
+    def _report(self, state, started, processed, success=True, error=None):
+        elapsed = time.monotonic() - started
+        report = {
+            'success': success,
+            'job_id': self.job_id,
+            'node': self.node,
+            'rows_done': state['rows_done'],
+            'inserted': state['inserted'],
+            'rejected': state['rejected'],
+            'errors': state['errors'],
+            'finished': state['finished'],
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(processed / elapsed, 1) if elapsed > 0 else None
+        }
+        if error:
+            report['error'] = error
+        return report
+
+    def run(self):
+        """Importa (o reanuda) el archivo; devuelve el reporte con filas por segundo"""
+        started = time.monotonic()
+        state = self.checkpoint.load()
+        processed = 0
+
+        if state['finished']:
+            return self._report(state, started, processed)
+        if not self._resolve_pending(state):
+            return self._report(state, started, processed, False,
+                                'No se pudo verificar el último lote pendiente; reintente más tarde')
+
+        lookups = self._load_lookups()
+        if lookups is None:
+            return self._report(state, started, processed, False,
+                                f'No se pudieron leer pacientes, personal o tipos del nodo {self.node}')
+
+        resume_from = state['rows_done']
+        if resume_from:
+            self.progress(f"♻️ Reanudando importación {self.job_id[:12]} desde la fila {resume_from}")
+
+        chunk = []
+        # Filas leídas desde el último lote confirmado (se confirman junto con él)
+        window = {'rows_done': resume_from, 'rejected': 0, 'errors': []}
+        try:
+            capacity = self._capacity()
+            for position, raw in enumerate(iter_import_rows(self.path), start=1):
+                if position <= resume_from:
+                    continue
+                processed += 1
+                try:
+                    values = self._validate(raw, lookups)
+                except ValueError as e:
+                    window['rejected'] += 1
+                    if len(window['errors']) < MAX_REPORTED_ERRORS:
+                        # Fila de datos 1 = línea 2 del archivo (la 1 es el encabezado)
+                        window['errors'].append({'fila': position + 1, 'error': str(e)})
+                else:
+                    if not capacity:
+                        # Sin ID para esta fila: el lote anterior ya se insertó al llenar el rango
+                        raise IdRangeExhaustedError()
+                    chunk.append(values)
+                window['rows_done'] = position
+
+                if chunk and len(chunk) >= min(self.chunk_size, capacity):
+                    self._insert_chunk(chunk, state, window)
+                    chunk = []
+                    window = {'rows_done': position, 'rejected': 0, 'errors': []}
+                    capacity = self._capacity()
+                    elapsed = time.monotonic() - started
+                    self.progress(f"📥 {state['inserted']} atenciones insertadas "
+                                  f"({processed / elapsed:.0f} filas/s)")
+
+            if chunk:
+                self._insert_chunk(chunk, state, window)
+            else:
+                self._commit_window(state, window, 0)
+            state['finished'] = True
+            self.checkpoint.save(state)
+            return self._report(state, started, processed)
+
+        except IdRangeExhaustedError:
+            # Las filas leídas hasta la anterior (solo rechazadas) se confirman; se reanuda desde aquí
+            self._commit_window(state, window, 0)
+            self.checkpoint.save(state)
+            error = self._range_exhausted_error(state)
+            print(f"⚠️ {error}")
+            report = self._report(state, started, processed, False, error)
+            report['range_exhausted'] = True
+            return report
+
+        except Exception as e:
+            print(f"❌ Error importando atenciones (fila {state['rows_done'] + 1} en adelante): {e}")
+            return self._report(state, started, processed, False,
+                                f'Importación interrumpida: {str(e)}. Vuelva a ejecutarla para reanudar.')
+        finally:
+            if state['inserted']:
+                invalidate_stats()
+                record_change('atenciones', committed=True)
@@ -1,8 +1,27 @@
 from .base import DatabaseConnection
+from .rows import ResultSet, format_date
+from .pagination import KeysetPage
+from .stats import invalidate_stats
+from .changes import record_change
+from .unit_of_work import after_commit
+from .id_allocator import IdAllocatorMixin
+from .atencion_import import AtencionImport, IMPORT_CHUNK_SIZE
 
-class AtencionMedicaModel(DatabaseConnection):
+class AtencionMedicaModel(IdAllocatorMixin, DatabaseConnection):
     """Modelo para manejar operaciones con Vista_Atencion_Medica"""
     
+    # Clave de orden para la paginación por cursor
+    PAGE_KEY = ('ID_Hospital', 'ID_Atención')
+    # Entidad para el allocator de IDs por rango de nodo
+    ID_ENTITY = 'atencion'
+    # Consultas frecuentes con cursor preparado por conexión (ver run_statement)
+    STATEMENTS = {
+        'atencion_by_id': """
+            SELECT * FROM Vista_Atencion_Medica 
+            WHERE ID_Hospital = ? AND ID_Atención = ?
+        """
+    }
+    
     def __init__(self):
         super().__init__()
         # Configuración de rangos de ID por nodo
@@ -11,39 +30,28 @@ class AtencionMedicaModel(DatabaseConnection):
             'guayaquil': {'min': 41, 'max': 80}
         }
 
-    def get_next_available_id(self, node=None):
-        """Obtiene el siguiente ID disponible según el rango del nodo"""
-        try:
-            current_node = node or self.detect_current_node()
-            if not current_node or current_node not in self.ID_RANGES:
-                return None
-            range_config = self.ID_RANGES[current_node]
-            hospital_id = 1 if current_node == 'quito' else 2
-            query = """
-                SELECT ID_Atención 
-                FROM Vista_Atencion_Medica 
-                WHERE ID_Hospital = ? AND ID_Atención BETWEEN ? AND ?
-                ORDER BY ID_Atención
-            """
-            params = (hospital_id, range_config['min'], range_config['max'])
-            results = self.execute_query(query, params, node=current_node)
-            if results is None:
-                return range_config['min']
-            occupied_ids = {row['ID_Atención'] for row in results}
-            for id_candidate in range(range_config['min'], range_config['max'] + 1):
-                if id_candidate not in occupied_ids:
-                    return id_candidate
-            return None
-        except Exception as e:
-            print(f"Error obteniendo siguiente ID atención: {e}")
-            return None
+    def _used_ids_query(self, node, min_id, max_id):
+        """IDs de atención ocupados en el rango del nodo (siembra del allocator)"""
+        hospital_id = 1 if node == 'quito' else 2
+        query = """
+            SELECT ID_Atención 
+            FROM Vista_Atencion_Medica 
+            WHERE ID_Hospital = ? AND ID_Atención BETWEEN ? AND ?
+        """
+        return query, (hospital_id, min_id, max_id)
 
     def get_hospital_id_by_node(self, node=None):
         current_node = node or self.detect_current_node()
         return 1 if current_node == 'quito' else 2
     
-    def get_all_atenciones(self, node=None):
-        """Obtiene todas las atenciones médicas desde Vista_Atencion_Medica filtrado por nodo"""
+    def get_all_atenciones(self, node=None, compact=False, stream=False, after=None, limit=None, keys=None):
+        """Obtiene todas las atenciones médicas desde Vista_Atencion_Medica filtrado por nodo
+
+        Con compact=True 'atenciones' es un ResultSet y la fecha se formatea al leer cada fila.
+        Con stream=True es un StreamingResultSet y 'total' es None.
+        after=(ID_Hospital, ID_Atención) y limit paginan por cursor; keys limita el resultado
+        a esas claves (delta de cambios).
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -57,16 +65,18 @@ class AtencionMedicaModel(DatabaseConnection):
             
             # Determinar ID_Hospital según el nodo
             hospital_id = 1 if current_node == 'quito' else 2
+            page = KeysetPage(self.PAGE_KEY, after, limit, keys)
             
-            query = """
+            query = f"""
             SELECT * FROM Vista_Atencion_Medica 
-            WHERE ID_Hospital = ?
-            ORDER BY ID_Atención
+            WHERE ID_Hospital = ?{page.where()}
+            {page.order_by()}
             """
-            results = self.execute_query(query, params=[hospital_id], node=current_node)
+            results = self.execute_query(query, params=[hospital_id, *page.params()], node=current_node,
+                                         compact=compact, stream=stream)
             
             # Debug: Ver qué campos están disponibles
-            if results and isinstance(results, list) and len(results) > 0:
+            if not stream and results and isinstance(results, (list, ResultSet)) and len(results) > 0:
                 print(f"Atenciones médicas filtradas para nodo {current_node} (Hospital {hospital_id}): {len(results)} registros")
                 print(f"Primer registro: {results[0]}")
             
@@ -80,7 +90,9 @@ class AtencionMedicaModel(DatabaseConnection):
                 }
             
             # Formatear fechas para el frontend
-            if isinstance(results, list):
+            if isinstance(results, ResultSet):
+                results.convert('Fecha', format_date)
+            elif isinstance(results, list):
                 for atencion in results:
                     if atencion.get('Fecha'):
                         fecha = atencion['Fecha']
@@ -91,7 +103,8 @@ class AtencionMedicaModel(DatabaseConnection):
                 'success': True,
                 'atenciones': results,
                 'node': current_node,
-                'total': len(results) if isinstance(results, list) else 0,
+                'total': None if stream else len(results),
+                'page': page,
                 'error': None
             }
             
@@ -111,11 +124,7 @@ class AtencionMedicaModel(DatabaseConnection):
             if not current_node:
                 return None
             
-            query = """
-                SELECT * FROM Vista_Atencion_Medica 
-                WHERE ID_Hospital = ? AND ID_Atención = ?
-            """
-            results = self.execute_query(query, (id_hospital, id_atencion), node=current_node)
+            results = self.run_statement('atencion_by_id', (id_hospital, id_atencion), node=current_node)
             
             if results and len(results) > 0:
                 atencion = results[0]
@@ -139,23 +148,23 @@ class AtencionMedicaModel(DatabaseConnection):
             current_node = node or self.detect_current_node()
             if not current_node:
                 return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
-            next_id = self.get_next_available_id(current_node)
+            hospital_id = 1 if current_node == 'quito' else 2
+            def insert(next_id):
+                with self.connection(current_node) as connection:
+                    cursor = connection.cursor()
+                    print(f"🔍 DEBUG: Creando atención ID={next_id}, Hospital={hospital_id}, Nodo={current_node}")
+                    self.execute_cursor(cursor, "{CALL SP_Create_Atencion_Medica (?, ?, ?, ?, ?, ?, ?, ?, ?)}",
+                        (hospital_id, next_id, atencion_data['ID_Personal'], atencion_data['ID_Paciente'],
+                         atencion_data['ID_Tipo'], atencion_data['Fecha'], atencion_data['Diagnostico'],
+                         atencion_data['Descripción'], atencion_data['Tratamiento']), node=current_node)
+                    connection.commit()
+                    cursor.close()
+            next_id = self.insert_with_new_id(current_node, insert)
             if next_id is None:
                 range_config = self.ID_RANGES.get(current_node, {})
                 return {'success': False, 'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'}
-            hospital_id = 1 if current_node == 'quito' else 2
-            connection = self.get_connection()
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🔍 DEBUG: Creando atención ID={next_id}, Hospital={hospital_id}, Nodo={current_node}")
-            cursor.execute("{CALL SP_Create_Atencion_Medica (?, ?, ?, ?, ?, ?, ?, ?, ?)}",
-                (hospital_id, next_id, atencion_data['ID_Personal'], atencion_data['ID_Paciente'],
-                 atencion_data['ID_Tipo'], atencion_data['Fecha'], atencion_data['Diagnostico'],
-                 atencion_data['Descripción'], atencion_data['Tratamiento']))
-            connection.commit()
-            cursor.close()
-            connection.close()
+            after_commit(invalidate_stats)
+            record_change('atenciones', hospital_id, next_id)
             return {'success': True, 'message': f'Atención médica creada exitosamente en nodo {current_node}', 'id_atencion': next_id, 'id_hospital': hospital_id}
         except Exception as e:
             print(f"Error en SP_Create_Atencion_Medica: {e}")
@@ -167,18 +176,16 @@ class AtencionMedicaModel(DatabaseConnection):
             current_node = node or self.detect_current_node()
             if not current_node:
                 return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
-            connection = self.get_connection()
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🔧 DEBUG: Actualizando atención Hospital={id_hospital}, ID={id_atencion}")
-            cursor.execute("{CALL SP_Update_Atencion_Medica (?, ?, ?, ?, ?, ?, ?, ?, ?)}",
-                (id_hospital, id_atencion, atencion_data['ID_Personal'], atencion_data['ID_Paciente'],
-                 atencion_data['ID_Tipo'], atencion_data['Fecha'], atencion_data['Diagnostico'],
-                 atencion_data['Descripción'], atencion_data['Tratamiento']))
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+                print(f"🔧 DEBUG: Actualizando atención Hospital={id_hospital}, ID={id_atencion}")
+                self.execute_cursor(cursor, "{CALL SP_Update_Atencion_Medica (?, ?, ?, ?, ?, ?, ?, ?, ?)}",
+                    (id_hospital, id_atencion, atencion_data['ID_Personal'], atencion_data['ID_Paciente'],
+                     atencion_data['ID_Tipo'], atencion_data['Fecha'], atencion_data['Diagnostico'],
+                     atencion_data['Descripción'], atencion_data['Tratamiento']), node=current_node)
+                connection.commit()
+                cursor.close()
+            record_change('atenciones', id_hospital, id_atencion)
             return {'success': True, 'message': 'Atención médica actualizada exitosamente'}
         except Exception as e:
             print(f"Error en SP_Update_Atencion_Medica: {e}")
@@ -190,20 +197,32 @@ class AtencionMedicaModel(DatabaseConnection):
             current_node = node or self.detect_current_node()
             if not current_node:
                 return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
-            connection = self.get_connection()
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🗑️ DEBUG: Eliminando atención Hospital={id_hospital}, ID={id_atencion}")
-            cursor.execute("{CALL SP_Delete_Atencion_Medica (?, ?)}", (id_hospital, id_atencion))
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+                print(f"🗑️ DEBUG: Eliminando atención Hospital={id_hospital}, ID={id_atencion}")
+                self.execute_cursor(cursor, "{CALL SP_Delete_Atencion_Medica (?, ?)}", (id_hospital, id_atencion), node=current_node)
+                connection.commit()
+                cursor.close()
+            # El ID se libera solo si el DELETE se confirma
+            after_commit(invalidate_stats)
+            after_commit(lambda: self.release_id(id_atencion))
+            record_change('atenciones', id_hospital, id_atencion)
             return {'success': True, 'message': 'Atención médica eliminada exitosamente'}
         except Exception as e:
             print(f"Error en SP_Delete_Atencion_Medica: {e}")
             return {'success': False, 'error': f'Error al eliminar atención médica: {str(e)}'}
     
+    def import_atenciones(self, path, node=None, chunk_size=IMPORT_CHUNK_SIZE, progress=print):
+        """Importa atenciones desde un CSV o Excel por lotes; reanuda si el archivo ya se importó en parte"""
+        try:
+            current_node = node or self.detect_current_node()
+            if not current_node:
+                return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
+            return AtencionImport(self, path, current_node, chunk_size, progress).run()
+        except (OSError, ValueError) as e:
+            print(f"❌ Error preparando importación de atenciones: {e}")
+            return {'success': False, 'error': f'No se pudo leer el archivo: {str(e)}'}
+    
     def search_atenciones(self, search_term, node=None):
         """Busca atenciones médicas por ID de paciente, personal o atención (filtrado por nodo)"""
         try:
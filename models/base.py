@@ -1,12 +1,78 @@
 import pyodbc
 import os
+import math
+import threading
+import time
+from contextlib import contextmanager, ExitStack
 from dotenv import load_dotenv
 
+from .pool import get_pool, statement_cursor, PoolTimeoutError
+from .node_resolver import get_node_resolver, NODE_PRIORITY
+from .fanout import fan_out, merge_sorted, DISTRIBUTED_TIMEOUT
+from .aio import run_blocking
+from .rows import ResultSet, StreamingResultSet
+from .unit_of_work import current_unit_of_work, UnitConnection
+from .metrics import query_metrics, statement_label
+
 # Cargar variables de entorno
 load_dotenv()
 
+# Filas leídas por cada fetchmany al hacer streaming
+STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', '500'))
+
+class StatementRegistry:
+    """Consultas con nombre declaradas por los modelos (STATEMENTS) y su tiempo de ejecución"""
+    
+    def __init__(self):
+        self._sql = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def register(self, name, sql):
+        with self._lock:
+            self._sql[name] = sql
+            self._stats.setdefault(name, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+    
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            stats = self._stats[name]
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if not ok:
+                stats['errors'] += 1
+    
+    def stats(self):
+        """Tiempos por consulta con nombre, las más costosas (tiempo total) primero"""
+        with self._lock:
+            rows = [
+                {
+                    'name': name,
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'total_ms': round(stats['total'] * 1000, 3),
+                    'avg_ms': round(stats['total'] * 1000 / stats['count'], 3) if stats['count'] else None,
+                    'max_ms': round(stats['max'] * 1000, 3)
+                }
+                for name, stats in self._stats.items()
+            ]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+# Registro compartido por todo el proceso
+statement_registry = StatementRegistry()
+
 class DatabaseConnection:
-    """Clase base para manejar conexiones y operaciones comunes"""
+    """Capa única de acceso a datos: pool por nodo, detección de nodo cacheada y filas como dict"""
+    
+    # Consultas con nombre del modelo: {'nombre': 'SELECT ...'}; se registran al definir la clase
+    # como 'Clase.nombre'. Los {marcadores} se completan al ejecutar (ej. tabla vía linked server)
+    STATEMENTS = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, sql in cls.__dict__.get('STATEMENTS', {}).items():
+            statement_registry.register(f'{cls.__name__}.{name}', sql)
     
     def __init__(self):
         # Configuración para el nodo de Quito
@@ -25,26 +91,17 @@ class DatabaseConnection:
             'password': os.getenv('DB_GUAYAQUIL_PASSWORD')
         }
     
+    def get_node_resolver(self):
+        """Obtiene el resolver de nodo compartido por el proceso"""
+        return get_node_resolver(self._test_connection)
+    
     def detect_current_node(self):
-        """Detecta el nodo actual probando conexiones"""
-        # Intentar conectar a Quito primero
-        if self._test_connection('quito'):
-            return 'quito'
-        elif self._test_connection('guayaquil'):
-            return 'guayaquil'
-        else:
-            return None
+        """Detecta el nodo actual (Quito primero); el resultado se cachea por proceso"""
+        return self.get_node_resolver().current()
     
     def _test_connection(self, node):
         """Prueba la conexión a un nodo específico"""
-        try:
-            connection = self.get_connection(node)
-            if connection:
-                connection.close()
-                return True
-        except:
-            pass
-        return False
+        return self.get_pool(node).ping()
     
     def get_connection_string(self, node='quito'):
         """Construye la cadena de conexión para SQL Server"""
@@ -60,49 +117,265 @@ class DatabaseConnection:
         )
         return connection_string
     
-    def get_connection(self, node=None):
-        """Obtiene una conexión a la base de datos"""
-        if node is None:
+    def get_pool(self, node):
+        """Obtiene el pool de conexiones compartido del nodo"""
+        return get_pool(node, self.get_connection_string(node))
+    
+    @contextmanager
+    def connection(self, node=None, shared=True):
+        """Presta una conexión del pool del nodo y la devuelve al terminar el bloque
+
+        Dentro de una petición HTTP con unidad de trabajo activa, todas las llamadas
+        comparten una conexión por nodo y commit() se confirma al final de la petición.
+        shared=False pide una conexión propia con commits inmediatos (streaming,
+        importaciones que confirman por lote).
+        """
+        detected = node is None
+        if detected:
             node = self.detect_current_node()
             if node is None:
                 raise Exception("No se puede conectar a ningún nodo")
         
+        pool = self.get_pool(node)
+        unit = current_unit_of_work() if shared else None
+        if unit is not None:
+            try:
+                with unit.use(node, pool) as connection:
+                    yield connection
+            except pyodbc.Error:
+                if detected:
+                    self.get_node_resolver().invalidate()
+                raise
+            return
+        
+        started = time.perf_counter()
         try:
-            connection_string = self.get_connection_string(node)
-            connection = pyodbc.connect(connection_string)
-            return connection
-        except pyodbc.Error as e:
-            print(f"Error conectando a la base de datos {node}: {e}")
-            return None
+            connection = pool.acquire()
+        except pyodbc.Error:
+            # El nodo cacheado dejó de responder: forzar nueva detección
+            if detected:
+                self.get_node_resolver().invalidate()
+            raise
+        query_metrics.record_checkout(node, time.perf_counter() - started)
+        broken = False
+        try:
+            yield connection
+        except Exception:
+            try:
+                connection.rollback()
+            except pyodbc.Error:
+                broken = True
+            raise
+        finally:
+            pool.release(connection, discard=broken)
     
-    def execute_query(self, query, params=None, node=None):
-        """Ejecuta una consulta en el nodo especificado"""
-        connection = self.get_connection(node)
-        if not connection:
-            return None
-            
+    def run_statement(self, name, params=None, node=None, compact=False, **placeholders):
+        """Ejecuta una consulta declarada en STATEMENTS con nombre propio en las métricas
+
+        Usa el cursor preparado de la conexión del pool para ese SQL, así las consultas
+        puntuales frecuentes no se vuelven a preparar en cada llamada.
+        """
+        owner = next(klass for klass in type(self).__mro__ if name in klass.__dict__.get('STATEMENTS', {}))
+        sql = owner.STATEMENTS[name]
+        if placeholders:
+            sql = sql.format(**placeholders)
+        
+        return self.execute_query(sql, params, node=node, compact=compact, prepared=True,
+                                  statement=f'{owner.__name__}.{name}')
+    
+    def _record_query(self, statement, node, timing, rows, ok, registered=False):
+        query_metrics.record(statement, node, rows=rows, ok=ok, **timing)
+        if registered:
+            statement_registry.record(statement, sum(value for value in timing.values() if value), ok=ok)
+    
+    def execute_cursor(self, cursor, query, params=None, node=None, statement=None, many=False):
+        """cursor.execute con métricas, para los SP que se llaman con un cursor propio
+
+        Registra el tiempo de ejecución y las filas afectadas bajo statement (por
+        defecto 'CALL <procedimiento>'); la espera por la conexión queda en
+        db_pool_checkout_seconds. many=True usa cursor.executemany con la lista de
+        parámetros (las filas registradas son las del lote).
+        """
+        statement = statement or statement_label(query)
+        node = node or self.detect_current_node()
+        started = time.perf_counter()
+        ok = False
         try:
-            cursor = connection.cursor()
-            if params:
+            if many:
+                cursor.executemany(query, params)
+            elif params is not None:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            
-            # Si es una consulta SELECT, retorna los resultados
-            if query.strip().upper().startswith('SELECT'):
-                columns = [column[0] for column in cursor.description]
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                return results
-            else:
-                # Para INSERT, UPDATE, DELETE
-                connection.commit()
-                return cursor.rowcount
+            ok = True
+            return cursor
+        finally:
+            rows = (len(params) if many else cursor.rowcount) if ok else None
+            self._record_query(statement, node, {'execute': time.perf_counter() - started}, rows, ok)
+    
+    def execute_query(self, query, params=None, node=None, compact=False, stream=False, timeout=None,
+                      prepared=False, statement=None):
+        """Ejecuta una consulta en el nodo especificado
+
+        Con compact=True los SELECT devuelven un ResultSet (esquema compartido + tuplas)
+        en lugar de una lista de dicts. Con stream=True devuelven un StreamingResultSet
+        que lee por lotes con fetchmany; el llamador debe consumirlo o cerrarlo.
+        timeout (segundos) limita la ejecución en el driver. prepared=True ejecuta el
+        SELECT en el cursor preparado de la conexión (ver run_statement).
+
+        Cada ejecución registra en las métricas (/metrics) los tiempos de conexión,
+        ejecución y lectura, y las filas, bajo statement o la etiqueta derivada del SQL.
+        """
+        registered = statement is not None
+        statement = statement or statement_label(query)
+        if stream:
+            return self._stream_query(query, params, node, statement)
+        
+        label_node = node or self.detect_current_node()
+        is_select = query.strip().upper().startswith('SELECT')
+        timing = {'connect': None, 'execute': None, 'fetch': None}
+        rows = None
+        ok = False
+        started = time.perf_counter()
+        try:
+            with self.connection(node) as connection:
+                timing['connect'] = time.perf_counter() - started
+                if timeout:
+                    connection.timeout = max(1, math.ceil(timeout))
+                # Consultas con nombre y SELECTs repetidos en una unidad de trabajo
+                # reutilizan el statement preparado de la conexión
+                reuse = is_select and (prepared or isinstance(connection, UnitConnection))
+                cursor = (statement_cursor(getattr(connection, 'raw', connection), query)
+                          if reuse else connection.cursor())
+                try:
+                    mark = time.perf_counter()
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    timing['execute'] = time.perf_counter() - mark
+                    
+                    # Si es una consulta SELECT, retorna los resultados
+                    if is_select:
+                        columns = [column[0] for column in cursor.description]
+                        mark = time.perf_counter()
+                        fetched = cursor.fetchall()
+                        timing['fetch'] = time.perf_counter() - mark
+                        rows = len(fetched)
+                        ok = True
+                        if compact:
+                            return ResultSet(columns, fetched)
+                        results = []
+                        for row in fetched:
+                            results.append(dict(zip(columns, row)))
+                        return results
+                    else:
+                        # Para INSERT, UPDATE, DELETE
+                        connection.commit()
+                        rows = cursor.rowcount
+                        ok = True
+                        return rows
+                finally:
+                    if not reuse:
+                        cursor.close()
+                    if timeout:
+                        # La conexión vuelve al pool sin límite de tiempo
+                        connection.timeout = 0
                 
-        except pyodbc.Error as e:
+        except (pyodbc.Error, PoolTimeoutError) as e:
             print(f"Error ejecutando consulta en {node}: {e}")
-            connection.rollback()
             return None
         finally:
-            connection.close()
+            if timing['connect'] is None:
+                timing['connect'] = time.perf_counter() - started
+            self._record_query(statement, label_node, timing, rows, ok, registered)
+    
+    async def execute_query_async(self, query, params=None, node=None, compact=False, timeout=None):
+        """Versión async de execute_query para el modo ASGI (pyodbc corre en el executor acotado)
+
+        No admite stream=True: el cursor tendría que leerse desde el event loop.
+        """
+        return await run_blocking(self.execute_query, query, params, node=node, compact=compact,
+                                  timeout=timeout)
+    
+    async def call_async(self, method, *args, **kwargs):
+        """Ejecuta un método del modelo (ej. los que llaman a los SP) sin bloquear el event loop
+
+        Uso: await pacientes_model.call_async(pacientes_model.create_paciente, datos)
+        """
+        return await run_blocking(method, *args, **kwargs)
+    
+    def _stream_query(self, query, params=None, node=None, statement=None):
+        """Ejecuta un SELECT y deja la conexión prestada hasta que se lean todas las filas
+
+        La lectura se registra en las métricas al cerrar, con el tiempo que pasó dentro
+        de fetchmany (no el que tardó el cliente en consumir la respuesta).
+        """
+        statement = statement or statement_label(query)
+        label_node = node or self.detect_current_node()
+        timing = {'connect': None, 'execute': None, 'fetch': None}
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Conexión propia: el cursor sigue abierto después de la petición
+                connection = stack.enter_context(self.connection(node, shared=False))
+                timing['connect'] = time.perf_counter() - started
+                cursor = connection.cursor()
+                stack.callback(cursor.close)
+                mark = time.perf_counter()
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                timing['execute'] = time.perf_counter() - mark
+                columns = [column[0] for column in cursor.description]
+                
+                # A partir de aquí el StreamingResultSet es dueño del cursor y la conexión
+                cleanup = stack.pop_all()
+            
+            def finish():
+                cleanup.close()
+                timing['fetch'] = resultset.fetch_seconds
+                self._record_query(statement, label_node, timing, resultset.row_count, True)
+            
+            resultset = StreamingResultSet(columns, cursor, STREAM_BATCH_SIZE, finish)
+            return resultset
+        
+        except (pyodbc.Error, PoolTimeoutError) as e:
+            print(f"Error ejecutando consulta en {node}: {e}")
+            if timing['connect'] is None:
+                timing['connect'] = time.perf_counter() - started
+            self._record_query(statement, label_node, timing, None, False)
+            return None
+    
+    def execute_distributed_query(self, query, params=None, timeout=None):
+        """Ejecuta la misma consulta en ambos nodos en paralelo (para vistas distribuidas)
+
+        Cada nodo tiene como máximo timeout segundos (DB_DISTRIBUTED_TIMEOUT por defecto);
+        un nodo lento o caído queda en None y los demás resultados se devuelven igual.
+        """
+        timeout = DISTRIBUTED_TIMEOUT if timeout is None else timeout
+        results, status = fan_out(
+            lambda node: self.execute_query(query, params, node=node, timeout=timeout),
+            NODE_PRIORITY, timeout
+        )
+        
+        for node, state in status.items():
+            if state != 'ok':
+                print(f"⚠️ Consulta distribuida sin resultado de {node} ({state})")
+        
+        return results
+    
+    def execute_distributed_merged(self, query, key_columns, params=None, timeout=None):
+        """Consulta distribuida con las filas de todos los nodos intercaladas por key_columns
+
+        La consulta debe traer ORDER BY key_columns (ej. ID_Hospital, ID_Paciente): las
+        listas de cada nodo ya vienen ordenadas y solo se mezclan, sin volver a ordenar.
+        """
+        results = self.execute_distributed_query(query, params, timeout)
+        
+        return {
+            'rows': list(merge_sorted(results.values(), key_columns)),
+            'nodes': {node: rows is not None for node, rows in results.items()},
+            'partial': any(rows is None for rows in results.values())
+        }
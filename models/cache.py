@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .changes import ChangeWatcher
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Segundos que se cachean los catálogos de referencia (se invalidan al escribir en ellos)
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', '3600'))
+# Máximo de segundos que Guayaquil puede ver Contratos desactualizado (0 = sin caché)
+CONTRATO_CACHE_TTL = float(os.getenv('CONTRATO_CACHE_TTL', '60'))
+
+
+class AggregateCache:
+    """Valor agregado en memoria con TTL e invalidación explícita"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._value = None
+        self._loaded_at = None
+        # Cada invalidación incrementa la versión; un cálculo iniciado antes no se guarda
+        self._version = 0
+        self._lock = threading.Lock()
+        # Solo un hilo recalcula a la vez; los demás esperan y reutilizan su resultado
+        self._load_lock = threading.Lock()
+
+    def _fresh_value(self):
+        if self._value is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return self._value
+        return None
+
+    def get(self, loader):
+        """Devuelve (valor, desde_cache); loader() -> (valor, cacheable)"""
+        value = self._fresh_value()
+        if value is not None:
+            return value, True
+
+        with self._load_lock:
+            value = self._fresh_value()
+            if value is not None:
+                return value, True
+
+            with self._lock:
+                version = self._version
+            value, cacheable = loader()
+
+            with self._lock:
+                if cacheable and version == self._version:
+                    self._value = value
+                    self._loaded_at = time.monotonic()
+            return value, False
+
+    def modify(self, func):
+        """Aplica func(valor) a la copia cacheada sin esperar al TTL (escritura propia)
+
+        Descarta además cualquier carga en curso, que pudo leer antes de la escritura.
+        """
+        with self._lock:
+            self._version += 1
+            if self._value is not None:
+                func(self._value)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._value = None
+
+
+class CatalogCache:
+    """Tabla de referencia (pocas filas, replicada) cacheada por nodo con lectura directa
+
+    La primera lectura en cada nodo consulta la base; las siguientes se sirven de memoria
+    hasta que expire el TTL o el propio modelo invalide el catálogo tras una escritura.
+    Con change_entity, las escrituras de otros workers (registro de cambios) también
+    lo invalidan.
+    """
+
+    def __init__(self, name, ttl=CATALOG_CACHE_TTL, change_entity=None):
+        self.name = name
+        self.ttl = ttl
+        self._changes = ChangeWatcher(change_entity) if change_entity else None
+        self._caches = {}
+        self._lock = threading.Lock()
+        # Versión del catálogo: aumenta con cada escritura confirmada
+        self.version = 0
+
+    def _cache_for(self, node):
+        cache = self._caches.get(node)
+        if cache is not None:
+            return cache
+
+        with self._lock:
+            cache = self._caches.get(node)
+            if cache is None:
+                cache = AggregateCache(self.ttl)
+                self._caches[node] = cache
+            return cache
+
+    def get(self, node, loader):
+        """Devuelve (filas, desde_cache); loader() -> filas o None si la consulta falla
+
+        Siempre devuelve una lista nueva para que el llamador no altere la copia cacheada.
+        """
+        if self._changes is not None and self._changes.changed():
+            self.invalidate()
+
+        def load():
+            rows = loader()
+            return rows, rows is not None
+
+        rows, cached = self._cache_for(node).get(load)
+        return (list(rows) if rows is not None else None), cached
+
+    def invalidate(self):
+        """Descarta el catálogo en todos los nodos (la escritura se replica desde el master)"""
+        with self._lock:
+            self.version += 1
+            caches = list(self._caches.values())
+        for cache in caches:
+            cache.invalidate()
+
+
+class ContratoCache:
+    """Contratos en memoria, por (ID_Hospital, ID_Personal), para el nodo que los lee por linked server
+
+    Se carga completa con una sola consulta; las escrituras de este proceso la
+    actualizan al momento (write-through) y los cambios hechos por otros procesos o
+    desde Quito se ven como máximo ttl segundos después.
+    """
+
+    def __init__(self, ttl=CONTRATO_CACHE_TTL):
+        self.ttl = ttl
+        self._cache = AggregateCache(ttl)
+
+    def _contratos(self, loader):
+        def load():
+            rows = loader()
+            if rows is None:
+                return None, False
+            return {(row['ID_Hospital'], row['ID_Personal']): row for row in rows}, True
+
+        contratos, cached = self._cache.get(load)
+        if contratos is None:
+            raise LookupError("No se pudo cargar Contratos")
+        return contratos, cached
+
+    def get(self, key, loader):
+        """Devuelve (contrato o None, desde_cache); loader() -> filas de Contratos o None si falla
+
+        Lanza LookupError si la carga falló (el llamador consulta la fila directamente).
+        """
+        contratos, cached = self._contratos(loader)
+        contrato = contratos.get(key)
+        return (dict(contrato) if contrato else None), cached
+
+    def personal_ids(self, id_hospital, min_id, max_id, loader):
+        """IDs de personal con contrato en el hospital dentro del rango; misma carga que get()"""
+        contratos, _ = self._contratos(loader)
+        return {id_personal for hospital, id_personal in list(contratos)
+                if hospital == id_hospital and min_id <= id_personal <= max_id}
+
+    def put(self, contrato):
+        key = (contrato['ID_Hospital'], contrato['ID_Personal'])
+        self._cache.modify(lambda contratos: contratos.__setitem__(key, dict(contrato)))
+
+    def remove(self, key):
+        self._cache.modify(lambda contratos: contratos.pop(key, None))
+
+    def invalidate(self):
+        self._cache.invalidate()
+
+
+# Catálogos compartidos por todo el proceso
+especialidad_cache = CatalogCache('Especialidad', change_entity='especialidades')
+tipo_atencion_cache = CatalogCache('Tipo_Atención', change_entity='tipos-atencion')
+contrato_cache = ContratoCache()
@@ -0,0 +1,200 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .unit_of_work import after_commit
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Archivo SQLite local con el registro de cambios (compartido por los procesos del nodo)
+CHANGE_LOG_PATH = os.getenv('CHANGE_LOG_PATH', 'outbox/changes.sqlite3')
+# Versiones que se conservan; un cliente más atrasado recibe reset y recarga la lista
+CHANGE_LOG_RETENTION = int(os.getenv('CHANGE_LOG_RETENTION', '10000'))
+# Claves distintas por delta; con más cambios conviene recargar la lista completa
+MAX_DELTA_KEYS = 500
+# Cada cuántas escrituras se recorta el registro
+PRUNE_EVERY = 200
+# Segundos entre consultas de un ChangeWatcher (cambios hechos por otros workers)
+CHANGE_POLL_INTERVAL = float(os.getenv('CHANGE_POLL_INTERVAL', '2'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    change_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_changes_entity ON changes (entity, version);
+"""
+
+# Proceso que hizo el cambio (registros creados antes de esta columna quedan en NULL)
+_PID_COLUMN = "ALTER TABLE changes ADD COLUMN pid INTEGER"
+
+
+class ChangeLog:
+    """Registro de las filas modificadas por entidad, con una versión creciente
+
+    Solo guarda la clave (o un prefijo de la clave) de cada fila tocada: el delta relee
+    las filas actuales, así una clave que ya no existe se informa como eliminada. Cubre
+    las escrituras hechas por esta aplicación en este nodo.
+    """
+
+    def __init__(self, path=CHANGE_LOG_PATH):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self):
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    connection = sqlite3.connect(self.path, timeout=30)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(_SCHEMA)
+                    columns = {row[1] for row in connection.execute("PRAGMA table_info(changes)")}
+                    if 'pid' not in columns:
+                        connection.execute(_PID_COLUMN)
+                    connection.close()
+                    self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def append(self, entity, key):
+        """Registra que la fila (o filas) con esa clave cambió; devuelve la nueva versión"""
+        connection = self._connect()
+        with connection:
+            version = connection.execute(
+                "INSERT INTO changes (entity, change_key, created_at, pid) VALUES (?, ?, ?, ?)",
+                (entity, json.dumps(list(key), default=str), time.time(), os.getpid())
+            ).lastrowid
+        connection.close()
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+        return version
+
+    def version(self):
+        """Versión actual (0 si no hay cambios registrados)"""
+        connection = self._connect()
+        row = connection.execute("SELECT COALESCE(MAX(version), 0) AS version FROM changes").fetchone()
+        connection.close()
+        return row['version']
+
+    def entity_version(self, entity, exclude_pid=None):
+        """Última versión en que cambió entity, sin contar los cambios del proceso exclude_pid"""
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT COALESCE(MAX(version), 0) AS version FROM changes "
+            "WHERE entity = ? AND (pid IS NULL OR pid != ?)",
+            (entity, exclude_pid if exclude_pid is not None else -1)
+        ).fetchone()
+        connection.close()
+        return row['version']
+
+    def changes_since(self, entity, since):
+        """Claves de entity que cambiaron después de since
+
+        Devuelve {'version', 'reset', 'keys'}; reset=True si since es anterior a lo que
+        se conserva (o hubo demasiados cambios) y el cliente debe recargar la lista.
+        """
+        connection = self._connect()
+        bounds = connection.execute(
+            "SELECT COALESCE(MIN(version), 0) AS oldest, COALESCE(MAX(version), 0) AS newest FROM changes"
+        ).fetchone()
+        version = bounds['newest']
+        # El registro se recortó después de since (o se borró el archivo): no se sabe qué cambió
+        if since > version or since < bounds['oldest'] - 1:
+            connection.close()
+            return {'version': version, 'reset': True, 'keys': []}
+
+        rows = connection.execute(
+            "SELECT DISTINCT change_key FROM changes WHERE entity = ? AND version > ? AND version <= ? LIMIT ?",
+            (entity, since, version, MAX_DELTA_KEYS + 1)
+        ).fetchall()
+        connection.close()
+        keys = [json.loads(row['change_key']) for row in rows]
+        # Demasiadas claves o un cambio de toda la entidad (clave vacía): recargar
+        if len(keys) > MAX_DELTA_KEYS or [] in keys:
+            return {'version': version, 'reset': True, 'keys': []}
+        return {'version': version, 'reset': False, 'keys': keys}
+
+    def prune(self, keep=None):
+        """Descarta las versiones más antiguas que las últimas keep"""
+        keep = CHANGE_LOG_RETENTION if keep is None else keep
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "DELETE FROM changes WHERE version <= (SELECT COALESCE(MAX(version), 0) FROM changes) - ?",
+                (keep,)
+            )
+        connection.close()
+
+
+# Registro compartido por todo el proceso
+change_log = ChangeLog()
+
+
+class ChangeWatcher:
+    """Detecta los cambios de entity hechos por otros procesos (workers) del nodo
+
+    Las cachés y los índices en memoria son propios de cada worker: con este vigilante
+    se enteran por el registro de cambios de las escrituras de los demás. changed()
+    consulta el registro como mucho cada interval segundos y devuelve True si apareció
+    un cambio ajeno desde la consulta anterior (la primera solo toma la referencia).
+    """
+
+    def __init__(self, entity, interval=CHANGE_POLL_INTERVAL, log=None):
+        self.entity = entity
+        self.interval = interval
+        self.log = log or change_log
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def changed(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.interval:
+            return False
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.interval:
+                return False
+            self._checked_at = now
+            try:
+                version = self.log.entity_version(self.entity, exclude_pid=os.getpid())
+            except sqlite3.Error as e:
+                print(f"⚠️ No se pudo consultar el registro de cambios de {self.entity}: {e}")
+                return False
+            previous, self._version = self._version, version
+            return previous is not None and version != previous
+
+
+def record_change(entity, *key, committed=False):
+    """Registra un cambio de entity en la clave dada, cuando la petición confirme
+
+    Con unidad de trabajo se registra al confirmar (un cliente no debe ver la versión
+    antes que la fila); sin ella, o con committed=True (escrituras con conexión propia
+    ya confirmadas), de inmediato. Sin clave significa que cambió toda la entidad (ej.
+    una importación) y los clientes recargan la lista. Un error del registro no afecta
+    la escritura.
+    """
+    def append():
+        try:
+            change_log.append(entity, key)
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo registrar el cambio de {entity} {key}: {e}")
+
+    if committed:
+        append()
+    else:
+        after_commit(append)
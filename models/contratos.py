@@ -1,14 +1,40 @@
 from .base import DatabaseConnection
+from .pagination import KeysetPage
+from .cache import contrato_cache
+from .unit_of_work import current_unit_of_work
 import pyodbc
 
+# Nodo dueño de la tabla Contratos; los demás la leen por linked server
+CONTRATOS_NODE = 'quito'
+
 class ContratosManager(DatabaseConnection):
+    # Clave de orden para la paginación por cursor
+    PAGE_KEY = ('ID_Hospital', 'ID_Personal')
+    # Consultas frecuentes con cursor preparado por conexión (ver run_statement)
+    STATEMENTS = {
+        'contrato_by_ids': """
+            SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
+            FROM {contratos}
+            WHERE ID_Hospital = ? AND ID_Personal = ?
+        """,
+        'all_contratos': """
+            SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
+            FROM {contratos}
+        """,
+        'contrato_ids_in_range': """
+            SELECT ID_Personal
+            FROM {contratos}
+            WHERE ID_Hospital = ? AND ID_Personal BETWEEN ? AND ?
+        """
+    }
+
     def __init__(self):
         super().__init__()
 
-    def get_contratos_table_name(self):
-        """Obtener el nombre de la tabla Contratos según el nodo actual"""
+    def get_contratos_table_name(self, node=None):
+        """Obtener el nombre de la tabla Contratos según el nodo (por defecto el actual)"""
         try:
-            current_node = self.detect_current_node()
+            current_node = node or self.detect_current_node()
             if current_node == 'quito':
                 # Acceso directo en Quito
                 return "Contratos"
@@ -20,101 +46,152 @@ class ContratosManager(DatabaseConnection):
             # Default: asumir acceso directo
             return "Contratos"
 
-    def get_all_contratos(self):
-        """Obtener todos los contratos de la tabla Contratos (acceso local únicamente)"""
+    def get_all_contratos(self, after=None, limit=None):
+        """Obtener todos los contratos de la tabla Contratos (acceso local únicamente)
+
+        after=(ID_Hospital, ID_Personal) y limit paginan por cursor.
+        """
         try:
-            connection = self.get_connection()
-            cursor = connection.cursor()
+            page = KeysetPage(self.PAGE_KEY, after, limit)
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            query = """
-            SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
-            FROM Contratos
-            ORDER BY ID_Hospital, ID_Personal
-            """
+                query = f"""
+                SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
+                FROM Contratos{page.where('WHERE')}
+                {page.order_by()}
+                """
             
-            cursor.execute(query)
-            contratos = []
+                self.execute_cursor(cursor, query, page.params() or None, statement='contratos_page')
+                contratos = []
             
-            for row in cursor.fetchall():
-                contrato = {
-                    'ID_Hospital': row.ID_Hospital,
-                    'ID_Personal': row.ID_Personal,
-                    'Salario': row.Salario,
-                    'Fecha_Contrato': row.Fecha_Contrato
-                }
-                contratos.append(contrato)
+                for row in cursor.fetchall():
+                    contrato = {
+                        'ID_Hospital': row.ID_Hospital,
+                        'ID_Personal': row.ID_Personal,
+                        'Salario': row.Salario,
+                        'Fecha_Contrato': row.Fecha_Contrato
+                    }
+                    contratos.append(contrato)
             
-            cursor.close()
-            connection.close()
+                cursor.close()
             return contratos
             
         except Exception as e:
             print(f"Error al obtener contratos: {e}")
             return []
 
+    def _uses_contrato_cache(self, node):
+        return node is not None and node != CONTRATOS_NODE and contrato_cache.ttl > 0
+    
     def get_contrato_by_ids(self, id_hospital, id_personal):
-        """Obtener un contrato específico por ID_Hospital e ID_Personal (usando linked server si es necesario)"""
+        """Obtener un contrato específico por ID_Hospital e ID_Personal (usando linked server si es necesario)
+
+        Fuera de Quito se responde desde la copia local de Contratos (contrato_cache),
+        que se carga completa con una sola consulta por linked server.
+        """
         try:
-            connection = self.get_connection()
-            cursor = connection.cursor()
+            current_node = self.detect_current_node()
+            if self._uses_contrato_cache(current_node):
+                tabla_contratos = self.get_contratos_table_name(current_node)
+                try:
+                    contrato, cached = contrato_cache.get(
+                        (id_hospital, id_personal),
+                        lambda: self.run_statement('all_contratos', node=current_node, contratos=tabla_contratos)
+                    )
+                    if not cached:
+                        print(f"🔗 DEBUG: Contratos cargados desde {tabla_contratos} en caché local")
+                    return contrato
+                except LookupError:
+                    print("⚠️ No se pudo cargar Contratos en caché, consultando la fila directamente")
             
             # Obtener nombre de tabla según nodo
-            tabla_contratos = self.get_contratos_table_name()
-            
-            query = f"""
-            SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
-            FROM {tabla_contratos}
-            WHERE ID_Hospital = ? AND ID_Personal = ?
-            """
+            tabla_contratos = self.get_contratos_table_name(current_node)
             
             print(f"🔗 DEBUG: Buscando contrato en {tabla_contratos} para H={id_hospital}, P={id_personal}")
-            cursor.execute(query, (id_hospital, id_personal))
-            row = cursor.fetchone()
-            
-            contrato = None
-            if row:
-                contrato = {
-                    'ID_Hospital': row.ID_Hospital,
-                    'ID_Personal': row.ID_Personal,
-                    'Salario': row.Salario,
-                    'Fecha_Contrato': row.Fecha_Contrato
-                }
+            results = self.run_statement('contrato_by_ids', (id_hospital, id_personal), node=current_node,
+                                         contratos=tabla_contratos)
+            if results is None:
+                raise Exception(f"No se pudo consultar {tabla_contratos}")
             
-            cursor.close()
-            connection.close()
-            return contrato
+            return results[0] if results else None
             
         except Exception as e:
             print(f"Error al obtener contrato por IDs: {e}")
             return None
 
+    def get_contrato_ids(self, id_hospital, min_id, max_id, node=None):
+        """IDs de personal con contrato en el hospital dentro de [min_id, max_id]; None si falla
+
+        Fuera de Quito sale de la copia local de Contratos, sin ir al linked server.
+        """
+        current_node = node or self.detect_current_node()
+        tabla_contratos = self.get_contratos_table_name(current_node)
+        if self._uses_contrato_cache(current_node):
+            try:
+                return contrato_cache.personal_ids(
+                    id_hospital, min_id, max_id,
+                    lambda: self.run_statement('all_contratos', node=current_node, contratos=tabla_contratos)
+                )
+            except LookupError:
+                print("⚠️ No se pudo cargar Contratos en caché, consultando el rango directamente")
+        
+        results = self.run_statement('contrato_ids_in_range', (id_hospital, min_id, max_id), node=current_node,
+                                     compact=True, contratos=tabla_contratos)
+        return None if results is None else {row[0] for row in results.rows}
+
+    def _write_through(self, id_hospital, id_personal, deleted=False):
+        """Refleja en la caché local de Contratos una escritura de este proceso
+
+        Crear/actualizar relee la fila (el SP puede completar la fecha); si la petición
+        termina revirtiendo, la caché se descarta para no servir un contrato fantasma.
+        """
+        current_node = self.detect_current_node()
+        if not self._uses_contrato_cache(current_node):
+            return
+        
+        key = (id_hospital, id_personal)
+        if deleted:
+            contrato_cache.remove(key)
+        else:
+            results = self.run_statement('contrato_by_ids', key, node=current_node,
+                                         contratos=self.get_contratos_table_name(current_node))
+            if results:
+                contrato_cache.put(results[0])
+            elif results is None:
+                # No se pudo releer: la próxima lectura recarga todo
+                contrato_cache.invalidate()
+            else:
+                contrato_cache.remove(key)
+        
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.on_rollback(contrato_cache.invalidate)
+    
     def create_contrato(self, id_hospital, id_personal, salario, fecha_contrato=None):
         """Crear un nuevo contrato usando Stored Procedure (usando linked server si es necesario)"""
         try:
-            connection = self.get_connection()
-            if not connection:
-                return False
-                
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            # Determinar cómo ejecutar el SP según el nodo
-            current_node = self.detect_current_node()
-            if current_node == 'quito':
-                # Ejecutar SP directamente en Quito
-                sp_call = "{CALL CrearContrato (?, ?, ?, ?)}"
-                print(f"🔗 DEBUG: Ejecutando SP local en Quito: {sp_call}")
-            else:
-                # Ejecutar SP remoto via linked server (ahora con RPC habilitado)
-                sp_call = "{CALL [ASUSVIVOBOOK].[Red_de_salud_Quito].[dbo].[CrearContrato] (?, ?, ?, ?)}"
-                print(f"🔗 DEBUG: Ejecutando SP remoto via linked server: {sp_call}")
+                # Determinar cómo ejecutar el SP según el nodo
+                current_node = self.detect_current_node()
+                if current_node == 'quito':
+                    # Ejecutar SP directamente en Quito
+                    sp_call = "{CALL CrearContrato (?, ?, ?, ?)}"
+                    print(f"🔗 DEBUG: Ejecutando SP local en Quito: {sp_call}")
+                else:
+                    # Ejecutar SP remoto via linked server (ahora con RPC habilitado)
+                    sp_call = "{CALL [ASUSVIVOBOOK].[Red_de_salud_Quito].[dbo].[CrearContrato] (?, ?, ?, ?)}"
+                    print(f"🔗 DEBUG: Ejecutando SP remoto via linked server: {sp_call}")
             
-            cursor.execute(sp_call, (id_hospital, id_personal, salario, fecha_contrato))
+                self.execute_cursor(cursor, sp_call, (id_hospital, id_personal, salario, fecha_contrato), node=current_node)
             
-            # Confirmar la transacción
-            connection.commit()
+                # Confirmar la transacción
+                connection.commit()
             
-            cursor.close()
-            connection.close()
+                cursor.close()
+            self._write_through(id_hospital, id_personal)
             return True
             
             # ===== CÓDIGO ANTERIOR CON INSERT DIRECTO (COMENTADO) =====
@@ -172,20 +249,17 @@ class ContratosManager(DatabaseConnection):
     def update_contrato(self, id_hospital, id_personal, salario, fecha_contrato=None):
         """Actualizar un contrato existente usando Stored Procedure (acceso local únicamente)"""
         try:
-            connection = self.get_connection()
-            if not connection:
-                return False
-                
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            sp_call = "{CALL ActualizarContrato (?, ?, ?, ?)}"
-            cursor.execute(sp_call, (id_hospital, id_personal, salario, fecha_contrato))
+                sp_call = "{CALL ActualizarContrato (?, ?, ?, ?)}"
+                self.execute_cursor(cursor, sp_call, (id_hospital, id_personal, salario, fecha_contrato))
             
-            # Confirmar la transacción
-            connection.commit()
+                # Confirmar la transacción
+                connection.commit()
             
-            cursor.close()
-            connection.close()
+                cursor.close()
+            self._write_through(id_hospital, id_personal)
             return True
                 
         except Exception as e:
@@ -195,30 +269,27 @@ class ContratosManager(DatabaseConnection):
     def delete_contrato(self, id_hospital, id_personal):
         """Eliminar un contrato usando Stored Procedure (usando linked server si es necesario)"""
         try:
-            connection = self.get_connection()
-            if not connection:
-                return False
-                
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            # Determinar cómo ejecutar el SP según el nodo
-            current_node = self.detect_current_node()
-            if current_node == 'quito':
-                # Ejecutar SP directamente en Quito
-                sp_call = "{CALL EliminarContrato (?, ?)}"
-                print(f"🔗 DEBUG: Ejecutando SP local en Quito: {sp_call}")
-            else:
-                # Ejecutar SP remoto via linked server (ahora con RPC habilitado)
-                sp_call = "{CALL [ASUSVIVOBOOK].[Red_de_salud_Quito].[dbo].[EliminarContrato] (?, ?)}"
-                print(f"🔗 DEBUG: Ejecutando SP remoto via linked server: {sp_call}")
+                # Determinar cómo ejecutar el SP según el nodo
+                current_node = self.detect_current_node()
+                if current_node == 'quito':
+                    # Ejecutar SP directamente en Quito
+                    sp_call = "{CALL EliminarContrato (?, ?)}"
+                    print(f"🔗 DEBUG: Ejecutando SP local en Quito: {sp_call}")
+                else:
+                    # Ejecutar SP remoto via linked server (ahora con RPC habilitado)
+                    sp_call = "{CALL [ASUSVIVOBOOK].[Red_de_salud_Quito].[dbo].[EliminarContrato] (?, ?)}"
+                    print(f"🔗 DEBUG: Ejecutando SP remoto via linked server: {sp_call}")
             
-            cursor.execute(sp_call, (id_hospital, id_personal))
+                self.execute_cursor(cursor, sp_call, (id_hospital, id_personal), node=current_node)
             
-            # Confirmar la transacción
-            connection.commit()
+                # Confirmar la transacción
+                connection.commit()
             
-            cursor.close()
-            connection.close()
+                cursor.close()
+            self._write_through(id_hospital, id_personal, deleted=True)
             return True
             
             # ===== CÓDIGO ANTERIOR CON DELETE DIRECTO (COMENTADO) =====
@@ -259,37 +330,67 @@ class ContratosManager(DatabaseConnection):
             print(f"Error al eliminar contrato: {e}")
             return False
 
+    def apply_queued_write(self, entry):
+        """Aplica en Quito una escritura de la cola de contratos (models/outbox.py)
+
+        Es idempotente ante reintentos: antes de escribir consulta la fila real en Quito
+        (sin pasar por la caché), así un intento que llegó a aplicarse no se repite.
+        Lanza excepción si no se pudo aplicar, para que la cola lo reintente.
+        """
+        id_hospital, id_personal = entry['id_hospital'], entry['id_personal']
+        current_node = self.detect_current_node()
+        tabla_contratos = self.get_contratos_table_name(current_node)
+        results = self.run_statement('contrato_by_ids', (id_hospital, id_personal), node=current_node,
+                                     contratos=tabla_contratos)
+        if results is None:
+            raise ConnectionError(f"No se pudo consultar {tabla_contratos}")
+
+        if entry['operation'] == 'create':
+            if results:
+                print(f"ℹ️ Contrato H={id_hospital}, P={id_personal} ya existía (reintento ya aplicado)")
+                self._write_through(id_hospital, id_personal)
+            elif not self.create_contrato(id_hospital, id_personal, entry['payload']['salario'],
+                                          entry['payload'].get('fecha_contrato')):
+                raise RuntimeError(f"No se pudo crear el contrato H={id_hospital}, P={id_personal}")
+        elif entry['operation'] == 'delete':
+            if not results:
+                self._write_through(id_hospital, id_personal, deleted=True)
+            elif not self.delete_contrato(id_hospital, id_personal):
+                raise RuntimeError(f"No se pudo eliminar el contrato H={id_hospital}, P={id_personal}")
+        else:
+            raise ValueError(f"Operación desconocida en la cola de contratos: {entry['operation']}")
+
     def search_contratos(self, search_term):
         """Buscar contratos por término de búsqueda (acceso local únicamente)"""
         try:
-            connection = self.get_connection()
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            # Buscar por ID_Hospital, ID_Personal o Salario
-            query = """
-            SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
-            FROM Contratos
-            WHERE CAST(ID_Hospital AS VARCHAR) LIKE ? 
-               OR CAST(ID_Personal AS VARCHAR) LIKE ?
-               OR CAST(Salario AS VARCHAR) LIKE ?
-            ORDER BY ID_Hospital, ID_Personal
-            """
+                # Buscar por ID_Hospital, ID_Personal o Salario
+                query = """
+                SELECT ID_Hospital, ID_Personal, Salario, Fecha_Contrato
+                FROM Contratos
+                WHERE CAST(ID_Hospital AS VARCHAR) LIKE ? 
+                   OR CAST(ID_Personal AS VARCHAR) LIKE ?
+                   OR CAST(Salario AS VARCHAR) LIKE ?
+                ORDER BY ID_Hospital, ID_Personal
+                """
             
-            search_pattern = f"%{search_term}%"
-            cursor.execute(query, (search_pattern, search_pattern, search_pattern))
+                search_pattern = f"%{search_term}%"
+                self.execute_cursor(cursor, query, (search_pattern, search_pattern, search_pattern),
+                                    statement='contratos_search')
             
-            contratos = []
-            for row in cursor.fetchall():
-                contrato = {
-                    'ID_Hospital': row.ID_Hospital,
-                    'ID_Personal': row.ID_Personal,
-                    'Salario': row.Salario,
-                    'Fecha_Contrato': row.Fecha_Contrato
-                }
-                contratos.append(contrato)
+                contratos = []
+                for row in cursor.fetchall():
+                    contrato = {
+                        'ID_Hospital': row.ID_Hospital,
+                        'ID_Personal': row.ID_Personal,
+                        'Salario': row.Salario,
+                        'Fecha_Contrato': row.Fecha_Contrato
+                    }
+                    contratos.append(contrato)
             
-            cursor.close()
-            connection.close()
+                cursor.close()
             return contratos
             
         except Exception as e:
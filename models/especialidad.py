@@ -1,4 +1,8 @@
 from .base import DatabaseConnection
+from .cache import especialidad_cache
+from .unit_of_work import after_commit
+from .changes import record_change
+from .stats import invalidate_stats
 
 class EspecialidadModel(DatabaseConnection):
     """Modelo para manejar operaciones con la tabla Especialidad"""
@@ -7,7 +11,7 @@ class EspecialidadModel(DatabaseConnection):
         super().__init__()
     
     def get_all_especialidades(self, node=None):
-        """Obtiene todas las especialidades desde la tabla Especialidad"""
+        """Obtiene todas las especialidades (desde la caché del catálogo; la base solo en el primer acceso)"""
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -20,10 +24,12 @@ class EspecialidadModel(DatabaseConnection):
                 }
             
             query = "SELECT ID_Especialidad, Área FROM Especialidad ORDER BY ID_Especialidad"
-            results = self.execute_query(query, node=current_node)
+            results, cached = especialidad_cache.get(
+                current_node, lambda: self.execute_query(query, node=current_node)
+            )
             
-            # Debug: Ver qué campos están disponibles
-            if results and len(results) > 0:
+            # Debug: Ver qué campos están disponibles (solo cuando se leyó de la base)
+            if results and not cached:
                 print(f"Campos disponibles en Especialidad: {list(results[0].keys())}")
                 print(f"Primer registro: {results[0]}")
             
@@ -41,6 +47,7 @@ class EspecialidadModel(DatabaseConnection):
                 'especialidades': results,
                 'node': current_node,
                 'total': len(results),
+                'cached': cached,
                 'error': None
             }
             
@@ -53,6 +60,13 @@ class EspecialidadModel(DatabaseConnection):
                 'total': 0
             }
     
+    def warm_catalog_cache(self, node=None):
+        """Carga el catálogo de especialidades en memoria al arrancar; True si quedó cacheado"""
+        result = self.get_all_especialidades(node)
+        if not result['success']:
+            print(f"⚠️ No se pudo precargar el catálogo de especialidades: {result['error']}")
+        return result['success']
+    
     def get_especialidad_by_id(self, id_especialidad, node=None):
         """Obtiene una especialidad específica por ID"""
         try:
@@ -124,6 +138,10 @@ class EspecialidadModel(DatabaseConnection):
             result = self.execute_query(query, params, node=current_node)
             
             if result is not None and result > 0:
+                after_commit(invalidate_stats)
+                after_commit(especialidad_cache.invalidate)
+                # Los demás workers invalidan su copia al ver el cambio
+                record_change('especialidades')
                 return {
                     'success': True,
                     'message': f'Especialidad creada exitosamente en nodo {current_node} con ID {next_id}',
@@ -165,6 +183,8 @@ class EspecialidadModel(DatabaseConnection):
             result = self.execute_query(query, params, node=current_node)
             
             if result is not None and result > 0:
+                after_commit(especialidad_cache.invalidate)
+                record_change('especialidades')
                 return {
                     'success': True,
                     'message': f'Especialidad actualizada exitosamente en nodo {current_node}'
@@ -199,6 +219,9 @@ class EspecialidadModel(DatabaseConnection):
             result = self.execute_query(query, (id_especialidad,), node=current_node)
             
             if result is not None and result > 0:
+                after_commit(invalidate_stats)
+                after_commit(especialidad_cache.invalidate)
+                record_change('especialidades')
                 return {
                     'success': True,
                     'message': f'Especialidad eliminada exitosamente del nodo {current_node}'
@@ -1,32 +1,35 @@
 from .base import DatabaseConnection
+from .rows import ResultSet
+from .pagination import KeysetPage
+from .id_allocator import IdAllocatorMixin
+from .changes import record_change
+
+class ExperienciaModel(IdAllocatorMixin, DatabaseConnection):
+    # Clave de orden para la paginación por cursor (un personal puede tener varios cargos)
+    PAGE_KEY = ('ID_Hospital', 'ID_Personal', 'Cargo')
+    # Entidad para el allocator de IDs por rango de nodo
+    ID_ENTITY = 'experiencia'
+    # Consultas frecuentes con cursor preparado por conexión (ver run_statement)
+    STATEMENTS = {
+        'experiencia_by_id': """
+            SELECT * FROM Vista_Experiencia 
+            WHERE ID_Hospital = ? AND ID_Personal = ?
+        """
+    }
 
-class ExperienciaModel(DatabaseConnection):
     # Configuración de rangos de ID_Personal por nodo
     ID_RANGES = {
         'quito': {'min': 1, 'max': 10},
         'guayaquil': {'min': 11, 'max': 20}
     }
 
-    def get_next_available_id(self, node=None):
-        current_node = node or self.detect_current_node()
-        if not current_node or current_node not in self.ID_RANGES:
-            return None
-        range_config = self.ID_RANGES[current_node]
-        hospital_id = 1 if current_node == 'quito' else 2
+    def _used_ids_query(self, node, min_id, max_id):
+        hospital_id = 1 if node == 'quito' else 2
         query = """
-            SELECT ID_Personal FROM Vista_Experiencia
+            SELECT DISTINCT ID_Personal FROM Vista_Experiencia
             WHERE ID_Hospital = ? AND ID_Personal BETWEEN ? AND ?
-            ORDER BY ID_Personal
         """
-        params = (hospital_id, range_config['min'], range_config['max'])
-        results = self.execute_query(query, params, node=current_node)
-        if results is None:
-            return range_config['min']
-        occupied_ids = {row['ID_Personal'] for row in results}
-        for id_candidate in range(range_config['min'], range_config['max'] + 1):
-            if id_candidate not in occupied_ids:
-                return id_candidate
-        return None
+        return query, (hospital_id, min_id, max_id)
 
     def get_hospital_id_by_node(self, node=None):
         current_node = node or self.detect_current_node()
@@ -57,18 +60,17 @@ class ExperienciaModel(DatabaseConnection):
             
             query = "{CALL SP_Create_Experiencia (?, ?, ?, ?)}"
             params = (hospital_id, id_personal, experiencia_data['Cargo'], experiencia_data['Años_exp'] if 'Años_exp' in experiencia_data else experiencia_data['Anios_exp'])
-            connection = self.get_connection(node=current_node)
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🔍 DEBUG: Creando experiencia ID_Personal={id_personal}, Hospital={hospital_id}, Nodo={current_node}, Cargo={experiencia_data['Cargo']}")
-            cursor.execute(query, params)
-            # Forzar la propagación de errores de SQL Server
-            while cursor.nextset():
-                pass
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+                print(f"🔍 DEBUG: Creando experiencia ID_Personal={id_personal}, Hospital={hospital_id}, Nodo={current_node}, Cargo={experiencia_data['Cargo']}")
+                self.execute_cursor(cursor, query, params, node=current_node)
+                # Forzar la propagación de errores de SQL Server
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                cursor.close()
+            # Por (ID_Hospital, ID_Personal): el delta trae todos los cargos de ese personal
+            record_change('experiencias', hospital_id, id_personal)
             return {'success': True, 'message': f'Experiencia creada exitosamente en nodo {current_node}', 'id_personal': id_personal, 'id_hospital': hospital_id}
         except Exception as e:
             import traceback
@@ -89,18 +91,16 @@ class ExperienciaModel(DatabaseConnection):
                 return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
             query = "{CALL SP_Update_Experiencia (?, ?, ?, ?)}"
             params = (id_hospital, id_personal, experiencia_data['Cargo'], experiencia_data['Años_exp'] if 'Años_exp' in experiencia_data else experiencia_data['Anios_exp'])
-            connection = self.get_connection(node=current_node)
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🔧 DEBUG: Actualizando experiencia Hospital={id_hospital}, ID_Personal={id_personal}, Cargo={experiencia_data['Cargo']}")
-            cursor.execute(query, params)
-            # Forzar la propagación de errores de SQL Server
-            while cursor.nextset():
-                pass
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+                print(f"🔧 DEBUG: Actualizando experiencia Hospital={id_hospital}, ID_Personal={id_personal}, Cargo={experiencia_data['Cargo']}")
+                self.execute_cursor(cursor, query, params, node=current_node)
+                # Forzar la propagación de errores de SQL Server
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                cursor.close()
+            record_change('experiencias', id_hospital, id_personal)
             return {'success': True, 'message': 'Experiencia actualizada exitosamente'}
         except Exception as e:
             import traceback
@@ -121,18 +121,16 @@ class ExperienciaModel(DatabaseConnection):
                 return {'success': False, 'error': 'No se puede conectar a ningún nodo'}
             query = "{CALL SP_Delete_Experiencia (?, ?, ?)}"
             params = (id_hospital, id_personal, cargo)
-            connection = self.get_connection(node=current_node)
-            if not connection:
-                return {'success': False, 'error': 'No se pudo establecer conexión'}
-            cursor = connection.cursor()
-            print(f"🗑️ DEBUG: Eliminando experiencia Hospital={id_hospital}, ID_Personal={id_personal}, Cargo={cargo}")
-            cursor.execute(query, params)
-            # Forzar la propagación de errores de SQL Server
-            while cursor.nextset():
-                pass
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+                print(f"🗑️ DEBUG: Eliminando experiencia Hospital={id_hospital}, ID_Personal={id_personal}, Cargo={cargo}")
+                self.execute_cursor(cursor, query, params, node=current_node)
+                # Forzar la propagación de errores de SQL Server
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                cursor.close()
+            record_change('experiencias', id_hospital, id_personal)
             return {'success': True, 'message': 'Experiencia eliminada exitosamente'}
         except Exception as e:
             import traceback
@@ -148,8 +146,13 @@ class ExperienciaModel(DatabaseConnection):
     def __init__(self):
         super().__init__()
     
-    def get_all_experiencias(self, node=None):
-        """Obtiene todas las experiencias desde Vista_Experiencia filtrado por nodo"""
+    def get_all_experiencias(self, node=None, compact=False, stream=False, after=None, limit=None, keys=None):
+        """Obtiene todas las experiencias desde Vista_Experiencia filtrado por nodo
+
+        Con compact=True 'experiencias' es un ResultSet; con stream=True un StreamingResultSet
+        y 'total' es None. after=(ID_Hospital, ID_Personal, Cargo) y limit paginan por cursor.
+        keys limita el resultado a esas claves o prefijos, ej. (ID_Hospital, ID_Personal).
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -163,16 +166,18 @@ class ExperienciaModel(DatabaseConnection):
             
             # Determinar ID_Hospital según el nodo
             hospital_id = 1 if current_node == 'quito' else 2
+            page = KeysetPage(self.PAGE_KEY, after, limit, keys)
             
-            query = """
+            query = f"""
             SELECT * FROM Vista_Experiencia 
-            WHERE ID_Hospital = ?
-            ORDER BY ID_Personal
+            WHERE ID_Hospital = ?{page.where()}
+            {page.order_by()}
             """
-            results = self.execute_query(query, params=[hospital_id], node=current_node)
+            results = self.execute_query(query, params=[hospital_id, *page.params()], node=current_node,
+                                         compact=compact, stream=stream)
             
             # Debug: Ver qué campos están disponibles
-            if results and isinstance(results, list) and len(results) > 0:
+            if not stream and results and isinstance(results, (list, ResultSet)) and len(results) > 0:
                 print(f"Experiencias filtradas para nodo {current_node} (Hospital {hospital_id}): {len(results)} registros")
                 print(f"Primer registro: {results[0]}")
             
@@ -189,7 +194,8 @@ class ExperienciaModel(DatabaseConnection):
                 'success': True,
                 'experiencias': results,
                 'node': current_node,
-                'total': len(results) if isinstance(results, list) else 0,
+                'total': None if stream else len(results),
+                'page': page,
                 'error': None
             }
             
@@ -210,11 +216,7 @@ class ExperienciaModel(DatabaseConnection):
             if not current_node:
                 return None
             
-            query = """
-                SELECT * FROM Vista_Experiencia 
-                WHERE ID_Hospital = ? AND ID_Personal = ?
-            """
-            results = self.execute_query(query, (id_hospital, id_personal), node=current_node)
+            results = self.run_statement('experiencia_by_id', (id_hospital, id_personal), node=current_node)
             
             if results and isinstance(results, list) and len(results) > 0:
                 return results[0]
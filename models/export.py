@@ -0,0 +1,317 @@
+import csv
+import io
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from heapq import merge
+from operator import itemgetter
+from queue import Queue, Empty, Full
+
+from dotenv import load_dotenv
+
+from .base import DatabaseConnection
+from .fanout import fan_out, DISTRIBUTED_TIMEOUT
+from .stats import HOSPITAL_BY_NODE
+from .pacientes import PacientesModel
+from .atencion_medica import AtencionMedicaModel
+from .experiencia import ExperienciaModel
+from .personal_medico import PersonalMedicoModel
+from .contratos import ContratosManager
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Filas por lote que cada hilo lector deja en su cola
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+# Lotes que puede adelantar cada nodo: la memoria queda acotada aunque el cliente lea lento
+EXPORT_QUEUE_BATCHES = int(os.getenv('EXPORT_QUEUE_BATCHES', '4'))
+# Tamaño aproximado (caracteres) de cada bloque CSV antes de enviarlo
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Origen de cada exportación: tabla o vista, clave de orden, columna de fecha para
+# desde/hasta, si está particionada por ID_Hospital entre los nodos, y si tiene ID_Hospital
+ExportSource = namedtuple('ExportSource', 'table key_columns date_column partitioned by_hospital')
+
+EXPORT_SOURCES = {
+    'pacientes': ExportSource('Vista_Paciente', PacientesModel.PAGE_KEY, 'FechaNacimiento', True, True),
+    'atenciones': ExportSource('Vista_Atencion_Medica', AtencionMedicaModel.PAGE_KEY, 'Fecha', True, True),
+    'experiencias': ExportSource('Vista_Experiencia', ExperienciaModel.PAGE_KEY, None, True, True),
+    'personal-medico': ExportSource('Vista_INF_Personal', PersonalMedicoModel.PAGE_KEY, None, True, True),
+    # Contratos vive solo en Quito (desde Guayaquil se lee por linked server)
+    'contratos': ExportSource(None, ContratosManager.PAGE_KEY, 'Fecha_Contrato', False, True),
+    'especialidades': ExportSource('Especialidad', ('ID_Especialidad',), None, False, False),
+    'tipos-atencion': ExportSource('Tipo_Atención', ('ID_Tipo',), None, False, False),
+}
+
+
+def parse_export_args(args):
+    """Lee 'format', 'ID_Hospital', 'desde' y 'hasta' (AAAA-MM-DD) de los parámetros de la URL
+
+    Devuelve (formato, filtros); lanza ValueError si alguno no es válido.
+    """
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"El parámetro 'format' debe ser uno de: {', '.join(EXPORT_FORMATS)}")
+
+    filters = {}
+    hospital_id = args.get('ID_Hospital')
+    if hospital_id:
+        filters['hospital_id'] = int(hospital_id)
+        if filters['hospital_id'] not in HOSPITAL_BY_NODE.values():
+            raise ValueError(f"ID_Hospital desconocido: {hospital_id}")
+
+    for name in ('desde', 'hasta'):
+        if args.get(name):
+            filters[name] = datetime.strptime(args[name], '%Y-%m-%d').date()
+
+    return export_format, filters
+
+
+def export_default(value):
+    """Valores que json no serializa: fechas en ISO, decimales como número"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def iter_csv(columns, rows):
+    """Genera el CSV por bloques de ~EXPORT_CHUNK_SIZE caracteres (con BOM para Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for values in rows:
+        writer.writerow(values)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(columns, rows):
+    """Genera una línea JSON por fila directamente desde las tuplas"""
+    encoder = json.JSONEncoder(default=export_default, ensure_ascii=False)
+    encode = encoder.encode
+    prefixes = [encode(column) + ':' for column in columns]
+    for values in rows:
+        yield '{' + ','.join(prefix + encode(value) for prefix, value in zip(prefixes, values)) + '}\n'
+
+
+_DONE = object()
+
+
+class NodeReader:
+    """Lee un StreamingResultSet en un hilo propio y deja las filas en una cola acotada
+
+    Así los nodos se leen al mismo tiempo mientras el cliente consume la respuesta,
+    sin que ninguno adelante más de EXPORT_QUEUE_BATCHES lotes. Si el nodo no entrega
+    un lote en timeout segundos la lectura se corta con TimeoutError.
+    """
+
+    def __init__(self, node, resultset, timeout=DISTRIBUTED_TIMEOUT):
+        self.node = node
+        self._resultset = resultset
+        self.timeout = timeout
+        self._queue = Queue(maxsize=EXPORT_QUEUE_BATCHES)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'export-{node}', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            batch = []
+            for values in self._resultset.rows:
+                batch.append(values)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch and not self._put(batch):
+                return
+            self._put(_DONE)
+        except Exception as e:
+            print(f"❌ Error leyendo exportación del nodo {self.node}: {e}")
+            self._put(e)
+        finally:
+            self._resultset.close()
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.timeout)
+            except Empty:
+                # Nodo colgado: el hilo se detiene (y libera la conexión) cuando el driver vuelva
+                self.close()
+                raise TimeoutError(f"El nodo {self.node} no entregó filas en {self.timeout:g} s")
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    def close(self):
+        """Detiene el hilo (cliente desconectado o error); el hilo libera la conexión
+
+        Se puede llamar varias veces (fin del generador y cierre de la respuesta).
+        """
+        self._stop.set()
+
+
+class Export:
+    """Exportación abierta: columnas, filas (tuplas) y cierre de los lectores"""
+
+    def __init__(self, columns, readers, key_columns):
+        self.columns = columns
+        self._readers = readers
+        key_index = itemgetter(*[columns.index(column) for column in key_columns])
+        self.rows = merge(*readers, key=key_index) if len(readers) > 1 else iter(readers[0])
+        self.closed = False
+
+    def close(self):
+        """Detiene los lectores; idempotente, también si las filas nunca se consumieron (HEAD)"""
+        if self.closed:
+            return
+        self.closed = True
+        for reader in self._readers:
+            reader.close()
+
+
+class ExportModel(DatabaseConnection):
+    """Exportación en streaming de cualquier entidad, con lectura concurrente de ambos nodos"""
+
+    def _query(self, source, table, filters, hospital_id):
+        conditions, params = [], []
+        if hospital_id is not None:
+            conditions.append("ID_Hospital = ?")
+            params.append(hospital_id)
+        if filters.get('desde'):
+            conditions.append(f"{source.date_column} >= ?")
+            params.append(filters['desde'])
+        if filters.get('hasta'):
+            conditions.append(f"{source.date_column} <= ?")
+            params.append(filters['hasta'])
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f"SELECT * FROM {table}{where} ORDER BY {', '.join(source.key_columns)}", params
+
+    def _open_partitions(self, source, filters, plan):
+        """Abre las particiones en paralelo con DISTRIBUTED_TIMEOUT; {hospital: (nodo, resultset)} o None
+
+        Si alguna no abre a tiempo se cierran las que sí abrieron, también las que terminen
+        de abrir después del timeout (su hilo sigue en el executor).
+        """
+        lock = threading.Lock()
+        opened_resultsets = []
+        abandoned = False
+
+        def open_partition(hospital_id):
+            node, resultset = self._open_partition(source, filters, hospital_id, plan[hospital_id])
+            with lock:
+                if resultset is not None:
+                    if abandoned:
+                        resultset.close()
+                        return None
+                    opened_resultsets.append(resultset)
+            return node, resultset
+
+        opened, status = fan_out(open_partition, list(plan), DISTRIBUTED_TIMEOUT)
+        if all(opened[hospital_id] is not None and opened[hospital_id][1] is not None for hospital_id in plan):
+            return opened
+
+        for hospital_id, state in status.items():
+            if state == 'timeout':
+                print(f"⚠️ Exportación: hospital {hospital_id} no abrió en {DISTRIBUTED_TIMEOUT:g} s")
+        with lock:
+            abandoned = True
+            for resultset in opened_resultsets:
+                resultset.close()
+        return None
+
+    def _open_partition(self, source, filters, hospital_id, nodes):
+        """Abre el cursor de un hospital en su nodo; si no responde, vía el otro nodo (linked server)"""
+        query, params = self._query(source, source.table, filters, hospital_id)
+        for node in nodes:
+            resultset = self.execute_query(query, params, node=node, stream=True)
+            if resultset is not None:
+                return node, resultset
+            print(f"⚠️ Exportación: hospital {hospital_id} sin respuesta desde {node}")
+        return None, None
+
+    def _partition_plan(self, filters):
+        """{hospital: [nodo dueño, nodo alterno]} según el filtro de hospital"""
+        nodes = list(HOSPITAL_BY_NODE)
+        return {
+            hospital_id: [owner] + [node for node in nodes if node != owner]
+            for owner, hospital_id in HOSPITAL_BY_NODE.items()
+            if filters.get('hospital_id') in (None, hospital_id)
+        }
+
+    def open_export(self, entity, filters=None):
+        """Abre la exportación de una entidad; devuelve {'success', 'export', 'nodes'} o un error
+
+        Las vistas particionadas se leen por hospital en el nodo dueño de cada partición
+        (sin pasar por el linked server), abriendo ambos cursores en paralelo.
+        """
+        filters = filters or {}
+        source = EXPORT_SOURCES.get(entity)
+        if source is None:
+            return {'success': False, 'status': 404,
+                    'error': f"Entidad desconocida: {entity} (disponibles: {', '.join(EXPORT_SOURCES)})"}
+        if (filters.get('desde') or filters.get('hasta')) and not source.date_column:
+            return {'success': False, 'status': 400, 'error': f'{entity} no tiene columna de fecha para filtrar'}
+        if filters.get('hospital_id') is not None and not source.by_hospital:
+            return {'success': False, 'status': 400, 'error': f'{entity} no tiene ID_Hospital para filtrar'}
+
+        try:
+            if source.partitioned:
+                plan = self._partition_plan(filters)
+                opened = self._open_partitions(source, filters, plan)
+                if opened is None:
+                    return {'success': False, 'status': 503,
+                            'error': f'No se pudo leer {entity} de todos los hospitales solicitados'}
+                partitions = [opened[hospital_id] for hospital_id in plan]
+            else:
+                current_node = self.detect_current_node()
+                if not current_node:
+                    return {'success': False, 'status': 503, 'error': 'No se puede conectar a ningún nodo'}
+                table = source.table or ContratosManager().get_contratos_table_name()
+                query, params = self._query(source, table, filters, filters.get('hospital_id'))
+                partitions = [(current_node, self.execute_query(query, params, node=current_node, stream=True))]
+
+            if any(partition is None or partition[1] is None for partition in partitions):
+                for partition in partitions:
+                    if partition is not None and partition[1] is not None:
+                        partition[1].close()
+                return {'success': False, 'status': 503,
+                        'error': f'No se pudo leer {entity} de todos los hospitales solicitados'}
+
+            readers = [NodeReader(node, resultset) for node, resultset in partitions]
+            columns = list(partitions[0][1].columns)
+            return {
+                'success': True,
+                'export': Export(columns, readers, source.key_columns),
+                'nodes': [node for node, _ in partitions]
+            }
+
+        except Exception as e:
+            print(f"❌ Error abriendo exportación de {entity}: {e}")
+            return {'success': False, 'status': 500, 'error': str(e)}
@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from heapq import merge
+from operator import itemgetter
+
+from dotenv import load_dotenv
+
+from .unit_of_work import pending_writes_unit
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Segundos que se espera a cada nodo en una consulta distribuida
+DISTRIBUTED_TIMEOUT = float(os.getenv('DB_DISTRIBUTED_TIMEOUT', '10'))
+
+# Executor compartido por todo el proceso para consultar los nodos en paralelo
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_executor_after_fork():
+    """Los hilos del executor no sobreviven al fork: el hijo crea el suyo en el primer uso"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def get_executor():
+    """Obtiene (o crea) el executor de consultas en paralelo"""
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('DB_FANOUT_WORKERS', '8')),
+                thread_name_prefix='db-fanout'
+            )
+        return _executor
+
+
+def fan_out(func, nodes, timeout=None):
+    """Ejecuta func(node) en todos los nodos a la vez y espera como máximo timeout segundos
+
+    Devuelve ({nodo: resultado}, {nodo: estado}) con estado 'ok', 'error' o 'timeout'.
+    Un nodo lento o caído queda con resultado None sin retrasar a los demás. Si la
+    petición ya escribió (unidad de trabajo con escrituras pendientes) los nodos se
+    consultan uno tras otro en este hilo, sobre la unidad, y timeout no aplica.
+    """
+    if pending_writes_unit() is not None:
+        return _run_inline(func, nodes)
+
+    futures = {get_executor().submit(func, node): node for node in nodes}
+    _, pending = wait(futures, timeout=timeout)
+
+    results, status = {}, {}
+    for future, node in futures.items():
+        if future in pending:
+            # El hilo termina por su cuenta (el driver también tiene timeout); no se espera
+            future.cancel()
+            results[node], status[node] = None, 'timeout'
+        elif future.exception() is not None:
+            print(f"❌ Error consultando nodo {node}: {future.exception()}")
+            results[node], status[node] = None, 'error'
+        else:
+            result = future.result()
+            results[node] = result
+            status[node] = 'ok' if result is not None else 'error'
+    return results, status
+
+
+def _run_inline(func, nodes):
+    """fan_out en el hilo actual: ve las escrituras sin confirmar y no espera sus bloqueos"""
+    results, status = {}, {}
+    for node in nodes:
+        try:
+            result = func(node)
+        except Exception as e:
+            print(f"❌ Error consultando nodo {node}: {e}")
+            results[node], status[node] = None, 'error'
+            continue
+        results[node] = result
+        status[node] = 'ok' if result is not None else 'error'
+    return results, status
+
+
+def merge_sorted(results, key_columns):
+    """Intercala (k-way merge) listas de filas ya ordenadas por key_columns
+
+    Cada nodo devuelve sus filas con ORDER BY key_columns, así que basta con mezclarlas
+    en un solo recorrido en lugar de volver a ordenar todo en Python.
+    """
+    return merge(*[rows for rows in results if rows], key=itemgetter(*key_columns))
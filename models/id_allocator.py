@@ -0,0 +1,371 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Cada cuántos segundos se vuelve a sincronizar un rango con la base (otros procesos también insertan)
+ID_ALLOCATOR_TTL = float(os.getenv('DB_ID_ALLOCATOR_TTL', '300'))
+# Tiempo que una reserva sin confirmar sobrevive a una resincronización (INSERT en curso)
+RESERVATION_TTL = 60
+# Reintentos de un INSERT cuyo ID ya fue usado por otro proceso (clave duplicada)
+DUPLICATE_ID_RETRIES = 3
+
+
+def is_duplicate_key(error):
+    """True si el error de SQL Server es una violación de PRIMARY KEY o índice único (2627/2601)"""
+    message = str(error)
+    return '(2627)' in message or '(2601)' in message or 'duplicate key' in message.lower()
+
+
+class IdRangeAllocator:
+    """IDs libres de un rango (nodo, entidad) como intervalos en memoria
+
+    Los intervalos libres se guardan de mayor a menor, así el ID libre más bajo está al
+    final de la lista y reservarlo es O(1). Sembrar el rango cuesta O(IDs usados), no
+    O(tamaño del rango), por lo que se puede ampliar ID_RANGES sin que crezca el costo.
+    """
+
+    def __init__(self, min_id, max_id, load_used, ttl=ID_ALLOCATOR_TTL, load_excluded=None):
+        self.min_id = min_id
+        self.max_id = max_id
+        # load_used() -> IDs usados en el rango, o None si la consulta falla
+        self._load_used = load_used
+        # load_excluded() -> IDs que no se deben entregar aunque la tabla no los tenga
+        # (ej. ocupados por un contrato), o None si la consulta falla
+        self._load_excluded = load_excluded
+        self.ttl = ttl
+
+        self._free = []
+        self._reserved = {}
+        # Exclusiones vigentes hasta la próxima resincronización, que las vuelve a leer
+        self._excluded = set()
+        self._seeded_at = None
+        self._lock = threading.Lock()
+
+    def _seed_locked(self):
+        used = self._load_used()
+        if used is None:
+            return False
+
+        if self._load_excluded is None:
+            self._excluded = set()
+        else:
+            excluded = self._load_excluded()
+            # Si la lectura falla se conservan las exclusiones conocidas
+            if excluded is not None:
+                self._excluded = {id_value for id_value in excluded if self.min_id <= id_value <= self.max_id}
+
+        now = time.monotonic()
+        # Las reservas recientes pueden no estar todavía en la base
+        self._reserved = {
+            id_value: reserved_at for id_value, reserved_at in self._reserved.items()
+            if now - reserved_at < RESERVATION_TTL
+        }
+        taken = sorted({id_value for id_value in used if self.min_id <= id_value <= self.max_id}
+                       | set(self._reserved) | self._excluded)
+
+        free = []
+        expected = self.min_id
+        for id_value in taken:
+            if id_value > expected:
+                free.append((expected, id_value - 1))
+            expected = id_value + 1
+        if expected <= self.max_id:
+            free.append((expected, self.max_id))
+
+        free.reverse()
+        self._free = free
+        self._seeded_at = now
+        return True
+
+    def _ensure_seeded_locked(self):
+        if self._seeded_at is None or time.monotonic() - self._seeded_at >= self.ttl:
+            if not self._seed_locked() and self._seeded_at is None:
+                raise RuntimeError(f"No se pudieron leer los IDs usados del rango {self.min_id}-{self.max_id}")
+
+    def peek(self):
+        """ID libre más bajo sin reservarlo (None si el rango está completo)"""
+        with self._lock:
+            self._ensure_seeded_locked()
+            return self._free[-1][0] if self._free else None
+
+    def available(self):
+        """Cantidad de IDs libres en el rango"""
+        with self._lock:
+            self._ensure_seeded_locked()
+            return sum(end - start + 1 for start, end in self._free)
+
+    def reserve(self):
+        """Reserva atómicamente el ID libre más bajo (None si el rango está completo)"""
+        with self._lock:
+            self._ensure_seeded_locked()
+            if not self._free:
+                return None
+
+            start, end = self._free[-1]
+            if start == end:
+                self._free.pop()
+            else:
+                self._free[-1] = (start + 1, end)
+            self._reserved[start] = time.monotonic()
+            return start
+
+    def reserve_many(self, count):
+        """Reserva atómicamente los count IDs libres más bajos; None (sin reservar) si no alcanzan"""
+        with self._lock:
+            self._ensure_seeded_locked()
+            if sum(end - start + 1 for start, end in self._free) < count:
+                return None
+
+            ids = []
+            while len(ids) < count:
+                start, end = self._free[-1]
+                taken = min(end - start + 1, count - len(ids))
+                ids.extend(range(start, start + taken))
+                if start + taken > end:
+                    self._free.pop()
+                else:
+                    self._free[-1] = (start + taken, end)
+
+            now = time.monotonic()
+            for id_value in ids:
+                self._reserved[id_value] = now
+            return ids
+
+    def _index_of(self, id_value):
+        """Posición del intervalo que contiene (o seguiría a) id_value en la lista descendente"""
+        # Búsqueda binaria sobre los inicios en orden ascendente
+        starts = [-start for start, _ in self._free]
+        return bisect_left(starts, -id_value)
+
+    def _take_locked(self, id_value):
+        """Quita id_value de los intervalos libres; False si no estaba libre"""
+        index = self._index_of(id_value)
+        if index == len(self._free):
+            return False
+        start, end = self._free[index]
+        if not start <= id_value <= end:
+            return False
+
+        pieces = []
+        if id_value < end:
+            pieces.append((id_value + 1, end))
+        if id_value > start:
+            pieces.append((start, id_value - 1))
+        self._free[index:index + 1] = pieces
+        return True
+
+    def claim(self, id_value):
+        """Marca como usado un ID elegido por fuera del allocator; False si no estaba libre"""
+        with self._lock:
+            self._ensure_seeded_locked()
+            if not self._take_locked(id_value):
+                return False
+            self._reserved[id_value] = time.monotonic()
+            return True
+
+    def release(self, id_value):
+        """Devuelve un ID al conjunto libre (INSERT fallido o registro eliminado)"""
+        if not self.min_id <= id_value <= self.max_id:
+            return
+        with self._lock:
+            self._reserved.pop(id_value, None)
+            if self._seeded_at is None or id_value in self._excluded:
+                return
+
+            index = self._index_of(id_value)
+            # Intervalo inmediatamente mayor (index - 1) y menor (index) en la lista descendente
+            upper = self._free[index - 1] if index > 0 else None
+            lower = self._free[index] if index < len(self._free) else None
+            if lower and lower[0] <= id_value <= lower[1]:
+                return  # Ya estaba libre
+
+            start = end = id_value
+            replace_from, replace_to = index, index
+            if upper and upper[0] == id_value + 1:
+                end = upper[1]
+                replace_from = index - 1
+            if lower and lower[1] == id_value - 1:
+                start = lower[0]
+                replace_to = index + 1
+            self._free[replace_from:replace_to] = [(start, end)]
+
+    def exclude(self, id_value):
+        """Saca un ID del rango hasta la próxima resincronización: ni reserve() ni release() lo devuelven"""
+        if not self.min_id <= id_value <= self.max_id:
+            return
+        with self._lock:
+            self._excluded.add(id_value)
+            if self._seeded_at is not None:
+                self._take_locked(id_value)
+
+    def unexclude(self, id_value):
+        """Quita la exclusión de un ID (su contrato se eliminó); un release() posterior lo devuelve"""
+        with self._lock:
+            self._excluded.discard(id_value)
+
+    def invalidate(self):
+        """Fuerza una resincronización con la base en el próximo uso"""
+        with self._lock:
+            if self._seeded_at is not None:
+                self._seeded_at = float('-inf')
+
+
+# Allocators compartidos por todo el proceso, uno por (nodo, entidad)
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_id_allocator(node, entity, min_id, max_id, load_used, load_excluded=None):
+    """Obtiene (o crea) el allocator de (nodo, entidad); se recrea si cambia el rango"""
+    key = (node, entity)
+    allocator = _allocators.get(key)
+    if allocator is not None and (allocator.min_id, allocator.max_id) == (min_id, max_id):
+        return allocator
+
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None or (allocator.min_id, allocator.max_id) != (min_id, max_id):
+            allocator = IdRangeAllocator(min_id, max_id, load_used, load_excluded=load_excluded)
+            _allocators[key] = allocator
+        return allocator
+
+
+class IdAllocatorMixin:
+    """Asignación de IDs por rango de nodo para los modelos con ID_RANGES
+
+    El modelo define ID_ENTITY y _used_ids_query(node, min_id, max_id) -> (query, params);
+    puede redefinir _excluded_ids(node, min_id, max_id) para sacar IDs ocupados en otra tabla.
+    """
+
+    def id_allocator(self, node):
+        range_config = self.ID_RANGES[node]
+        min_id, max_id = range_config['min'], range_config['max']
+
+        def load_used():
+            query, params = self._used_ids_query(node, min_id, max_id)
+            results = self.execute_query(query, params, node=node, compact=True)
+            return None if results is None else [row[0] for row in results.rows]
+
+        def load_excluded():
+            return self._excluded_ids(node, min_id, max_id)
+
+        return get_id_allocator(node, self.ID_ENTITY, min_id, max_id, load_used, load_excluded)
+
+    def _excluded_ids(self, node, min_id, max_id):
+        """IDs del rango que no se deben entregar aunque la tabla no los tenga; None si falla la lectura"""
+        return set()
+
+    def _node_for_id(self, id_value):
+        for node, range_config in self.ID_RANGES.items():
+            if range_config['min'] <= id_value <= range_config['max']:
+                return node
+        return None
+
+    def get_next_available_id(self, node=None):
+        """Obtiene el siguiente ID disponible según el rango del nodo (sin reservarlo)"""
+        try:
+            current_node = node or self.detect_current_node()
+            if not current_node or current_node not in self.ID_RANGES:
+                return None
+            return self.id_allocator(current_node).peek()
+        except Exception as e:
+            print(f"Error obteniendo siguiente ID ({self.ID_ENTITY}): {e}")
+            return None
+
+    def available_ids(self, node):
+        """IDs libres en el rango del nodo; None si el nodo no tiene rango o falla la lectura"""
+        try:
+            if node not in self.ID_RANGES:
+                return None
+            return self.id_allocator(node).available()
+        except Exception as e:
+            print(f"Error contando IDs libres ({self.ID_ENTITY}): {e}")
+            return None
+
+    def reserve_id(self, node):
+        """Reserva el siguiente ID del rango del nodo; None si no hay IDs o falla la lectura"""
+        try:
+            if node not in self.ID_RANGES:
+                return None
+            return self.id_allocator(node).reserve()
+        except Exception as e:
+            print(f"Error reservando ID ({self.ID_ENTITY}): {e}")
+            return None
+
+    def reserve_ids(self, node, count):
+        """Reserva count IDs del rango del nodo de una sola vez; None si no alcanzan o falla la lectura"""
+        try:
+            if node not in self.ID_RANGES:
+                return None
+            return self.id_allocator(node).reserve_many(count)
+        except Exception as e:
+            print(f"Error reservando IDs ({self.ID_ENTITY}): {e}")
+            return None
+
+    def insert_with_new_id(self, node, insert):
+        """Reserva un ID del rango y ejecuta insert(id); devuelve el ID usado o None si no hay IDs
+
+        Cada worker tiene su propio allocator, así que otro proceso puede haber usado el
+        mismo ID: ante una clave duplicada ese ID queda reservado (no se devuelve al rango),
+        se relee el rango y se reintenta con otro. Cualquier otro error libera el ID y se
+        propaga.
+        """
+        for attempt in range(DUPLICATE_ID_RETRIES + 1):
+            id_value = self.reserve_id(node)
+            if id_value is None:
+                return None
+            try:
+                insert(id_value)
+                return id_value
+            except Exception as e:
+                if is_duplicate_key(e) and attempt < DUPLICATE_ID_RETRIES:
+                    print(f"🔁 ID {id_value} ({self.ID_ENTITY}) ya usado por otro proceso, reintentando con otro")
+                    self.id_allocator(node).invalidate()
+                    continue
+                if is_duplicate_key(e):
+                    self.id_allocator(node).invalidate()
+                else:
+                    self.release_id(id_value, resync=True)
+                raise
+
+    def claim_id(self, node, id_value):
+        """Marca como usado un ID elegido manualmente dentro del rango del nodo"""
+        return self.id_allocator(node).claim(id_value)
+
+    def exclude_id(self, node, id_value):
+        """Saca del rango del nodo un ID que no sirve aunque la tabla no lo tenga (choca con otra tabla)"""
+        self.id_allocator(node).exclude(id_value)
+
+    def unexclude_id(self, id_value):
+        """Devuelve al rango (en el próximo release) un ID excluido cuyo conflicto desapareció"""
+        node = self._node_for_id(id_value)
+        if node is not None:
+            self.id_allocator(node).unexclude(id_value)
+
+    def release_id(self, id_value, resync=False):
+        """Devuelve un ID a su rango; resync=True además relee el rango (INSERT fallido)"""
+        node = self._node_for_id(id_value)
+        if node is None:
+            return
+        allocator = self.id_allocator(node)
+        allocator.release(id_value)
+        if resync:
+            allocator.invalidate()
+
+    def release_ids(self, ids, resync=False):
+        """Devuelve varios IDs a sus rangos (lote fallido o eliminado)"""
+        nodes = set()
+        for id_value in ids:
+            node = self._node_for_id(id_value)
+            if node is not None:
+                self.id_allocator(node).release(id_value)
+                nodes.add(node)
+        if resync:
+            for node in nodes:
+                self.id_allocator(node).invalidate()
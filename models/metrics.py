@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Consultas que tardan más que esto (milisegundos, de la conexión al último fetch) se registran
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '500'))
+# Imprimir una línea con los tiempos de cada consulta (solo para diagnóstico)
+DB_LOG_QUERIES = os.getenv('DB_LOG_QUERIES', 'False').lower() in ('1', 'true', 'yes')
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_LABEL_PATTERNS = (
+    re.compile(r'\{\s*CALL\s+([^\s(}]+)', re.IGNORECASE),
+    re.compile(r'\bFROM\s+([^\s(,;]+)', re.IGNORECASE),
+    re.compile(r'\b(?:INTO|UPDATE)\s+([^\s(,;]+)', re.IGNORECASE),
+)
+
+
+def statement_label(sql):
+    """Nombre corto de una consulta sin nombre: 'SELECT Vista_Paciente', 'CALL SP_Create_Paciente'
+
+    Agrupa por operación y tabla (o procedimiento) para que las métricas no crezcan
+    con cada variante del texto SQL.
+    """
+    words = sql.split(None, 1)
+    if not words:
+        return 'vacía'
+    operation = words[0].upper()
+    for pattern in _LABEL_PATTERNS:
+        match = pattern.search(sql)
+        if match:
+            name = match.group(1).split('.')[-1].strip('[]')
+            return f"CALL {name}" if operation.startswith('{') else f"{operation} {name}"
+    return operation
+
+
+class Histogram:
+    """Histograma acumulado con límites fijos (formato Prometheus)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for limit, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield limit, total
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class QueryMetrics:
+    """Tiempos de las consultas por (consulta, nodo, fase) y log de consultas lentas"""
+
+    PHASES = ('connect', 'execute', 'fetch', 'total')
+
+    def __init__(self, slow_ms=DB_SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._latency = {}
+        self._rows = {}
+        self._errors = {}
+        self._slow = {}
+        self._checkout = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement, node, connect=None, execute=None, fetch=None, rows=None, ok=True):
+        """Registra una ejecución; cada fase en segundos (None si no aplica)"""
+        phases = {'connect': connect, 'execute': execute, 'fetch': fetch}
+        total = sum(value for value in phases.values() if value is not None)
+        phases['total'] = total
+        node = node or 'desconocido'
+        key = (statement, node)
+        slow = total * 1000 >= self.slow_ms
+
+        with self._lock:
+            for phase, seconds in phases.items():
+                if seconds is not None:
+                    histogram = self._latency.get(key + (phase,))
+                    if histogram is None:
+                        histogram = self._latency[key + (phase,)] = Histogram()
+                    histogram.observe(seconds)
+            if rows is not None and rows >= 0:
+                self._rows[key] = self._rows.get(key, 0) + rows
+            if not ok:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            if slow:
+                self._slow[key] = self._slow.get(key, 0) + 1
+
+        if slow or DB_LOG_QUERIES:
+            timings = ' '.join(f"{phase}_ms={seconds * 1000:.1f}" for phase, seconds in phases.items()
+                               if seconds is not None)
+            icon = '🐢 Consulta lenta' if slow else '⏱️ Consulta'
+            print(f"{icon}: statement=\"{statement}\" node={node} {timings} rows={rows} ok={ok}")
+
+    def record_checkout(self, node, seconds):
+        """Tiempo en obtener una conexión del pool (incluye abrirla si hacía falta)"""
+        with self._lock:
+            histogram = self._checkout.get(node)
+            if histogram is None:
+                histogram = self._checkout[node] = Histogram()
+            histogram.observe(seconds)
+
+    def _render_histogram(self, lines, name, histograms):
+        for labels, histogram in histograms:
+            for limit, count in histogram.cumulative():
+                lines.append(f"{name}_bucket{_labels(**labels, le=limit)} {count}")
+            lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+    def render(self, pools=()):
+        """Métricas en formato de texto de Prometheus; pools: stats() de cada pool de conexiones
+
+        Cada proceso worker lleva sus propias métricas: todas las series llevan la etiqueta
+        pid y Prometheus (o la consulta, con sum without (pid)) las agrega entre workers.
+        """
+        pid = os.getpid()
+        with self._lock:
+            latency = [({'statement': statement, 'node': node, 'phase': phase, 'pid': pid}, histogram)
+                       for (statement, node, phase), histogram in sorted(self._latency.items())]
+            checkout = [({'node': node, 'pid': pid}, histogram) for node, histogram in sorted(self._checkout.items())]
+            counters = [
+                ('db_query_rows_total', 'Filas leídas o afectadas', dict(self._rows)),
+                ('db_query_errors_total', 'Consultas que fallaron', dict(self._errors)),
+                ('db_slow_queries_total', f'Consultas de más de {self.slow_ms:g} ms', dict(self._slow)),
+            ]
+
+        lines = [
+            '# HELP db_query_duration_seconds Latencia de las consultas por fase (connect, execute, fetch, total)',
+            '# TYPE db_query_duration_seconds histogram',
+        ]
+        self._render_histogram(lines, 'db_query_duration_seconds', latency)
+
+        for name, help_text, values in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (statement, node), value in sorted(values.items()):
+                lines.append(f"{name}{_labels(statement=statement, node=node, pid=pid)} {value}")
+
+        lines.append('# HELP db_pool_checkout_seconds Espera para obtener una conexión del pool')
+        lines.append('# TYPE db_pool_checkout_seconds histogram')
+        self._render_histogram(lines, 'db_pool_checkout_seconds', checkout)
+
+        lines.append('# HELP db_pool_connections Conexiones abiertas por nodo y estado')
+        lines.append('# TYPE db_pool_connections gauge')
+        for stats in pools:
+            for state in ('idle', 'in_use'):
+                lines.append(f"db_pool_connections{_labels(node=stats['node'], state=state, pid=pid)} {stats[state]}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Métricas de este proceso (una instancia por worker de gunicorn)
+query_metrics = QueryMetrics()
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Orden de preferencia: Quito es el nodo principal
+NODE_PRIORITY = ('quito', 'guayaquil')
+
+
+class NodeResolver:
+    """Resuelve el nodo actual una sola vez y lo mantiene en caché para todo el proceso"""
+
+    def __init__(self, probe, ttl=60, check_interval=15):
+        # probe(node) -> True si el nodo responde
+        self.probe = probe
+        self.ttl = ttl
+        self.check_interval = check_interval
+
+        self._node = None
+        self._resolved_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _is_fresh(self):
+        return (self._node is not None
+                and time.monotonic() - self._resolved_at < self.ttl)
+
+    def current(self):
+        """Nodo actual desde la caché; solo se prueba la red si la caché expiró"""
+        if self._is_fresh():
+            return self._node
+
+        with self._lock:
+            # Otro hilo pudo haber refrescado mientras esperábamos el lock
+            if self._is_fresh():
+                return self._node
+            return self._refresh_locked()
+
+    def refresh(self):
+        """Vuelve a probar los nodos en orden de prioridad"""
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        previous = self._node
+        node = None
+        for candidate in NODE_PRIORITY:
+            if self.probe(candidate):
+                node = candidate
+                break
+
+        if node != previous:
+            print(f"🔄 Nodo actual: {previous} → {node}")
+
+        # Si ningún nodo responde no se cachea el fallo; la siguiente llamada reintenta
+        self._node = node
+        self._resolved_at = time.monotonic()
+        return node
+
+    def invalidate(self):
+        """Fuerza una nueva detección en la siguiente llamada"""
+        self._resolved_at = float('-inf')
+
+    def start(self):
+        """Inicia el chequeo de salud en segundo plano (idempotente)"""
+        if self.check_interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='node-health-checker', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Error en chequeo de salud de nodos: {e}")
+
+
+# Resolver compartido por todo el proceso
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_node_resolver(probe):
+    """Obtiene (o crea) el resolver del proceso"""
+    global _resolver
+    if _resolver is not None:
+        return _resolver
+
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = NodeResolver(
+                probe,
+                ttl=float(os.getenv('DB_NODE_TTL', '60')),
+                check_interval=float(os.getenv('DB_NODE_CHECK_INTERVAL', '15'))
+            )
+        return _resolver
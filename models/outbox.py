@@ -0,0 +1,333 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from .unit_of_work import current_unit_of_work
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Fuera de Quito, las escrituras de Contratos del alta/baja de personal van a la cola
+# en vez de esperar al linked server
+CONTRATO_OUTBOX_ENABLED = os.getenv('CONTRATO_OUTBOX_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+# Archivo SQLite local con las escrituras de Contratos pendientes de enviar a Quito
+CONTRATO_OUTBOX_PATH = os.getenv('CONTRATO_OUTBOX_PATH', 'outbox/contratos.sqlite3')
+# Segundos entre revisiones de la cola (un encolado despierta al worker de inmediato)
+CONTRATO_OUTBOX_POLL = float(os.getenv('CONTRATO_OUTBOX_POLL', '2'))
+# Intentos antes de dar una entrada por fallida (y compensar si corresponde)
+CONTRATO_OUTBOX_MAX_ATTEMPTS = int(os.getenv('CONTRATO_OUTBOX_MAX_ATTEMPTS', '8'))
+# Espera base entre reintentos (se duplica en cada intento, hasta 5 minutos)
+CONTRATO_OUTBOX_RETRY = float(os.getenv('CONTRATO_OUTBOX_RETRY', '2'))
+MAX_RETRY_DELAY = 300
+# Segundos que un worker tiene tomada una entrada mientras la aplica
+LEASE_SECONDS = 120
+# Entradas retenidas (petición sin confirmar) que se revisan tras este tiempo
+HOLD_TIMEOUT = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    operation TEXT NOT NULL,
+    id_hospital INTEGER NOT NULL,
+    id_personal INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_personal ON outbox (status, id_hospital, id_personal, id);
+"""
+
+# Estados: held (esperando el commit de la petición), pending, done, failed
+OUTBOX_STATUSES = ('held', 'pending', 'done', 'failed')
+
+
+class ContratoOutbox:
+    """Cola durable (SQLite local) de escrituras de Contratos hacia el nodo Quito
+
+    Cada entrada tiene una clave de idempotencia y se aplica en orden por
+    (ID_Hospital, ID_Personal): mientras la más antigua de un personal no termine,
+    las siguientes de ese personal esperan. Varios procesos pueden compartir el archivo;
+    cada entrada se toma con un lease para que solo uno la aplique a la vez.
+    """
+
+    def __init__(self, path=CONTRATO_OUTBOX_PATH):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def _connect(self):
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    connection = sqlite3.connect(self.path, timeout=30)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(_SCHEMA)
+                    connection.close()
+                    self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def enqueue(self, operation, id_hospital, id_personal, payload=None, idempotency_key=None, held=False):
+        """Guarda una escritura pendiente; devuelve el id de la entrada
+
+        Con la misma idempotency_key no se duplica: se devuelve la entrada existente.
+        held=True la deja retenida hasta release() (el commit de la petición).
+        """
+        key = idempotency_key or f"{operation}:{id_hospital}:{id_personal}:{uuid.uuid4().hex}"
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                """INSERT OR IGNORE INTO outbox
+                   (idempotency_key, operation, id_hospital, id_personal, payload, status,
+                    next_attempt_at, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (key, operation, id_hospital, id_personal, json.dumps(payload or {}, default=str),
+                 'held' if held else 'pending', now, now)
+            )
+            entry_id = connection.execute(
+                "SELECT id FROM outbox WHERE idempotency_key = ?", (key,)
+            ).fetchone()['id']
+        connection.close()
+        if not held:
+            self.wakeup.set()
+        return entry_id
+
+    def release(self, entry_id):
+        """La petición confirmó: la entrada retenida pasa a la cola"""
+        self._set_status(entry_id, 'pending', 'held')
+        self.wakeup.set()
+
+    def discard(self, entry_id):
+        """La petición revirtió: la entrada retenida se elimina"""
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM outbox WHERE id = ? AND status = 'held'", (entry_id,))
+        connection.close()
+
+    def _set_status(self, entry_id, status, current):
+        connection = self._connect()
+        with connection:
+            connection.execute("UPDATE outbox SET status = ? WHERE id = ? AND status = ?",
+                               (status, entry_id, current))
+        connection.close()
+
+    def claim_ready(self, limit=20):
+        """Toma (con lease) la entrada más antigua lista de cada personal"""
+        now = time.time()
+        connection = self._connect()
+        claimed = []
+        with connection:
+            rows = connection.execute(
+                """SELECT o.* FROM outbox o
+                   WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+                     AND (o.lease_until IS NULL OR o.lease_until < ?)
+                     AND o.id = (SELECT MIN(p.id) FROM outbox p
+                                 WHERE p.status IN ('held', 'pending')
+                                   AND p.id_hospital = o.id_hospital AND p.id_personal = o.id_personal)
+                   ORDER BY o.id LIMIT ?""",
+                (now, now, limit)
+            ).fetchall()
+            for row in rows:
+                taken = connection.execute(
+                    """UPDATE outbox SET lease_until = ?
+                       WHERE id = ? AND status = 'pending' AND (lease_until IS NULL OR lease_until < ?)""",
+                    (now + LEASE_SECONDS, row['id'], now)
+                ).rowcount
+                if taken:
+                    claimed.append(dict(row, payload=json.loads(row['payload'])))
+        connection.close()
+        return claimed
+
+    def stale_held(self):
+        """Entradas retenidas más de HOLD_TIMEOUT (el proceso pudo caer antes del commit)"""
+        connection = self._connect()
+        rows = connection.execute(
+            "SELECT * FROM outbox WHERE status = 'held' AND created_at < ? ORDER BY id",
+            (time.time() - HOLD_TIMEOUT,)
+        ).fetchall()
+        connection.close()
+        return [dict(row, payload=json.loads(row['payload'])) for row in rows]
+
+    def mark_done(self, entry_id):
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "UPDATE outbox SET status = 'done', done_at = ?, lease_until = NULL, last_error = NULL WHERE id = ?",
+                (time.time(), entry_id)
+            )
+        connection.close()
+
+    def mark_retry(self, entry, error):
+        """Programa un reintento con espera exponencial; devuelve False si se agotaron los intentos"""
+        attempts = entry['attempts'] + 1
+        failed = attempts >= CONTRATO_OUTBOX_MAX_ATTEMPTS
+        delay = min(CONTRATO_OUTBOX_RETRY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                """UPDATE outbox SET attempts = ?, status = ?, next_attempt_at = ?, lease_until = NULL,
+                                     last_error = ?
+                   WHERE id = ?""",
+                (attempts, 'failed' if failed else 'pending', time.time() + delay, str(error), entry['id'])
+            )
+        connection.close()
+        return not failed
+
+    def status(self, limit=50):
+        """Entradas por estado y las últimas fallidas o pendientes"""
+        connection = self._connect()
+        counts = {status: 0 for status in OUTBOX_STATUSES}
+        for row in connection.execute("SELECT status, COUNT(*) AS total FROM outbox GROUP BY status"):
+            counts[row['status']] = row['total']
+        entries = [
+            dict(row) for row in connection.execute(
+                """SELECT id, idempotency_key, operation, id_hospital, id_personal, status, attempts,
+                          last_error, created_at
+                   FROM outbox WHERE status IN ('held', 'pending', 'failed') ORDER BY id DESC LIMIT ?""",
+                (limit,)
+            )
+        ]
+        connection.close()
+        return {'counts': counts, 'entries': entries}
+
+
+class OutboxWorker:
+    """Hilo que aplica en Quito las escrituras de la cola, con reintentos"""
+
+    def __init__(self, outbox, apply, compensate=None, resolve_held=None, poll_interval=CONTRATO_OUTBOX_POLL):
+        # apply(entrada) aplica la escritura (idempotente); lanza excepción si falla
+        self.outbox = outbox
+        self.apply = apply
+        # compensate(entrada) deshace el lado local cuando la entrada se da por fallida
+        self.compensate = compensate
+        # resolve_held(entrada) -> True si la escritura local se confirmó (se libera),
+        # False si no (se descarta) o None si no se sabe (sigue retenida)
+        self.resolve_held = resolve_held
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia el worker en segundo plano (idempotente; se llama en cada proceso tras el fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='contrato-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.outbox.wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"❌ Error procesando la cola de contratos: {e}")
+            self.outbox.wakeup.wait(self.poll_interval)
+            self.outbox.wakeup.clear()
+
+    def drain(self):
+        """Aplica todo lo que esté listo; devuelve cuántas entradas se confirmaron"""
+        if self.resolve_held is not None:
+            for entry in self.outbox.stale_held():
+                resolved = self.resolve_held(entry)
+                if resolved:
+                    self.outbox.release(entry['id'])
+                elif resolved is not None:
+                    self.outbox.discard(entry['id'])
+
+        applied = 0
+        while not self._stop.is_set():
+            entries = self.outbox.claim_ready()
+            if not entries:
+                return applied
+            for entry in entries:
+                try:
+                    self.apply(entry)
+                except Exception as e:
+                    if self.outbox.mark_retry(entry, e):
+                        print(f"⚠️ Contrato en cola #{entry['id']} ({entry['operation']}) falló, se reintentará: {e}")
+                    else:
+                        print(f"❌ Contrato en cola #{entry['id']} ({entry['operation']}) descartado tras "
+                              f"{CONTRATO_OUTBOX_MAX_ATTEMPTS} intentos: {e}")
+                        if self.compensate is not None:
+                            self.compensate(entry)
+                    continue
+                self.outbox.mark_done(entry['id'])
+                applied += 1
+        return applied
+
+
+# Cola compartida por todo el proceso
+contrato_outbox = ContratoOutbox()
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def queue_contrato_write(operation, id_hospital, id_personal, payload=None, idempotency_key=None):
+    """Encola una escritura de Contratos ligada a la petición; devuelve el id de la entrada
+
+    Con unidad de trabajo la entrada queda retenida hasta que la petición confirme
+    (y se descarta si revierte); sin ella pasa a la cola de inmediato.
+    """
+    unit = current_unit_of_work()
+    entry_id = contrato_outbox.enqueue(operation, id_hospital, id_personal, payload,
+                                       idempotency_key=idempotency_key, held=unit is not None)
+    if unit is not None:
+        unit.on_commit(lambda: contrato_outbox.release(entry_id))
+        unit.on_rollback(lambda: contrato_outbox.discard(entry_id))
+    print(f"📮 Contrato H={id_hospital}, P={id_personal} ({operation}) en cola #{entry_id}")
+    return entry_id
+
+
+def get_contrato_outbox_worker():
+    """Obtiene (o crea) el worker de la cola de contratos del proceso"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            from .contratos import ContratosManager
+            from .personal_medico import PersonalMedicoModel
+            contratos_manager = ContratosManager()
+            personal_model = PersonalMedicoModel()
+
+            def personal_exists(entry):
+                results = personal_model.run_statement('personal_by_id',
+                                                       (entry['id_hospital'], entry['id_personal']))
+                return None if results is None else bool(results)
+
+            def resolve_held(entry):
+                # El alta se confirmó si el personal existe; la baja, si ya no existe
+                exists = personal_exists(entry)
+                if exists is None:
+                    return None
+                return exists if entry['operation'] == 'create' else not exists
+
+            def compensate(entry):
+                # El contrato nunca llegó a Quito: se elimina el personal para no dejarlo sin contrato
+                if entry['operation'] == 'create' and entry['payload'].get('compensate'):
+                    result = personal_model.delete_personal_medico_sp(entry['id_hospital'], entry['id_personal'])
+                    if result['success']:
+                        print(f"🔄 Personal {entry['id_personal']} eliminado: su contrato no se pudo crear en Quito")
+
+            _worker = OutboxWorker(contrato_outbox, contratos_manager.apply_queued_write,
+                                   compensate=compensate, resolve_held=resolve_held)
+        return _worker
@@ -1,8 +1,51 @@
 from .base import DatabaseConnection
+from .rows import ResultSet, format_date
+from .pagination import KeysetPage
+from .stats import invalidate_stats
+from .id_allocator import IdAllocatorMixin, DUPLICATE_ID_RETRIES, is_duplicate_key
+from .search_index import get_search_index
+from .changes import record_change
+from .unit_of_work import after_commit
 
-class PacientesModel(DatabaseConnection):
+# Máximo de pacientes por lote (un solo parámetro con valores de tabla por llamada)
+MAX_BATCH_SIZE = 500
+
+# Campos que debe traer cada paciente al crear o actualizar
+PACIENTE_FIELDS = ('Nombre', 'Apellido', 'Direccion', 'FechaNacimiento', 'Sexo', 'Telefono')
+
+class PacientesModel(IdAllocatorMixin, DatabaseConnection):
     """Modelo para manejar operaciones con Vista_Paciente (particionada actualizable)"""
     
+    # Clave de orden para la paginación por cursor
+    PAGE_KEY = ('ID_Hospital', 'ID_Paciente')
+    # Entidad para el allocator de IDs por rango de nodo
+    ID_ENTITY = 'paciente'
+    # Consultas frecuentes con cursor preparado por conexión (ver run_statement)
+    STATEMENTS = {
+        'paciente_by_id': """
+            SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
+                   FechaNacimiento, Sexo, Teléfono 
+            FROM Vista_Paciente 
+            WHERE ID_Hospital = ? AND ID_Paciente = ?
+        """,
+        'pacientes_by_hospital': """
+            SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
+                   FechaNacimiento, Sexo, Teléfono 
+            FROM Vista_Paciente 
+            WHERE ID_Hospital = ?
+        """,
+        'search_pacientes': """
+            SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
+                   FechaNacimiento, Sexo, Teléfono 
+            FROM Vista_Paciente 
+            WHERE ID_Hospital = ? AND (
+                Nombre LIKE ? OR Apellido LIKE ? OR 
+                CAST(ID_Paciente AS VARCHAR) LIKE ?
+            )
+            ORDER BY ID_Paciente
+        """
+    }
+    
     def __init__(self):
         super().__init__()
         # Configuración de rangos de ID por nodo
@@ -11,50 +54,30 @@ class PacientesModel(DatabaseConnection):
             'guayaquil': {'min': 21, 'max': 40}
         }
     
-    def get_next_available_id(self, node=None):
-        """Obtiene el siguiente ID disponible según el rango del nodo"""
-        try:
-            current_node = node or self.detect_current_node()
-            if not current_node or current_node not in self.ID_RANGES:
-                return None
-            
-            range_config = self.ID_RANGES[current_node]
-            hospital_id = 1 if current_node == 'quito' else 2
-            
-            # Buscar IDs ocupados en el rango
-            query = """
-                SELECT ID_Paciente 
-                FROM Vista_Paciente 
-                WHERE ID_Hospital = ? AND ID_Paciente BETWEEN ? AND ?
-                ORDER BY ID_Paciente
-            """
-            
-            params = (hospital_id, range_config['min'], range_config['max'])
-            results = self.execute_query(query, params, node=current_node)
-            
-            if results is None:
-                return range_config['min']  # Si hay error, usar el mínimo
-            
-            # Encontrar el primer ID disponible
-            occupied_ids = {row['ID_Paciente'] for row in results}
-            
-            for id_candidate in range(range_config['min'], range_config['max'] + 1):
-                if id_candidate not in occupied_ids:
-                    return id_candidate
-            
-            return None  # Rango completo
-            
-        except Exception as e:
-            print(f"Error obteniendo siguiente ID paciente: {e}")
-            return None
+    def _used_ids_query(self, node, min_id, max_id):
+        """IDs de paciente ocupados en el rango del nodo (siembra del allocator)"""
+        hospital_id = 1 if node == 'quito' else 2
+        query = """
+            SELECT ID_Paciente 
+            FROM Vista_Paciente 
+            WHERE ID_Hospital = ? AND ID_Paciente BETWEEN ? AND ?
+        """
+        return query, (hospital_id, min_id, max_id)
     
     def get_hospital_id_by_node(self, node=None):
         """Obtiene el ID del hospital según el nodo"""
         current_node = node or self.detect_current_node()
         return 1 if current_node == 'quito' else 2
     
-    def get_all_pacientes(self, node=None):
-        """Obtiene todos los pacientes desde Vista_Paciente (solo del hospital local)"""
+    def get_all_pacientes(self, node=None, compact=False, stream=False, after=None, limit=None, keys=None):
+        """Obtiene todos los pacientes desde Vista_Paciente (solo del hospital local)
+
+        Con compact=True 'pacientes' es un ResultSet: los alias sin tilde y el formato
+        de fecha se aplican al leer cada fila en lugar de modificar un dict por fila.
+        Con stream=True es un StreamingResultSet y 'total' es None.
+        after=(ID_Hospital, ID_Paciente) y limit paginan por cursor; 'page' permite
+        calcular el cursor siguiente. keys limita el resultado a esas claves (delta de cambios).
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -68,19 +91,21 @@ class PacientesModel(DatabaseConnection):
             
             # 🏥 FILTRO LOCAL: Solo mostrar pacientes del hospital local
             hospital_id = self.get_hospital_id_by_node(current_node)
+            page = KeysetPage(self.PAGE_KEY, after, limit, keys)
             
-            query = """
+            query = f"""
                 SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
                        FechaNacimiento, Sexo, Teléfono 
                 FROM Vista_Paciente 
-                WHERE ID_Hospital = ?
-                ORDER BY ID_Paciente
+                WHERE ID_Hospital = ?{page.where()}
+                {page.order_by()}
             """
             
-            results = self.execute_query(query, (hospital_id,), node=current_node)
+            results = self.execute_query(query, (hospital_id, *page.params()), node=current_node,
+                                         compact=compact, stream=stream)
 
             # Debug
-            if results and len(results) > 0:
+            if not stream and results and len(results) > 0:
                 print(f"🔍 DEBUG Pacientes: {len(results)} registros del hospital {hospital_id} en nodo {current_node}")
 
             if results is None:
@@ -92,25 +117,31 @@ class PacientesModel(DatabaseConnection):
                     'total': 0
                 }
             
-            # Formatear fechas y mapear campos con tilde
-            for paciente in results:
-                # Mapear campos con tilde a nombres sin tilde para frontend
-                if 'Dirección' in paciente:
-                    paciente['Direccion'] = paciente['Dirección']
-                if 'Teléfono' in paciente:
-                    paciente['Telefono'] = paciente['Teléfono']
+            if isinstance(results, ResultSet):
+                # Los alias sin tilde y el formato de fecha se aplican al leer cada fila
+                results.alias('Direccion', 'Dirección').alias('Telefono', 'Teléfono')
+                results.convert('FechaNacimiento', format_date)
+            else:
+                # Formatear fechas y mapear campos con tilde
+                for paciente in results:
+                    # Mapear campos con tilde a nombres sin tilde para frontend
+                    if 'Dirección' in paciente:
+                        paciente['Direccion'] = paciente['Dirección']
+                    if 'Teléfono' in paciente:
+                        paciente['Telefono'] = paciente['Teléfono']
                     
-                # Formatear fecha
-                if paciente.get('FechaNacimiento'):
-                    fecha = paciente['FechaNacimiento']
-                    if hasattr(fecha, 'strftime'):
-                        paciente['FechaNacimiento'] = fecha.strftime('%d/%m/%Y')
+                    # Formatear fecha
+                    if paciente.get('FechaNacimiento'):
+                        fecha = paciente['FechaNacimiento']
+                        if hasattr(fecha, 'strftime'):
+                            paciente['FechaNacimiento'] = fecha.strftime('%d/%m/%Y')
             
             return {
                 'success': True,
                 'pacientes': results,
                 'node': current_node,
-                'total': len(results),
+                'total': None if stream else len(results),
+                'page': page,
                 'error': None
             }
             
@@ -130,13 +161,7 @@ class PacientesModel(DatabaseConnection):
             if not current_node:
                 return None
             
-            query = """
-                SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
-                       FechaNacimiento, Sexo, Teléfono 
-                FROM Vista_Paciente 
-                WHERE ID_Hospital = ? AND ID_Paciente = ?
-            """
-            results = self.execute_query(query, (id_hospital, id_paciente), node=current_node)
+            results = self.run_statement('paciente_by_id', (id_hospital, id_paciente), node=current_node)
             
             if results and len(results) > 0:
                 paciente = results[0]
@@ -178,39 +203,38 @@ class PacientesModel(DatabaseConnection):
                     'error': 'No se puede conectar a ningún nodo'
                 }
             
-            # Auto-asignar ID_Paciente según el rango del nodo
-            next_id = self.get_next_available_id(current_node)
-            if next_id is None:
-                range_config = self.ID_RANGES.get(current_node, {})
-                return {
-                    'success': False,
-                    'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
-                }
-            
             # Auto-asignar ID_Hospital según el nodo
             hospital_id = 1 if current_node == 'quito' else 2
             
-            # Usar stored procedure con transacción distribuida
-            connection = self.get_connection()
-            if not connection:
+            def insert(next_id):
+                # Usar stored procedure con transacción distribuida
+                with self.connection(current_node) as connection:
+                    cursor = connection.cursor()
+                
+                    print(f"🔍 DEBUG: Creando paciente ID={next_id}, Hospital={hospital_id}, Nodo={current_node}")
+                
+                    self.execute_cursor(cursor, "{CALL SP_Create_Paciente (?, ?, ?, ?, ?, ?, ?, ?)}", 
+                                              (hospital_id, next_id, paciente_data['Nombre'],
+                                               paciente_data['Apellido'], paciente_data['Direccion'],
+                                               paciente_data['FechaNacimiento'], paciente_data['Sexo'],
+                                               paciente_data['Telefono']), node=current_node)
+                
+                    connection.commit()
+                    cursor.close()
+            
+            # Auto-asignar ID_Paciente según el rango del nodo (reservado para este INSERT)
+            next_id = self.insert_with_new_id(current_node, insert)
+            if next_id is None:
+                range_config = self.ID_RANGES.get(current_node, {})
                 return {
                     'success': False,
-                    'error': 'No se pudo establecer conexión'
+                    'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
                 }
-                
-            cursor = connection.cursor()
-            
-            print(f"🔍 DEBUG: Creando paciente ID={next_id}, Hospital={hospital_id}, Nodo={current_node}")
             
-            cursor.execute("{CALL SP_Create_Paciente (?, ?, ?, ?, ?, ?, ?, ?)}", 
-                         (hospital_id, next_id, paciente_data['Nombre'],
-                          paciente_data['Apellido'], paciente_data['Direccion'],
-                          paciente_data['FechaNacimiento'], paciente_data['Sexo'],
-                          paciente_data['Telefono']))
-            
-            connection.commit()
-            cursor.close()
-            connection.close()
+            # Estadísticas e índice se actualizan cuando la petición confirme
+            after_commit(invalidate_stats)
+            after_commit(lambda: self._refresh_search_entry(hospital_id, next_id, current_node))
+            record_change('pacientes', hospital_id, next_id)
             
             return {
                 'success': True,
@@ -237,26 +261,22 @@ class PacientesModel(DatabaseConnection):
                 }
             
             # Usar stored procedure con transacción distribuida
-            connection = self.get_connection()
-            if not connection:
-                return {
-                    'success': False,
-                    'error': 'No se pudo establecer conexión'
-                }
-                
-            cursor = connection.cursor()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+            
+                print(f"🔧 DEBUG: Actualizando paciente Hospital={id_hospital}, ID={id_paciente}")
             
-            print(f"🔧 DEBUG: Actualizando paciente Hospital={id_hospital}, ID={id_paciente}")
+                self.execute_cursor(cursor, "{CALL SP_Update_Paciente (?, ?, ?, ?, ?, ?, ?, ?)}", 
+                                          (id_hospital, id_paciente, paciente_data['Nombre'],
+                                           paciente_data['Apellido'], paciente_data['Direccion'],
+                                           paciente_data['FechaNacimiento'], paciente_data['Sexo'],
+                                           paciente_data['Telefono']), node=current_node)
             
-            cursor.execute("{CALL SP_Update_Paciente (?, ?, ?, ?, ?, ?, ?, ?)}", 
-                         (id_hospital, id_paciente, paciente_data['Nombre'],
-                          paciente_data['Apellido'], paciente_data['Direccion'],
-                          paciente_data['FechaNacimiento'], paciente_data['Sexo'],
-                          paciente_data['Telefono']))
+                connection.commit()
+                cursor.close()
             
-            connection.commit()
-            cursor.close()
-            connection.close()
+            after_commit(lambda: self._refresh_search_entry(id_hospital, id_paciente, current_node))
+            record_change('pacientes', id_hospital, id_paciente)
             
             return {
                 'success': True,
@@ -281,24 +301,22 @@ class PacientesModel(DatabaseConnection):
                 }
             
             # Usar stored procedure con transacción distribuida
-            connection = self.get_connection()
-            if not connection:
-                return {
-                    'success': False,
-                    'error': 'No se pudo establecer conexión'
-                }
-                
-            cursor = connection.cursor()
-            
-            print(f"🗑️ DEBUG: Eliminando paciente Hospital={id_hospital}, ID={id_paciente}")
-            
-            cursor.execute("{CALL SP_Delete_Paciente (?, ?)}", (id_hospital, id_paciente))
-            # Forzar la propagación de errores de SQL Server
-            while cursor.nextset():
-                pass
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with self.connection(current_node) as connection:
+                cursor = connection.cursor()
+            
+                print(f"🗑️ DEBUG: Eliminando paciente Hospital={id_hospital}, ID={id_paciente}")
+            
+                self.execute_cursor(cursor, "{CALL SP_Delete_Paciente (?, ?)}", (id_hospital, id_paciente), node=current_node)
+                # Forzar la propagación de errores de SQL Server
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                cursor.close()
+            # El ID se libera solo si el DELETE se confirma (si no, sigue en uso)
+            after_commit(invalidate_stats)
+            after_commit(lambda: self.release_id(id_paciente))
+            after_commit(lambda: self.search_index(current_node).remove((id_hospital, id_paciente)))
+            record_change('pacientes', id_hospital, id_paciente)
             return {
                 'success': True,
                 'message': 'Paciente eliminado exitosamente'
@@ -318,55 +336,322 @@ class PacientesModel(DatabaseConnection):
                 'error': 'No se pudo eliminar el paciente. Puede que esté siendo referenciado en otra tabla.'
             }
     
-    def search_pacientes(self, search_term, node=None):
-        """Busca pacientes por nombre, apellido o ID (solo del hospital local como Experiencia)"""
+    def _validate_batch(self, pacientes, fields=PACIENTE_FIELDS, allow_empty=False, keys=False):
+        """Errores por fila antes de ir a la base: {fila: error}"""
+        errors = {}
+        for fila, paciente_data in enumerate(pacientes):
+            if not isinstance(paciente_data, dict):
+                errors[fila] = 'Cada paciente debe ser un objeto JSON'
+                continue
+            if keys and not all(isinstance(paciente_data.get(field), int)
+                                for field in ('ID_Hospital', 'ID_Paciente')):
+                errors[fila] = 'ID_Hospital e ID_Paciente deben ser enteros'
+                continue
+            for field in fields:
+                if field not in paciente_data or (not allow_empty and not paciente_data[field]):
+                    errors[fila] = f'Campo requerido faltante: {field}'
+                    break
+        return errors
+    
+    def _batch_result(self, pacientes, errors, message):
+        """Respuesta por lote con un resultado por fila (en el orden recibido)"""
+        results = []
+        for fila, paciente in enumerate(pacientes):
+            error = errors.get(fila)
+            results.append({
+                'fila': fila,
+                'success': not errors,
+                'id_hospital': paciente.get('ID_Hospital') if isinstance(paciente, dict) else None,
+                'id_paciente': paciente.get('ID_Paciente') if isinstance(paciente, dict) else None,
+                'error': error or ('No se aplicó: el lote tiene filas con error' if errors else None)
+            })
+        if errors:
+            return {
+                'success': False,
+                'error': f'{len(errors)} de {len(pacientes)} pacientes con error; no se aplicó ningún cambio',
+                'results': results
+            }
+        return {
+            'success': True,
+            'message': message,
+            'total': len(pacientes),
+            'results': results
+        }
+    
+    def _check_batch_size(self, pacientes):
+        if not isinstance(pacientes, list) or not pacientes:
+            return 'Se requiere una lista de pacientes'
+        if len(pacientes) > MAX_BATCH_SIZE:
+            return f'Máximo {MAX_BATCH_SIZE} pacientes por lote'
+        return None
+    
+    def _execute_batch_procedure(self, procedure, rows, node):
+        """Ejecuta un SP de lote con un parámetro con valores de tabla; devuelve {fila: error}"""
+        with self.connection(node) as connection:
+            cursor = connection.cursor()
+            try:
+                self.execute_cursor(cursor, f"{{CALL {procedure} (?)}}", (rows,), node=node)
+                # El SP devuelve una fila por paciente: Fila, ID_Hospital, ID_Paciente, Error
+                errors = {row[0]: row[3] for row in cursor.fetchall() if row[3]}
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                return errors
+            finally:
+                cursor.close()
+    
+    def _rebuild_search_index(self, node):
+        """Tras un lote se relee el índice completo (una consulta) en lugar de fila por fila"""
+        index = self.search_index(node)
+        if index.ready:
+            index.start_rebuild(lambda: self._load_search_rows(node))
+    
+    def create_pacientes_batch(self, pacientes, node=None):
+        """Crea varios pacientes con SP_Create_Pacientes_Lote en una sola transacción distribuida
+        
+        Los IDs se reservan de una vez en el rango del nodo. El lote es todo o nada:
+        si alguna fila falla, no se crea ninguna y cada fila indica su error.
+        """
+        ids = None
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
                 return {
                     'success': False,
-                    'error': 'No se puede conectar a ningún nodo',
-                    'pacientes': []
+                    'error': 'No se puede conectar a ningún nodo'
                 }
             
-            # 🏥 FILTRO LOCAL: Solo mostrar pacientes del hospital local (como Experiencia)
+            size_error = self._check_batch_size(pacientes)
+            if size_error:
+                return {'success': False, 'error': size_error}
+            
+            errors = self._validate_batch(pacientes)
+            if errors:
+                return self._batch_result(pacientes, errors, None)
+            
             hospital_id = self.get_hospital_id_by_node(current_node)
+            for attempt in range(DUPLICATE_ID_RETRIES + 1):
+                ids = self.reserve_ids(current_node, len(pacientes))
+                if ids is None:
+                    range_config = self.ID_RANGES.get(current_node, {})
+                    return {
+                        'success': False,
+                        'error': f'No hay {len(pacientes)} IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
+                    }
+                
+                rows = [
+                    (fila, hospital_id, id_paciente, paciente_data['Nombre'], paciente_data['Apellido'],
+                     paciente_data['Direccion'], paciente_data['FechaNacimiento'], paciente_data['Sexo'],
+                     paciente_data['Telefono'])
+                    for fila, (id_paciente, paciente_data) in enumerate(zip(ids, pacientes))
+                ]
+                
+                print(f"➕ DEBUG: Creando lote de {len(rows)} pacientes (IDs {ids[0]}-{ids[-1]}), Nodo={current_node}")
+                errors = self._execute_batch_procedure('SP_Create_Pacientes_Lote', rows, current_node)
+                duplicated = {fila for fila, error in errors.items() if is_duplicate_key(error)}
+                if not duplicated or attempt == DUPLICATE_ID_RETRIES:
+                    break
+                
+                # IDs ya usados por otro proceso: quedan reservados; el resto vuelve al rango
+                print(f"🔁 {len(duplicated)} IDs del lote ya usados por otro proceso, reintentando con otros")
+                self.release_ids([id_paciente for fila, id_paciente in enumerate(ids) if fila not in duplicated])
+                self.id_allocator(current_node).invalidate()
+                ids = None
+            
+            created = [dict(paciente_data, ID_Hospital=hospital_id, ID_Paciente=id_paciente)
+                       for id_paciente, paciente_data in zip(ids, pacientes)]
+            if errors:
+                self.release_ids(ids, resync=True)
+                return self._batch_result(created, errors, None)
+            
+            after_commit(invalidate_stats)
+            after_commit(lambda: self._rebuild_search_index(current_node))
+            for paciente_data in created:
+                record_change('pacientes', paciente_data['ID_Hospital'], paciente_data['ID_Paciente'])
+            return self._batch_result(
+                created, {}, f'{len(created)} pacientes creados exitosamente en nodo {current_node}'
+            )
             
-            query = """
-                SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, 
-                       FechaNacimiento, Sexo, Teléfono 
-                FROM Vista_Paciente 
-                WHERE ID_Hospital = ? AND (
-                    Nombre LIKE ? OR Apellido LIKE ? OR 
-                    CAST(ID_Paciente AS VARCHAR) LIKE ?
-                )
-                ORDER BY ID_Paciente
-            """
+        except Exception as e:
+            print(f"Error en SP_Create_Pacientes_Lote: {e}")
+            if ids is not None:
+                self.release_ids(ids, resync=True)
+            return {
+                'success': False,
+                'error': f'Error al crear el lote de pacientes: {str(e)}'
+            }
+    
+    def update_pacientes_batch(self, pacientes, node=None):
+        """Actualiza varios pacientes con SP_Update_Pacientes_Lote (todo o nada, resultado por fila)"""
+        try:
+            current_node = node or self.detect_current_node()
+            if not current_node:
+                return {
+                    'success': False,
+                    'error': 'No se puede conectar a ningún nodo'
+                }
             
-            search_pattern = f"%{search_term}%"
-            results = self.execute_query(query, (hospital_id, search_pattern, search_pattern, search_pattern), node=current_node)
+            size_error = self._check_batch_size(pacientes)
+            if size_error:
+                return {'success': False, 'error': size_error}
             
-            if results is None:
+            errors = self._validate_batch(pacientes, allow_empty=True, keys=True)
+            if errors:
+                return self._batch_result(pacientes, errors, None)
+            
+            rows = [
+                (fila, paciente_data['ID_Hospital'], paciente_data['ID_Paciente'],
+                 paciente_data['Nombre'], paciente_data['Apellido'], paciente_data['Direccion'],
+                 paciente_data['FechaNacimiento'], paciente_data['Sexo'], paciente_data['Telefono'])
+                for fila, paciente_data in enumerate(pacientes)
+            ]
+            
+            print(f"🔧 DEBUG: Actualizando lote de {len(rows)} pacientes, Nodo={current_node}")
+            errors = self._execute_batch_procedure('SP_Update_Pacientes_Lote', rows, current_node)
+            if errors:
+                return self._batch_result(pacientes, errors, None)
+            
+            after_commit(lambda: self._rebuild_search_index(current_node))
+            for paciente_data in pacientes:
+                record_change('pacientes', paciente_data['ID_Hospital'], paciente_data['ID_Paciente'])
+            return self._batch_result(pacientes, {}, f'{len(pacientes)} pacientes actualizados exitosamente')
+            
+        except Exception as e:
+            print(f"Error en SP_Update_Pacientes_Lote: {e}")
+            return {
+                'success': False,
+                'error': f'Error al actualizar el lote de pacientes: {str(e)}'
+            }
+    
+    def delete_pacientes_batch(self, pacientes, node=None):
+        """Elimina varios pacientes ({ID_Hospital, ID_Paciente}) con SP_Delete_Pacientes_Lote"""
+        try:
+            current_node = node or self.detect_current_node()
+            if not current_node:
                 return {
                     'success': False,
-                    'error': 'Error en la búsqueda',
+                    'error': 'No se puede conectar a ningún nodo'
+                }
+            
+            size_error = self._check_batch_size(pacientes)
+            if size_error:
+                return {'success': False, 'error': size_error}
+            
+            errors = self._validate_batch(pacientes, fields=(), keys=True)
+            if errors:
+                return self._batch_result(pacientes, errors, None)
+            
+            rows = [(fila, paciente_data['ID_Hospital'], paciente_data['ID_Paciente'])
+                    for fila, paciente_data in enumerate(pacientes)]
+            
+            print(f"🗑️ DEBUG: Eliminando lote de {len(rows)} pacientes, Nodo={current_node}")
+            errors = self._execute_batch_procedure('SP_Delete_Pacientes_Lote', rows, current_node)
+            if errors:
+                return self._batch_result(pacientes, errors, None)
+            
+            after_commit(invalidate_stats)
+            after_commit(lambda: self.release_ids([row[2] for row in rows]))
+            after_commit(lambda: self._remove_search_entries(rows, current_node))
+            for _, id_hospital, id_paciente in rows:
+                record_change('pacientes', id_hospital, id_paciente)
+            return self._batch_result(pacientes, {}, f'{len(pacientes)} pacientes eliminados exitosamente')
+            
+        except Exception as e:
+            print(f"Error en SP_Delete_Pacientes_Lote: {e}")
+            # Mensaje genérico para el usuario, error real solo en terminal
+            return {
+                'success': False,
+                'error': 'No se pudo eliminar el lote de pacientes. Puede que alguno esté siendo referenciado en otra tabla.'
+            }
+    
+    def search_index(self, node):
+        """Índice de búsqueda en memoria de los pacientes del hospital del nodo"""
+        return get_search_index('pacientes', node, self.PAGE_KEY, ('Nombre', 'Apellido', 'ID_Paciente'),
+                                change_entity='pacientes')
+    
+    def _format_search_row(self, paciente):
+        """Mapea campos con tilde a nombres sin tilde y formatea la fecha para el frontend"""
+        if 'Dirección' in paciente:
+            paciente['Direccion'] = paciente['Dirección']
+        if 'Teléfono' in paciente:
+            paciente['Telefono'] = paciente['Teléfono']
+        paciente['FechaNacimiento'] = format_date(paciente.get('FechaNacimiento'))
+        return paciente
+    
+    def _load_search_rows(self, node, id_paciente=None):
+        """Pacientes del hospital del nodo (o uno solo) con el formato de search_pacientes"""
+        hospital_id = self.get_hospital_id_by_node(node)
+        if id_paciente is not None:
+            results = self.run_statement('paciente_by_id', (hospital_id, id_paciente), node=node)
+        else:
+            results = self.run_statement('pacientes_by_hospital', (hospital_id,), node=node)
+        if results is None:
+            return None
+        return [self._format_search_row(paciente) for paciente in results]
+    
+    def warm_search_index(self, node=None):
+        """Construye el índice de búsqueda en segundo plano (al iniciar la aplicación)"""
+        current_node = node or self.detect_current_node()
+        if current_node:
+            self.search_index(current_node).start_rebuild(lambda: self._load_search_rows(current_node))
+    
+    def _remove_search_entries(self, rows, node):
+        """Quita del índice los pacientes de un lote eliminado (filas (fila, ID_Hospital, ID_Paciente))"""
+        index = self.search_index(node)
+        for _, id_hospital, id_paciente in rows:
+            index.remove((id_hospital, id_paciente))
+    
+    def _refresh_search_entry(self, id_hospital, id_paciente, node):
+        """Actualiza en el índice un paciente recién creado, modificado o eliminado"""
+        index = self.search_index(node)
+        if not index.ready or id_hospital != self.get_hospital_id_by_node(node):
+            return
+        rows = self._load_search_rows(node, id_paciente)
+        if rows:
+            index.upsert(rows[0])
+        elif rows is not None:
+            index.remove((id_hospital, id_paciente))
+        else:
+            # No se pudo leer la fila: reconstruir para no dejar el índice desactualizado
+            index.start_rebuild(lambda: self._load_search_rows(node))
+    
+    def search_pacientes(self, search_term, node=None):
+        """Busca pacientes por nombre, apellido o ID (solo del hospital local como Experiencia)
+
+        Responde desde el índice en memoria; solo consulta SQL mientras el índice está frío.
+        """
+        try:
+            current_node = node or self.detect_current_node()
+            if not current_node:
+                return {
+                    'success': False,
+                    'error': 'No se puede conectar a ningún nodo',
                     'pacientes': []
                 }
             
-            # Formatear fechas y mapear campos con tilde
-            if isinstance(results, list):
-                for paciente in results:
-                    # Mapear campos con tilde a nombres sin tilde para frontend
-                    if 'Dirección' in paciente:
-                        paciente['Direccion'] = paciente['Dirección']
-                    if 'Teléfono' in paciente:
-                        paciente['Telefono'] = paciente['Teléfono']
-                        
-                    # Formatear fecha
-                    if paciente.get('FechaNacimiento'):
-                        fecha = paciente['FechaNacimiento']
-                        if hasattr(fecha, 'strftime'):
-                            paciente['FechaNacimiento'] = fecha.strftime('%d/%m/%Y')
+            # 🏥 FILTRO LOCAL: Solo mostrar pacientes del hospital local (como Experiencia)
+            hospital_id = self.get_hospital_id_by_node(current_node)
+            
+            index = self.search_index(current_node)
+            if index.is_stale():
+                index.start_rebuild(lambda: self._load_search_rows(current_node))
+            results = index.search(search_term)
+            
+            if results is None:
+                # Índice frío: esta búsqueda va por SQL mientras se construye
+                search_pattern = f"%{search_term}%"
+                results = self.run_statement('search_pacientes',
+                                             (hospital_id, search_pattern, search_pattern, search_pattern),
+                                             node=current_node)
+                
+                if results is None:
+                    return {
+                        'success': False,
+                        'error': 'Error en la búsqueda',
+                        'pacientes': []
+                    }
+                
+                results = [self._format_search_row(paciente) for paciente in results]
             
             return {
                 'success': True,
@@ -0,0 +1,100 @@
+import json
+
+# Máximo de filas por página que acepta la API
+MAX_PAGE_SIZE = 500
+
+
+class KeysetPage:
+    """Página por cursor (keyset): filas con clave mayor que 'after', ordenadas por la clave
+
+    A diferencia de OFFSET, el costo no crece con el número de página: el servidor
+    arranca directamente después de la última clave vista.
+    """
+
+    def __init__(self, key_columns, after=None, limit=None, keys=None):
+        self.key_columns = tuple(key_columns)
+        self.after = tuple(after) if after else None
+        self.limit = limit
+        # Claves (o prefijos de clave) a las que se limita la consulta, ej. las filas de un delta
+        self.keys = [tuple(key) for key in keys] if keys is not None else None
+
+        if self.after is not None and len(self.after) != len(self.key_columns):
+            raise ValueError(
+                f"El cursor debe tener {len(self.key_columns)} valores: {', '.join(self.key_columns)}"
+            )
+        if self.keys is not None and any(not 0 < len(key) <= len(self.key_columns) for key in self.keys):
+            raise ValueError(f"Cada clave debe tener entre 1 y {len(self.key_columns)} valores")
+
+    def _condition(self, columns, after):
+        """(c1, c2, ...) > (a1, a2, ...) expresado sin comparación de tuplas (T-SQL no la soporta)"""
+        column, rest = columns[0], columns[1:]
+        if not rest:
+            return f"{column} > ?", [after[0]]
+        inner, inner_params = self._condition(rest, after[1:])
+        return f"({column} > ? OR ({column} = ? AND {inner}))", [after[0], after[0], *inner_params]
+
+    def _keys_condition(self):
+        """(c1 = ? AND c2 = ?) OR ... para cada clave; una lista vacía no devuelve filas"""
+        if not self.keys:
+            return "1 = 0", []
+        conditions, params = [], []
+        for key in self.keys:
+            conditions.append('(' + ' AND '.join(f"{column} = ?" for column in self.key_columns[:len(key)]) + ')')
+            params.extend(key)
+        return f"({' OR '.join(conditions)})", params
+
+    def where(self, prefix='AND'):
+        """Condición para agregar al WHERE (vacía si no hay cursor ni claves)"""
+        conditions = []
+        if self.after is not None:
+            conditions.append(self._condition(self.key_columns, self.after)[0])
+        if self.keys is not None:
+            conditions.append(self._keys_condition()[0])
+        if not conditions:
+            return ''
+        return f" {prefix} {' AND '.join(conditions)}"
+
+    def order_by(self):
+        """ORDER BY por la clave y, si hay límite, OFFSET/FETCH para cortar la página"""
+        clause = f"ORDER BY {', '.join(self.key_columns)}"
+        if self.limit:
+            clause += " OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY"
+        return clause
+
+    def params(self):
+        """Parámetros del WHERE seguidos del límite, en el orden en que aparecen en el SQL"""
+        params = []
+        if self.after is not None:
+            params.extend(self._condition(self.key_columns, self.after)[1])
+        if self.keys is not None:
+            params.extend(self._keys_condition()[1])
+        if self.limit:
+            params.append(self.limit)
+        return params
+
+    def next_after(self, last_row, count):
+        """Cursor de la página siguiente, o None si esta fue la última"""
+        if not self.limit or count < self.limit or last_row is None:
+            return None
+        return [last_row[column] for column in self.key_columns]
+
+
+def parse_page_args(args):
+    """Lee 'after' (arreglo JSON) y 'limit' de los parámetros de la URL
+
+    Devuelve (after, limit); lanza ValueError si alguno no es válido.
+    """
+    after = args.get('after')
+    if after:
+        after = json.loads(after)
+        if not isinstance(after, list):
+            raise ValueError("El parámetro 'after' debe ser un arreglo JSON, ej. [1, 20]")
+
+    limit = args.get('limit')
+    if limit:
+        limit = int(limit)
+        if limit <= 0:
+            raise ValueError("El parámetro 'limit' debe ser mayor que cero")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    return after or None, limit or None
@@ -1,8 +1,39 @@
+import sqlite3
+import threading
+
 from .base import DatabaseConnection
+from .pagination import KeysetPage
+from .stats import invalidate_stats
+from .id_allocator import IdAllocatorMixin
+from .search_index import get_search_index
+from .changes import record_change
+from .unit_of_work import after_commit
+from .contratos import CONTRATOS_NODE
+from .outbox import CONTRATO_OUTBOX_ENABLED, queue_contrato_write
+from .saga import Saga, SagaStep, SagaError
 
-class PersonalMedicoModel(DatabaseConnection):
+class PersonalMedicoModel(IdAllocatorMixin, DatabaseConnection):
     """Modelo para manejar operaciones con la vista Vista_INF_Personal"""
     
+    # Clave de orden para la paginación por cursor
+    PAGE_KEY = ('ID_Hospital', 'ID_Personal')
+    # Entidad para el allocator de IDs por rango de nodo
+    ID_ENTITY = 'personal'
+    # IDs libres que se traen de una vez al resolver un conflicto con Contratos
+    FREE_ID_CANDIDATES = 50
+    # Consultas frecuentes con cursor preparado por conexión (ver run_statement)
+    STATEMENTS = {
+        'personal_by_id': """
+            SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono 
+            FROM Vista_INF_Personal 
+            WHERE ID_Hospital = ? AND ID_Personal = ?
+        """,
+        'all_personal': """
+            SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono
+            FROM Vista_INF_Personal
+        """
+    }
+    
     def __init__(self):
         super().__init__()
         # Configuración de rangos de ID por nodo
@@ -11,43 +42,51 @@ class PersonalMedicoModel(DatabaseConnection):
             'guayaquil': {'min': 11, 'max': 20}
         }
     
-    def get_next_available_id(self, node=None):
-        """Obtiene el siguiente ID disponible según el rango del nodo"""
-        try:
-            current_node = node or self.detect_current_node()
-            if not current_node or current_node not in self.ID_RANGES:
-                return None
-            
-            range_config = self.ID_RANGES[current_node]
-            min_id = range_config['min']
-            max_id = range_config['max']
-            
-            # Consultar IDs existentes en el rango del nodo
-            query = """
+    def _used_ids_query(self, node, min_id, max_id):
+        """IDs de personal ocupados en el rango del nodo (siembra del allocator)"""
+        query = """
             SELECT ID_Personal 
             FROM Vista_INF_Personal 
             WHERE ID_Personal BETWEEN ? AND ?
-            ORDER BY ID_Personal
-            """
-            
-            results = self.execute_query(query, params=[min_id, max_id], node=current_node)
-            
-            if results is None:
-                return min_id  # Si hay error, empezar desde el mínimo
-            
-            # Buscar el primer ID disponible en el rango
-            used_ids = [row['ID_Personal'] for row in results] if results else []
-            
-            for id_candidate in range(min_id, max_id + 1):
-                if id_candidate not in used_ids:
-                    return id_candidate
-            
-            # Si no hay IDs disponibles en el rango
-            return None
-            
-        except Exception as e:
-            print(f"Error obteniendo siguiente ID: {e}")
-            return None
+        """
+        return query, (min_id, max_id)
+    
+    def _excluded_ids(self, node, min_id, max_id):
+        """IDs del rango con contrato en el hospital del nodo; se releen en cada siembra del allocator"""
+        from .contratos import ContratosManager
+        return ContratosManager().get_contrato_ids(1 if node == 'quito' else 2, min_id, max_id, node)
+    
+    def get_free_ids_for_contrato(self, node, hospital_id, limit=FREE_ID_CANDIDATES):
+        """IDs del rango del nodo sin personal ni contrato, en una sola consulta
+
+        El servidor genera el rango y lo cruza (anti-join) contra Vista_INF_Personal y
+        Contratos (vía linked server desde Guayaquil), trayendo cada lado filtrado por el
+        rango en una sola lectura. Devuelve los limit IDs más bajos, o None si falla.
+        """
+        from .contratos import ContratosManager
+        range_config = self.ID_RANGES[node]
+        min_id, max_id = range_config['min'], range_config['max']
+        tabla_contratos = ContratosManager().get_contratos_table_name(node)
+        
+        query = f"""
+            SELECT TOP (?) r.ID
+            FROM (
+                SELECT TOP (?) CAST(? - 1 + ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS INT) AS ID
+                FROM sys.all_columns a CROSS JOIN sys.all_columns b
+            ) r
+            LEFT JOIN (
+                SELECT ID_Personal FROM Vista_INF_Personal WHERE ID_Personal BETWEEN ? AND ?
+            ) p ON p.ID_Personal = r.ID
+            LEFT JOIN (
+                SELECT ID_Personal FROM {tabla_contratos}
+                WHERE ID_Hospital = ? AND ID_Personal BETWEEN ? AND ?
+            ) c ON c.ID_Personal = r.ID
+            WHERE p.ID_Personal IS NULL AND c.ID_Personal IS NULL
+            ORDER BY r.ID
+        """
+        params = (limit, max_id - min_id + 1, min_id, min_id, max_id, hospital_id, min_id, max_id)
+        results = self.execute_query(query, params, node=node, compact=True)
+        return None if results is None else [row[0] for row in results.rows]
     
     def validate_id_range(self, id_personal, node=None):
         """Valida que el ID esté dentro del rango permitido para el nodo"""
@@ -63,8 +102,13 @@ class PersonalMedicoModel(DatabaseConnection):
             print(f"Error validando rango de ID: {e}")
             return False
     
-    def get_all_personal_medico(self, node=None):
-        """Obtiene todo el personal médico desde Vista_INF_Personal (sin filtrado por hospital)"""
+    def get_all_personal_medico(self, node=None, compact=False, stream=False, after=None, limit=None, keys=None):
+        """Obtiene todo el personal médico desde Vista_INF_Personal (sin filtrado por hospital)
+
+        Con compact=True 'personal_medico' es un ResultSet; con stream=True un
+        StreamingResultSet y 'total' es None. after=(ID_Hospital, ID_Personal) y limit
+        paginan por cursor; keys limita el resultado a esas claves (delta de cambios).
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -76,15 +120,18 @@ class PersonalMedicoModel(DatabaseConnection):
                     'total': 0
                 }
             
-            query = """
+            page = KeysetPage(self.PAGE_KEY, after, limit, keys)
+            
+            query = f"""
             SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono 
-            FROM Vista_INF_Personal 
-            ORDER BY ID_Personal
+            FROM Vista_INF_Personal{page.where('WHERE')}
+            {page.order_by()}
             """
-            results = self.execute_query(query, node=current_node)
+            results = self.execute_query(query, page.params(), node=current_node,
+                                         compact=compact, stream=stream)
             
             # Debug: Ver qué campos están disponibles
-            if results and len(results) > 0:
+            if not stream and results and len(results) > 0:
                 print(f"Personal médico total: {len(results)} registros")
             
             if results is None:
@@ -100,7 +147,8 @@ class PersonalMedicoModel(DatabaseConnection):
                 'success': True,
                 'personal_medico': results,
                 'node': current_node,
-                'total': len(results),
+                'total': None if stream else len(results),
+                'page': page,
                 'error': None
             }
             
@@ -120,12 +168,7 @@ class PersonalMedicoModel(DatabaseConnection):
             if not current_node:
                 return None
             
-            query = """
-                SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono 
-                FROM Vista_INF_Personal 
-                WHERE ID_Hospital = ? AND ID_Personal = ?
-            """
-            results = self.execute_query(query, (id_hospital, id_personal), node=current_node)
+            results = self.run_statement('personal_by_id', (id_hospital, id_personal), node=current_node)
             
             if results and len(results) > 0:
                 return results[0]
@@ -146,15 +189,6 @@ class PersonalMedicoModel(DatabaseConnection):
                     'error': 'No se puede conectar a ningún nodo'
                 }
             
-            # Auto-asignar ID_Personal según el rango del nodo
-            next_id = self.get_next_available_id(current_node)
-            if next_id is None:
-                range_config = self.ID_RANGES.get(current_node, {})
-                return {
-                    'success': False,
-                    'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
-                }
-            
             # Auto-asignar ID_Hospital según el nodo
             hospital_id = 1 if current_node == 'quito' else 2
             
@@ -163,36 +197,49 @@ class PersonalMedicoModel(DatabaseConnection):
                 VALUES (?, ?, ?, ?, ?, ?)
             """
             
-            params = (
-                hospital_id,
-                next_id, 
-                personal_data['ID_Especialidad'],
-                personal_data['Nombre'],
-                personal_data['Apellido'],
-                personal_data['Teléfono']
-            )
-            
-            result = self.execute_query(query, params, node=current_node)
-            
-            if result is not None and result > 0:
-                return {
-                    'success': True,
-                    'message': f'Personal médico creado exitosamente en nodo {current_node}',
-                    'id_personal': next_id,
-                    'id_hospital': hospital_id
-                }
-            else:
+            def insert(next_id):
+                params = (
+                    hospital_id,
+                    next_id, 
+                    personal_data['ID_Especialidad'],
+                    personal_data['Nombre'],
+                    personal_data['Apellido'],
+                    personal_data['Teléfono']
+                )
+                # Con cursor propio: el error (ej. clave duplicada) llega a insert_with_new_id
+                with self.connection(current_node) as connection:
+                    cursor = connection.cursor()
+                    self.execute_cursor(cursor, query, params, node=current_node)
+                    if cursor.rowcount == 0:
+                        raise RuntimeError('No se pudo insertar el personal médico')
+                    connection.commit()
+                    cursor.close()
+            
+            # Auto-asignar ID_Personal según el rango del nodo (reservado para este INSERT)
+            next_id = self.insert_with_new_id(current_node, insert)
+            if next_id is None:
+                range_config = self.ID_RANGES.get(current_node, {})
                 return {
                     'success': False,
-                    'error': 'No se pudo insertar el personal médico'
+                    'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
                 }
+            
+            # Estadísticas e índice se actualizan cuando la petición confirme
+            after_commit(invalidate_stats)
+            after_commit(lambda: self._refresh_search_entry(hospital_id, next_id, current_node))
+            record_change('personal-medico', hospital_id, next_id)
+            return {
+                'success': True,
+                'message': f'Personal médico creado exitosamente en nodo {current_node}',
+                'id_personal': next_id,
+                'id_hospital': hospital_id
+            }
                 
         except Exception as e:
             return {
                 'success': False,
                 'error': f'Error al crear personal médico: {str(e)}'
             }
-    
     def update_personal_medico(self, id_hospital, id_personal, personal_data, node=None):
         """Actualiza un personal médico existente en Vista_INF_Personal"""
         try:
@@ -221,6 +268,8 @@ class PersonalMedicoModel(DatabaseConnection):
             result = self.execute_query(query, params, node=current_node)
             
             if result is not None and result > 0:
+                after_commit(lambda: self._refresh_search_entry(id_hospital, id_personal, current_node))
+                record_change('personal-medico', id_hospital, id_personal)
                 return {
                     'success': True,
                     'message': f'Personal médico actualizado exitosamente en nodo {current_node}'
@@ -255,6 +304,11 @@ class PersonalMedicoModel(DatabaseConnection):
             result = self.execute_query(query, (id_hospital, id_personal), node=current_node)
             
             if result is not None and result > 0:
+                # El ID se libera solo si el DELETE se confirma (si no, sigue en uso)
+                after_commit(invalidate_stats)
+                after_commit(lambda: self.release_id(id_personal))
+                after_commit(lambda: self.search_index(current_node).remove((id_hospital, id_personal)))
+                record_change('personal-medico', id_hospital, id_personal)
                 return {
                     'success': True,
                     'message': f'Personal médico eliminado exitosamente del nodo {current_node}'
@@ -271,8 +325,45 @@ class PersonalMedicoModel(DatabaseConnection):
                 'error': f'Error al eliminar personal médico: {str(e)}'
             }
     
+    def search_index(self, node):
+        """Índice de búsqueda en memoria del personal médico visible desde el nodo"""
+        return get_search_index('personal_medico', node, self.PAGE_KEY, ('Nombre', 'Apellido', 'ID_Personal'),
+                                change_entity='personal-medico')
+    
+    def _load_search_rows(self, node, id_hospital=None, id_personal=None):
+        """Personal médico (o uno solo) con las columnas de search_personal_medico"""
+        if id_personal is not None:
+            return self.run_statement('personal_by_id', (id_hospital, id_personal), node=node)
+        return self.run_statement('all_personal', node=node)
+    
+    def warm_search_index(self, node=None):
+        """Construye el índice de búsqueda en segundo plano (al iniciar la aplicación)"""
+        current_node = node or self.detect_current_node()
+        if current_node:
+            self.search_index(current_node).start_rebuild(lambda: self._load_search_rows(current_node))
+    
+    def _refresh_search_entry(self, id_hospital, id_personal, node=None):
+        """Actualiza en el índice un personal recién creado, modificado o eliminado"""
+        current_node = node or self.detect_current_node()
+        if not current_node:
+            return
+        index = self.search_index(current_node)
+        if not index.ready:
+            return
+        rows = self._load_search_rows(current_node, id_hospital, id_personal)
+        if rows:
+            index.upsert(rows[0])
+        elif rows is not None:
+            index.remove((id_hospital, id_personal))
+        else:
+            # No se pudo leer la fila: reconstruir para no dejar el índice desactualizado
+            index.start_rebuild(lambda: self._load_search_rows(current_node))
+    
     def search_personal_medico(self, search_term, node=None):
-        """Busca personal médico por nombre, apellido o ID (sin filtrado por hospital)"""
+        """Busca personal médico por nombre, apellido o ID (sin filtrado por hospital)
+
+        Responde desde el índice en memoria; solo consulta SQL mientras el índice está frío.
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -282,23 +373,30 @@ class PersonalMedicoModel(DatabaseConnection):
                     'personal_medico': []
                 }
             
-            query = """
-                SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono
-                FROM Vista_INF_Personal 
-                WHERE Nombre LIKE ? OR Apellido LIKE ? OR 
-                      CAST(ID_Personal AS VARCHAR) LIKE ?
-                ORDER BY ID_Personal
-            """
-            
-            search_pattern = f"%{search_term}%"
-            results = self.execute_query(query, (search_pattern, search_pattern, search_pattern), node=current_node)
+            index = self.search_index(current_node)
+            if index.is_stale():
+                index.start_rebuild(lambda: self._load_search_rows(current_node))
+            results = index.search(search_term)
             
             if results is None:
-                return {
-                    'success': False,
-                    'error': 'Error en la búsqueda',
-                    'personal_medico': []
-                }
+                # Índice frío: esta búsqueda va por SQL mientras se construye
+                query = """
+                    SELECT ID_Hospital, ID_Personal, ID_Especialidad, Nombre, Apellido, Teléfono
+                    FROM Vista_INF_Personal 
+                    WHERE Nombre LIKE ? OR Apellido LIKE ? OR 
+                          CAST(ID_Personal AS VARCHAR) LIKE ?
+                    ORDER BY ID_Personal
+                """
+                
+                search_pattern = f"%{search_term}%"
+                results = self.execute_query(query, (search_pattern, search_pattern, search_pattern), node=current_node)
+                
+                if results is None:
+                    return {
+                        'success': False,
+                        'error': 'Error en la búsqueda',
+                        'personal_medico': []
+                    }
             
             return {
                 'success': True,
@@ -314,8 +412,121 @@ class PersonalMedicoModel(DatabaseConnection):
                 'personal_medico': []
             }
 
+    # ---------- Pasos del alta ----------
+    
+    def _saga_reserve_id(self, context):
+        id_personal = self.reserve_id(context['node'])
+        if id_personal is None:
+            range_config = self.ID_RANGES.get(context['node'], {})
+            raise SagaError(f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - '
+                            f'{range_config.get("max", "?")} para el nodo {context["node"]}')
+        return id_personal
+    
+    def _saga_release_reserved_id(self, context):
+        self.release_id(context['id_reservado'], resync=True)
+    
+    def _saga_contrato_ids(self, context):
+        from .contratos import ContratosManager
+        range_config = self.ID_RANGES[context['node']]
+        contrato_ids = ContratosManager().get_contrato_ids(context['hospital_id'], range_config['min'],
+                                                           range_config['max'], context['node'])
+        if contrato_ids is None:
+            print("⚠️ No se pudieron consultar los contratos del rango; se verificará al crear el contrato")
+            return set()
+        return contrato_ids
+    
+    def _saga_choose_id(self, context):
+        next_id = context['id_reservado']
+        if next_id not in context['contratos_en_rango']:
+            return next_id
+        
+        print(f"⚠️ CONFLICTO: Ya existe contrato para ID_Personal={next_id}, buscando siguiente ID disponible...")
+        # Los IDs con contrato quedan fuera del rango: la compensación no debe devolverlos como
+        # libres, y la próxima resincronización vuelve a leer Contratos (si se eliminó, vuelve)
+        for id_contrato in context['contratos_en_rango']:
+            self.exclude_id(context['node'], id_contrato)
+        
+        # IDs sin personal ni contrato, resueltos en el servidor con una sola consulta
+        free_ids = self.get_free_ids_for_contrato(context['node'], context['hospital_id'])
+        if free_ids is None:
+            raise SagaError(f'No se pudieron consultar los IDs libres de conflictos para {context["node"]}')
+        
+        # Saltar IDs reservados por otra creación en curso (sin consultar la base)
+        for id_candidate in free_ids:
+            if self.claim_id(context['node'], id_candidate):
+                print(f"✅ Usando ID_Personal={id_candidate} (sin conflictos)")
+                return id_candidate
+        raise SagaError(f'No hay IDs disponibles sin conflictos de contratos en el rango para {context["node"]}')
+    
+    def _saga_release_chosen_id(self, context):
+        if context['id_personal'] != context['id_reservado']:
+            self.release_id(context['id_personal'], resync=True)
+    
+    def _saga_create_personal(self, context):
+        current_node, hospital_id, next_id = context['node'], context['hospital_id'], context['id_personal']
+        personal_data = context['personal_data']
+        with self.connection(current_node) as connection:
+            cursor = connection.cursor()
+        
+            print(f"Debug: Ejecutando SP_Create_PersonalMedico en nodo {current_node}: Hospital={hospital_id}, Personal={next_id}")
+        
+            # Ejecutar SP SOLO para Personal Médico (sin salario/contrato)
+            self.execute_cursor(cursor, "{CALL SP_Create_PersonalMedico (?, ?, ?, ?, ?, ?)}", 
+                                      (hospital_id, next_id, personal_data['ID_Especialidad'],
+                                       personal_data['Nombre'], personal_data['Apellido'], 
+                                       personal_data['Teléfono']), node=current_node)
+        
+            connection.commit()
+            cursor.close()
+        
+        print("Debug: Personal médico creado exitosamente")
+        after_commit(invalidate_stats)
+        after_commit(lambda: self._refresh_search_entry(hospital_id, next_id, current_node))
+        record_change('personal-medico', hospital_id, next_id)
+        return True
+    
+    def _saga_delete_personal(self, context):
+        result = self.delete_personal_medico_sp(context['hospital_id'], context['id_personal'])
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        print("🔄 ROLLBACK: Personal médico eliminado debido a fallo en contrato")
+    
+    def _saga_create_contrato(self, context):
+        from .contratos import ContratosManager
+        hospital_id, next_id = context['hospital_id'], context['id_personal']
+        if context['en_cola']:
+            try:
+                outbox_id = queue_contrato_write('create', hospital_id, next_id, {
+                    'salario': context['salario'],
+                    'fecha_contrato': context['fecha_contrato'],
+                    # Si Quito lo rechaza definitivamente, se elimina el personal
+                    'compensate': True
+                })
+                return {'pendiente': True, 'outbox_id': outbox_id}
+            except sqlite3.Error as e:
+                print(f"⚠️ No se pudo encolar el contrato, creándolo directamente: {e}")
+        
+        if not ContratosManager().create_contrato(hospital_id, next_id, context['salario'],
+                                                  context['fecha_contrato']):
+            raise SagaError('Falló la creación del contrato. Personal médico no creado para mantener consistencia.')
+        print("Debug: Contrato creado exitosamente en Quito")
+        return {'pendiente': False}
+    
+    def _saga_undo_contrato(self, context):
+        from .contratos import ContratosManager
+        if context['contrato']['pendiente']:
+            # Queda en cola detrás del alta, así se aplica después aunque el alta siga pendiente
+            queue_contrato_write('delete', context['hospital_id'], context['id_personal'])
+        elif not ContratosManager().delete_contrato(context['hospital_id'], context['id_personal']):
+            raise RuntimeError('No se pudo eliminar el contrato')
+    
     def create_personal_medico_with_contrato(self, personal_data, salario, fecha_contrato=None, node=None):
-        """Crear personal médico + contrato: Personal en nodo local, Contrato siempre en Quito"""
+        """Crear personal médico + contrato: Personal en nodo local, Contrato siempre en Quito
+
+        Se ejecuta como saga (alta_saga): reservar el ID y leer los contratos del rango
+        ocurren a la vez, y si un paso falla se deshacen los anteriores. Fuera de Quito
+        el contrato queda en la cola local y se responde sin esperar al linked server.
+        """
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -324,118 +535,36 @@ class PersonalMedicoModel(DatabaseConnection):
                     'error': 'No se puede conectar a ningún nodo'
                 }
             
-            # Auto-asignar ID_Personal según el rango del nodo
-            next_id = self.get_next_available_id(current_node)
-            if next_id is None:
-                range_config = self.ID_RANGES.get(current_node, {})
-                return {
-                    'success': False,
-                    'error': f'No hay IDs disponibles en el rango {range_config.get("min", "?")} - {range_config.get("max", "?")} para el nodo {current_node}'
-                }
-            
-            # Auto-asignar ID_Hospital según el nodo
-            hospital_id = 1 if current_node == 'quito' else 2
-            
-            # ======================================
-            # VALIDACIÓN: Verificar que NO exista contrato con este ID_Personal
-            # ======================================
-            from .contratos import ContratosManager
-            contratos_manager = ContratosManager()
-            
-            # Verificar si ya existe un contrato con este ID_Personal
-            contrato_existente = contratos_manager.get_contrato_by_ids(hospital_id, next_id)
-            if contrato_existente:
-                print(f"⚠️ CONFLICTO: Ya existe contrato para ID_Personal={next_id}, buscando siguiente ID disponible...")
-                
-                # Buscar siguiente ID que no tenga contrato
-                range_config = self.ID_RANGES[current_node]
-                for id_candidate in range(next_id + 1, range_config['max'] + 1):
-                    # Verificar que no esté usado en Personal Médico
-                    query = "SELECT 1 FROM Vista_INF_Personal WHERE ID_Personal = ?"
-                    personal_exists = self.execute_query(query, params=[id_candidate], node=current_node)
-                    
-                    # Verificar que no tenga contrato
-                    contrato_candidate = contratos_manager.get_contrato_by_ids(hospital_id, id_candidate)
-                    
-                    if not personal_exists and not contrato_candidate:
-                        next_id = id_candidate
-                        print(f"✅ Usando ID_Personal={next_id} (sin conflictos)")
-                        break
-                else:
-                    return {
-                        'success': False,
-                        'error': f'No hay IDs disponibles sin conflictos de contratos en el rango para {current_node}'
-                    }
-            
-            # ======================================
-            # PASO 1: Crear Personal Médico en nodo local
-            # ======================================
-            connection = self.get_connection()
-            if not connection:
+            result = alta_saga.run(
+                node=current_node,
+                # Auto-asignar ID_Hospital según el nodo
+                hospital_id=1 if current_node == 'quito' else 2,
+                personal_data=personal_data,
+                salario=salario,
+                fecha_contrato=fecha_contrato,
+                en_cola=current_node != CONTRATOS_NODE and CONTRATO_OUTBOX_ENABLED
+            )
+            if not result['success']:
                 return {
                     'success': False,
-                    'error': 'No se pudo establecer conexión para insertar personal médico'
+                    'error': result['error']
                 }
-                
-            cursor = connection.cursor()
-            
-            print(f"Debug: Ejecutando SP_Create_PersonalMedico en nodo {current_node}: Hospital={hospital_id}, Personal={next_id}")
-            
-            # Ejecutar SP SOLO para Personal Médico (sin salario/contrato)
-            cursor.execute("{CALL SP_Create_PersonalMedico (?, ?, ?, ?, ?, ?)}", 
-                         (hospital_id, next_id, personal_data['ID_Especialidad'],
-                          personal_data['Nombre'], personal_data['Apellido'], 
-                          personal_data['Teléfono']))
-            
-            connection.commit()
-            cursor.close()
-            connection.close()
-            
-            print("Debug: Personal médico creado exitosamente")
-            
-            # ======================================
-            # PASO 2: Crear Contrato usando conexión normal
-            # ======================================
-            contrato_creado = contratos_manager.create_contrato(
-                hospital_id, next_id, salario, fecha_contrato
-            )
             
-            if not contrato_creado:
-                # ROLLBACK: Si falla el contrato, eliminar el personal médico creado
-                try:
-                    self.delete_personal_medico_sp(hospital_id, next_id)
-                    print("🔄 ROLLBACK: Personal médico eliminado debido a fallo en contrato")
-                except:
-                    print("⚠️ ROLLBACK FALLÓ: Personal médico creado pero contrato no. Inconsistencia detectada.")
-                
+            context = result['context']
+            if context['contrato']['pendiente']:
                 return {
-                    'success': False,
-                    'error': 'Falló la creación del contrato. Personal médico no creado para mantener consistencia.'
+                    'success': True,
+                    'message': f'Personal médico creado en {current_node}; contrato en cola para Quito',
+                    'id_personal': context['id_personal'],
+                    'id_hospital': context['hospital_id'],
+                    'contrato_pendiente': True,
+                    'outbox_id': context['contrato']['outbox_id']
                 }
-            
-            print("Debug: Contrato creado exitosamente en Quito")
-            
             return {
                 'success': True,
                 'message': f'Personal médico y contrato creados exitosamente (Personal en {current_node}, Contrato en Quito)',
-                'id_personal': next_id,
-                'id_hospital': hospital_id
-            }
-            
-        except Exception as e:
-            print(f"Error detallado al crear personal médico + contrato: {e}")
-            return {
-                'success': False,
-                'error': f'Error al crear personal médico + contrato: {str(e)}'
-            }
-            
-            print("Debug: Contrato creado exitosamente en Quito")
-            
-            return {
-                'success': True,
-                'message': f'Personal médico y contrato creados exitosamente (Personal en {current_node}, Contrato en Quito)',
-                'id_personal': next_id,
-                'id_hospital': hospital_id
+                'id_personal': context['id_personal'],
+                'id_hospital': context['hospital_id']
             }
             
         except Exception as e:
@@ -448,25 +577,20 @@ class PersonalMedicoModel(DatabaseConnection):
     def update_personal_medico_sp(self, id_hospital, id_personal, personal_data):
         """Actualizar personal médico usando SP_Update_PersonalMedico"""
         try:
-            connection = self.get_connection()
-            if not connection:
-                return {
-                    'success': False,
-                    'error': 'No se pudo establecer conexión'
-                }
-                
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
             
-            # Ejecutar SP de actualización con transacción distribuida
-            cursor.execute("{CALL SP_Update_PersonalMedico (?, ?, ?, ?, ?, ?)}", 
-                         (id_hospital, id_personal, personal_data['ID_Especialidad'],
-                          personal_data['Nombre'], personal_data['Apellido'], 
-                          personal_data['Teléfono']))
+                # Ejecutar SP de actualización con transacción distribuida
+                self.execute_cursor(cursor, "{CALL SP_Update_PersonalMedico (?, ?, ?, ?, ?, ?)}", 
+                                          (id_hospital, id_personal, personal_data['ID_Especialidad'],
+                                           personal_data['Nombre'], personal_data['Apellido'], 
+                                           personal_data['Teléfono']))
             
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
             
+            after_commit(lambda: self._refresh_search_entry(id_hospital, id_personal))
+            record_change('personal-medico', id_hospital, id_personal)
             return {
                 'success': True,
                 'message': 'Personal médico actualizado exitosamente'
@@ -482,24 +606,21 @@ class PersonalMedicoModel(DatabaseConnection):
     def delete_personal_medico_sp(self, id_hospital, id_personal):
         """Eliminar personal médico usando SP_Delete_PersonalMedico"""
         try:
-            connection = self.get_connection()
-            if not connection:
-                return {
-                    'success': False,
-                    'error': 'No se pudo establecer conexión'
-                }
-
-            cursor = connection.cursor()
+            with self.connection() as connection:
+                cursor = connection.cursor()
 
-            # Ejecutar SP de eliminación con transacción distribuida
-            cursor.execute("{CALL SP_Delete_PersonalMedico (?, ?)}", (id_hospital, id_personal))
-            # Forzar la propagación de errores de SQL Server
-            while cursor.nextset():
-                pass
-            connection.commit()
-            cursor.close()
-            connection.close()
+                # Ejecutar SP de eliminación con transacción distribuida
+                self.execute_cursor(cursor, "{CALL SP_Delete_PersonalMedico (?, ?)}", (id_hospital, id_personal))
+                # Forzar la propagación de errores de SQL Server
+                while cursor.nextset():
+                    pass
+                connection.commit()
+                cursor.close()
 
+            after_commit(invalidate_stats)
+            after_commit(lambda: self.release_id(id_personal))
+            after_commit(lambda: self._refresh_search_entry(id_hospital, id_personal))
+            record_change('personal-medico', id_hospital, id_personal)
             return {
                 'success': True,
                 'message': 'Personal médico eliminado exitosamente'
@@ -519,54 +640,84 @@ class PersonalMedicoModel(DatabaseConnection):
                 'error': 'No se pudo eliminar el personal médico. Puede que esté siendo referenciado en otra tabla.'
             }
 
+    # ---------- Pasos de la baja ----------
+    
+    def _saga_check_personal(self, context):
+        if not self.get_personal_medico_by_id(context['id_hospital'], context['id_personal']):
+            raise SagaError('El personal médico no existe')
+        return True
+    
+    def _saga_read_contrato(self, context):
+        from .contratos import ContratosManager
+        if context['en_cola']:
+            # La baja del contrato se encola sin consultar Quito (puede haber un alta pendiente)
+            return None
+        return ContratosManager().get_contrato_by_ids(context['id_hospital'], context['id_personal'])
+    
+    def _saga_delete_contrato(self, context):
+        from .contratos import ContratosManager
+        id_personal = context['id_personal']
+        if not context['contrato']:
+            if not context['en_cola']:
+                print(f"ℹ️ No hay contrato asociado para ID_Personal={id_personal}")
+            return False
+        
+        print(f"🗑️ Eliminando contrato asociado para ID_Personal={id_personal}")
+        if not ContratosManager().delete_contrato(context['id_hospital'], id_personal):
+            print("⚠️ ADVERTENCIA: No se pudo eliminar el contrato, pero continuando...")
+            return False
+        print("✅ Contrato eliminado exitosamente")
+        # El ID deja de chocar con Contratos: al eliminar el personal vuelve al rango
+        self.unexclude_id(id_personal)
+        return True
+    
+    def _saga_restore_contrato(self, context):
+        from .contratos import ContratosManager
+        if context['contrato_eliminado']:
+            contrato = context['contrato']
+            if not ContratosManager().create_contrato(contrato['ID_Hospital'], contrato['ID_Personal'],
+                                                      contrato['Salario'], contrato['Fecha_Contrato']):
+                raise RuntimeError('No se pudo restaurar el contrato')
+            print("🔄 ROLLBACK: Contrato restaurado porque no se pudo eliminar el personal médico")
+    
+    def _saga_delete_personal_final(self, context):
+        print(f"🗑️ Eliminando personal médico ID_Personal={context['id_personal']}")
+        personal_eliminado = self.delete_personal_medico_sp(context['id_hospital'], context['id_personal'])
+        if not personal_eliminado['success']:
+            raise SagaError(f'Error al eliminar personal médico: {personal_eliminado["error"]}')
+        return True
+    
+    def _saga_queue_contrato_delete(self, context):
+        if not context['en_cola']:
+            return None
+        # Siempre en cola: queda detrás de un alta aún pendiente del mismo personal
+        return queue_contrato_write('delete', context['id_hospital'], context['id_personal'])
+    
     def delete_personal_medico_with_contrato(self, id_hospital, id_personal):
-        """Eliminar personal médico Y su contrato asociado para mantener consistencia"""
+        """Eliminar personal médico Y su contrato asociado para mantener consistencia
+
+        Se ejecuta como saga (baja_saga): verificar el personal y leer el contrato ocurren a
+        la vez; si el personal no se puede eliminar, el contrato eliminado se restaura.
+        """
         try:
             print(f"🗑️ Iniciando eliminación consistente: Personal={id_personal}, Hospital={id_hospital}")
             
-            # ======================================
-            # PASO 1: Verificar que el personal médico existe
-            # ======================================
-            personal_exists = self.get_personal_medico_by_id(id_hospital, id_personal)
-            if not personal_exists:
-                return {
-                    'success': False,
-                    'error': 'El personal médico no existe'
-                }
-            
-            # ======================================
-            # PASO 2: Eliminar contrato asociado (si existe)
-            # ======================================
-            from .contratos import ContratosManager
-            contratos_manager = ContratosManager()
-            
-            contrato_existente = contratos_manager.get_contrato_by_ids(id_hospital, id_personal)
-            if contrato_existente:
-                print(f"🗑️ Eliminando contrato asociado para ID_Personal={id_personal}")
-                contrato_eliminado = contratos_manager.delete_contrato(id_hospital, id_personal)
-                if not contrato_eliminado:
-                    print("⚠️ ADVERTENCIA: No se pudo eliminar el contrato, pero continuando...")
-                else:
-                    print("✅ Contrato eliminado exitosamente")
-            else:
-                print(f"ℹ️ No hay contrato asociado para ID_Personal={id_personal}")
-            
-            # ======================================
-            # PASO 3: Eliminar personal médico
-            # ======================================
-            print(f"🗑️ Eliminando personal médico ID_Personal={id_personal}")
-            personal_eliminado = self.delete_personal_medico_sp(id_hospital, id_personal)
-            
-            if personal_eliminado['success']:
+            current_node = self.detect_current_node()
+            result = baja_saga.run(
+                node=current_node,
+                id_hospital=id_hospital,
+                id_personal=id_personal,
+                en_cola=current_node != CONTRATOS_NODE and CONTRATO_OUTBOX_ENABLED
+            )
+            if result['success']:
                 return {
                     'success': True,
                     'message': 'Personal médico y contrato eliminados exitosamente (consistencia mantenida)'
                 }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Error al eliminar personal médico: {personal_eliminado["error"]}'
-                }
+            return {
+                'success': False,
+                'error': result['error']
+            }
             
         except Exception as e:
             import traceback
@@ -580,3 +731,48 @@ class PersonalMedicoModel(DatabaseConnection):
                 'success': False,
                 'error': f'Error al eliminar personal médico con contrato: {str(e)}'
             }
+
+
+# ---------- Sagas (declaradas una vez por proceso) ----------
+
+# Modelo sobre el que corren los pasos; se crea en el primer uso
+_saga_model = None
+_saga_model_lock = threading.Lock()
+
+
+def _shared_model():
+    global _saga_model
+    if _saga_model is None:
+        with _saga_model_lock:
+            if _saga_model is None:
+                _saga_model = PersonalMedicoModel()
+    return _saga_model
+
+
+def _step(method_name):
+    """Acción o compensación que llama al método del modelo compartido con el contexto"""
+    def run(context):
+        return getattr(_shared_model(), method_name)(context)
+    run.__name__ = method_name
+    return run
+
+
+# Alta y baja de personal con contrato (Personal en el nodo local, Contrato en Quito)
+alta_saga = Saga('alta_personal_con_contrato', [
+    # El ID local y los contratos del rango se consultan a la vez (son independientes)
+    SagaStep('id_reservado', _step('_saga_reserve_id'), _step('_saga_release_reserved_id'), transactional=False),
+    SagaStep('contratos_en_rango', _step('_saga_contrato_ids'), durable=False),
+    SagaStep('id_personal', _step('_saga_choose_id'), _step('_saga_release_chosen_id'),
+             after=('id_reservado', 'contratos_en_rango'), transactional=False),
+    SagaStep('personal', _step('_saga_create_personal'), _step('_saga_delete_personal'), after=('id_personal',)),
+    SagaStep('contrato', _step('_saga_create_contrato'), _step('_saga_undo_contrato'), after=('personal',)),
+])
+baja_saga = Saga('baja_personal_con_contrato', [
+    SagaStep('personal', _step('_saga_check_personal')),
+    SagaStep('contrato', _step('_saga_read_contrato')),
+    SagaStep('contrato_eliminado', _step('_saga_delete_contrato'), _step('_saga_restore_contrato'),
+             after=('personal', 'contrato')),
+    SagaStep('personal_eliminado', _step('_saga_delete_personal_final'), after=('contrato_eliminado',)),
+    # En cola va al final: si no se pudo eliminar el personal, el contrato no se toca
+    SagaStep('contrato_en_cola', _step('_saga_queue_contrato_delete'), after=('personal_eliminado',)),
+])
@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import pyodbc
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+
+# Cursores preparados que se conservan por conexión (LRU por texto SQL)
+STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '32'))
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera"""
+
+
+class ConnectionPool:
+    """Pool de conexiones pyodbc reutilizables para un nodo"""
+
+    def __init__(self, node, connection_string, min_size=1, max_size=10,
+                 idle_timeout=300, checkout_timeout=30, ping_interval=5):
+        self.node = node
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+
+        # Conexiones libres como (conexión, último uso); la más reciente al final
+        self._idle = deque()
+        # Conexiones abiertas (libres + prestadas)
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        """Abre una conexión nueva contra el nodo"""
+        return pyodbc.connect(self.connection_string)
+
+    def _is_alive(self, connection):
+        """Verifica que la conexión siga respondiendo"""
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _close_quietly(self, connection):
+        forget_statements(connection)
+        try:
+            connection.close()
+        except pyodbc.Error:
+            pass
+
+    def _evict_idle(self):
+        """Cierra las conexiones ociosas más antiguas que idle_timeout (respetando min_size)"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            while (self._idle and self._size > self.min_size
+                   and now - self._idle[0][1] > self.idle_timeout):
+                connection, _ = self._idle.popleft()
+                self._size -= 1
+                expired.append(connection)
+            if expired:
+                self._cond.notify(len(expired))
+        for connection in expired:
+            self._close_quietly(connection)
+
+    def acquire(self, force_ping=False):
+        """Presta una conexión viva del pool, abriendo una nueva si hay cupo"""
+        self._evict_idle()
+        deadline = time.monotonic() + self.checkout_timeout
+
+        while True:
+            connection = None
+            last_used = None
+            with self._cond:
+                if self._idle:
+                    # LIFO: la conexión usada más recientemente es la que más probablemente sigue viva
+                    connection, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"Pool del nodo {self.node} agotado ({self.max_size} conexiones en uso)"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if connection is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            # Solo se hace ping si la conexión estuvo ociosa el tiempo suficiente
+            recently_used = time.monotonic() - last_used < self.ping_interval
+            if (recently_used and not force_ping) or self._is_alive(connection):
+                return connection
+
+            print(f"♻️ Pool {self.node}: descartando conexión muerta")
+            self._discard(connection)
+
+    def _discard(self, connection):
+        self._close_quietly(connection)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def release(self, connection, discard=False):
+        """Devuelve una conexión al pool (o la descarta si quedó inutilizable)"""
+        if not discard:
+            try:
+                # Dejar la conexión sin transacciones abiertas para el siguiente uso
+                connection.rollback()
+            except pyodbc.Error:
+                discard = True
+
+        if discard:
+            self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def ping(self):
+        """Prueba el nodo prestando una conexión verificada; no lanza excepciones"""
+        try:
+            connection = self.acquire(force_ping=True)
+        except Exception:
+            return False
+        self.release(connection)
+        return True
+
+    def close_all(self):
+        """Cierra las conexiones libres (las prestadas se cierran al devolverse)"""
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        """Resumen del estado del pool"""
+        with self._cond:
+            return {
+                'node': self.node,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size
+            }
+
+
+# Pools compartidos por todo el proceso, uno por nodo
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_settings():
+    """Parámetros del pool leídos desde el entorno"""
+    return {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'idle_timeout': float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        'checkout_timeout': float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '30')),
+        'ping_interval': float(os.getenv('DB_POOL_PING_INTERVAL', '5'))
+    }
+
+
+def get_pool(node, connection_string):
+    """Obtiene (o crea) el pool del nodo indicado"""
+    pool = _pools.get(node)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(node)
+        if pool is None:
+            pool = ConnectionPool(node, connection_string, **_pool_settings())
+            _pools[node] = pool
+        return pool
+
+
+# Cursores preparados de cada conexión del pool: id(conexión) -> {sql: cursor}
+# Una conexión la usa un solo hilo a la vez, por eso su diccionario no necesita lock
+_statements = {}
+
+
+def statement_cursor(connection, query):
+    """Cursor dedicado a query en esta conexión
+
+    pyodbc solo prepara la consulta la primera vez que el cursor la ejecuta; al repetirla
+    en el mismo cursor reutiliza el statement preparado en el servidor.
+    """
+    cache = _statements.get(id(connection))
+    if cache is None:
+        cache = _statements.setdefault(id(connection), OrderedDict())
+    cursor = cache.pop(query, None)
+    if cursor is None:
+        cursor = connection.cursor()
+        if len(cache) >= STATEMENT_CACHE_SIZE:
+            _, oldest = cache.popitem(last=False)
+            _close_cursor(oldest)
+    cache[query] = cursor
+    return cursor
+
+
+def forget_statements(connection):
+    """Cierra los cursores preparados de una conexión que se descarta"""
+    for cursor in (_statements.pop(id(connection), None) or {}).values():
+        _close_cursor(cursor)
+
+
+def _close_cursor(cursor):
+    try:
+        cursor.close()
+    except pyodbc.Error:
+        pass
+
+
+# Pools heredados de un fork: se conservan sin usarlos ni cerrarlos, porque sus sockets
+# siguen perteneciendo al proceso padre (cerrarlos cortaría las sesiones del padre)
+_inherited_pools = []
+
+
+def _forget_pools_after_fork():
+    """En el proceso hijo, cada nodo abre su propio pool en el primer uso"""
+    global _pools_lock
+    _inherited_pools.extend(_pools.values())
+    _inherited_pools.append(dict(_statements))
+    _pools.clear()
+    _statements.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+def all_pool_stats():
+    """stats() de cada pool del proceso"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all_pools():
+    """Cierra las conexiones libres de todos los pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,185 @@
+import json
+import time
+from collections.abc import Mapping
+
+
+def format_date(value, fmt='%d/%m/%Y'):
+    """Formatea fechas para el frontend; deja intactos los demás valores"""
+    if value and hasattr(value, 'strftime'):
+        return value.strftime(fmt)
+    return value
+
+
+class RowView(Mapping):
+    """Vista de solo lectura de una fila como dict, sin copiar los valores"""
+
+    __slots__ = ('_resultset', '_values')
+
+    def __init__(self, resultset, values):
+        self._resultset = resultset
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._resultset._read(self._values, key)
+
+    def __iter__(self):
+        return iter(self._resultset.keys)
+
+    def __len__(self):
+        return len(self._resultset.keys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ResultSet:
+    """Resultado compacto: un esquema compartido y las filas como tuplas"""
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+        # Claves de salida -> índice de columna (los alias apuntan a la misma columna)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self.keys = list(self.columns)
+        # Conversión aplicada al leer cada valor (ej. formato de fechas)
+        self._converters = {}
+
+    def alias(self, alias, column):
+        """Expone una columna también con otro nombre (ej. 'Direccion' para 'Dirección')"""
+        if column in self._index and alias not in self._index:
+            self._index[alias] = self._index[column]
+            self.keys.append(alias)
+        return self
+
+    def convert(self, key, func):
+        """Registra una conversión perezosa para una clave de salida"""
+        if key in self._index:
+            self._converters[key] = func
+        return self
+
+    def _read(self, values, key):
+        value = values[self._index[key]]
+        converter = self._converters.get(key)
+        return converter(value) if converter else value
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def __iter__(self):
+        for values in self.rows:
+            yield RowView(self, values)
+
+    def __getitem__(self, position):
+        return RowView(self, self.rows[position])
+
+    def last(self):
+        """Última fila (como RowView) o None si no hay filas"""
+        return RowView(self, self.rows[-1]) if self.rows else None
+
+    def to_dicts(self):
+        """Materializa las filas como dicts (solo cuando el llamador realmente los necesita)"""
+        return [dict(row) for row in self]
+
+    def _fields(self, encoder):
+        # Prefijos '"clave":' codificados una sola vez para todo el resultado
+        return [
+            (encoder.encode(key) + ':', self._index[key], self._converters.get(key))
+            for key in self.keys
+        ]
+
+    def iter_json(self, encoder):
+        """Genera cada fila como objeto JSON directamente desde las tuplas"""
+        fields = self._fields(encoder)
+        encode = encoder.encode
+        for values in self.rows:
+            parts = []
+            for prefix, index, converter in fields:
+                value = values[index]
+                if converter:
+                    value = converter(value)
+                parts.append(prefix + encode(value))
+            yield '{' + ','.join(parts) + '}'
+
+
+class StreamingResultSet(ResultSet):
+    """ResultSet que lee las filas del cursor por lotes (fetchmany) a medida que se consumen
+
+    Mantiene la conexión prestada hasta agotar las filas o llamar a close(); solo se
+    puede recorrer una vez y su tamaño no se conoce hasta el final.
+    """
+
+    def __init__(self, columns, cursor, batch_size, on_close):
+        self._cursor = cursor
+        self._batch_size = batch_size
+        self._on_close = on_close
+        self._last = None
+        # Tiempo total dentro de fetchmany y filas leídas (métricas al cerrar)
+        self.fetch_seconds = 0.0
+        self.row_count = 0
+        super().__init__(columns, self._fetch())
+
+    def _fetch(self):
+        try:
+            while True:
+                started = time.perf_counter()
+                batch = self._cursor.fetchmany(self._batch_size)
+                self.fetch_seconds += time.perf_counter() - started
+                if not batch:
+                    return
+                self.row_count += len(batch)
+                self._last = batch[-1]
+                yield from batch
+        finally:
+            self.close()
+
+    def close(self):
+        """Libera el cursor y devuelve la conexión al pool (idempotente)"""
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def last(self):
+        """Última fila leída hasta el momento (como RowView)"""
+        return RowView(self, self._last) if self._last is not None else None
+
+    def __len__(self):
+        raise TypeError("El tamaño de un StreamingResultSet se conoce solo al terminar de leerlo")
+
+    def __bool__(self):
+        return True
+
+    def __getitem__(self, position):
+        raise TypeError("Un StreamingResultSet no admite acceso por posición")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_json_response(payload, key, rows, default=None, trailer=None):
+    """Genera por fragmentos el JSON {...payload, key: [filas]} sin construir un dict por fila
+
+    trailer(count) puede devolver claves extra que solo se conocen al terminar las filas
+    (ej. el total o el cursor de la página siguiente al hacer streaming).
+    """
+    encoder = json.JSONEncoder(default=default)
+    head = encoder.encode(payload)
+    separator = ',' if payload else ''
+    yield head[:-1] + separator + encoder.encode(key) + ':['
+
+    count = 0
+    for fragment in rows.iter_json(encoder):
+        yield fragment if count == 0 else ',' + fragment
+        count += 1
+
+    extra = trailer(count) if trailer else None
+    if extra:
+        yield '],' + encoder.encode(extra)[1:]
+    else:
+        yield ']}'
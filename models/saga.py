@@ -0,0 +1,399 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from .metrics import query_metrics
+from .unit_of_work import current_unit_of_work, pending_writes_unit
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Archivo SQLite local con el estado de las sagas en curso (para compensarlas tras una caída)
+SAGA_STATE_PATH = os.getenv('SAGA_STATE_PATH', 'outbox/sagas.sqlite3')
+# Una saga sin avances en este tiempo se considera abandonada (el proceso cayó) y se compensa
+SAGA_RESUME_AFTER = float(os.getenv('SAGA_RESUME_AFTER', '300'))
+# Sagas terminadas que se conservan para diagnóstico (segundos)
+SAGA_RETENTION = 7 * 24 * 3600
+# Hilos para los pasos paralelos de las sagas (aparte del executor de fan_out)
+SAGA_WORKERS = int(os.getenv('SAGA_WORKERS', '4'))
+
+# Executor propio de las sagas: una consulta distribuida lenta no retrasa sus pasos
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_executor_after_fork():
+    """Los hilos del executor no sobreviven al fork: el hijo crea el suyo en el primer uso"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def get_saga_executor():
+    """Obtiene (o crea) el executor de los pasos paralelos de las sagas"""
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SAGA_WORKERS, thread_name_prefix='saga')
+        return _executor
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sagas (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    context TEXT NOT NULL,
+    completed TEXT NOT NULL,
+    failed_step TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sagas_status ON sagas (status, updated_at);
+"""
+
+# Estados: running, compensating, done, compensated, failed (la compensación también falló)
+SAGA_STATUSES = ('running', 'compensating', 'done', 'compensated', 'failed')
+
+# Clave del contexto con los pasos cuyas escrituras quedaron en la unidad de trabajo
+# (sin confirmar): si la unidad se revierte no hay nada que compensar de ellos
+DEFERRED_STEPS_KEY = 'pasos_en_unidad'
+
+
+class SagaError(Exception):
+    """Error de un paso con mensaje para el usuario (el resultado de la saga lo devuelve tal cual)"""
+
+
+class SagaStep:
+    """Paso de una saga
+
+    action(context) devuelve el resultado, que queda en context[name]; compensation(context)
+    deshace el paso si un paso posterior falla. after: pasos que deben terminar antes; los
+    pasos sin dependencias entre sí se ejecutan a la vez (deben ser solo lecturas: en otro
+    hilo no comparten la unidad de trabajo de la petición; si la petición ya escribió,
+    la oleada corre en su hilo). durable=False no guarda el
+    resultado en el estado persistido (lecturas grandes que no hacen falta para compensar).
+    transactional=False indica que el paso no escribe en la base (ej. reservar un ID en
+    memoria): su compensación corre aunque la unidad de trabajo se revierta.
+    Las compensaciones deben tolerar que el paso no haya llegado a confirmarse.
+    """
+
+    def __init__(self, name, action, compensation=None, after=(), durable=True, transactional=True):
+        self.name = name
+        self.action = action
+        self.compensation = compensation
+        self.after = tuple(after)
+        self.durable = durable
+        self.transactional = transactional
+
+
+class SagaLog:
+    """Estado persistido de las sagas (SQLite local, compartido por los procesos del nodo)"""
+
+    def __init__(self, path=SAGA_STATE_PATH):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    connection = sqlite3.connect(self.path, timeout=30)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(_SCHEMA)
+                    connection.close()
+                    self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _execute(self, query, params):
+        connection = self._connect()
+        with connection:
+            rowcount = connection.execute(query, params).rowcount
+        connection.close()
+        return rowcount
+
+    def save(self, saga_id, name, status, context, completed, failed_step=None, error=None, created=False):
+        now = time.time()
+        values = (status, json.dumps(context, default=str), json.dumps(completed), failed_step, error, now)
+        if created:
+            self._execute(
+                """INSERT INTO sagas (status, context, completed, failed_step, error, updated_at, id, name, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                values + (saga_id, name, now)
+            )
+        else:
+            self._execute(
+                """UPDATE sagas SET status = ?, context = ?, completed = ?, failed_step = ?, error = ?,
+                                    updated_at = ?
+                   WHERE id = ?""",
+                values + (saga_id,)
+            )
+
+    def claim_abandoned(self, older_than=SAGA_RESUME_AFTER):
+        """Toma las sagas sin avances recientes (un solo proceso se queda con cada una)"""
+        connection = self._connect()
+        rows = connection.execute(
+            "SELECT * FROM sagas WHERE status IN ('running', 'compensating') AND updated_at < ?",
+            (time.time() - older_than,)
+        ).fetchall()
+        claimed = []
+        with connection:
+            for row in rows:
+                taken = connection.execute(
+                    "UPDATE sagas SET status = 'compensating', updated_at = ? WHERE id = ? AND updated_at = ?",
+                    (time.time(), row['id'], row['updated_at'])
+                ).rowcount
+                if taken:
+                    claimed.append(dict(row, context=json.loads(row['context']),
+                                        completed=json.loads(row['completed'])))
+        connection.close()
+        return claimed
+
+    def purge(self, older_than=SAGA_RETENTION):
+        return self._execute("DELETE FROM sagas WHERE status IN ('done', 'compensated') AND updated_at < ?",
+                             (time.time() - older_than,))
+
+    def status(self, limit=50):
+        """Sagas por estado y las últimas sin terminar o fallidas"""
+        connection = self._connect()
+        counts = {status: 0 for status in SAGA_STATUSES}
+        for row in connection.execute("SELECT status, COUNT(*) AS total FROM sagas GROUP BY status"):
+            counts[row['status']] = row['total']
+        entries = [
+            dict(row) for row in connection.execute(
+                """SELECT id, name, status, completed, failed_step, error, created_at, updated_at
+                   FROM sagas WHERE status IN ('running', 'compensating', 'failed')
+                   ORDER BY updated_at DESC LIMIT ?""",
+                (limit,)
+            )
+        ]
+        connection.close()
+        return {'counts': counts, 'entries': entries}
+
+
+# Estado compartido por todas las sagas del proceso
+saga_log = SagaLog()
+
+
+class Saga:
+    """Operación de varios pasos entre nodos con compensaciones declaradas
+
+    run() ejecuta los pasos por oleadas según sus dependencias (en paralelo dentro de
+    cada oleada), guarda el estado tras cada oleada y, si un paso falla, compensa los
+    pasos ya completados en orden inverso. Con unidad de trabajo, las escrituras de los
+    pasos que corren en el hilo de la petición quedan pendientes en ella: el estado final
+    ('done') se guarda cuando la petición confirma, y si falla un paso o la petición se
+    revierte esas escrituras se descartan con la unidad y solo se compensan los pasos ya
+    confirmados (los de otros hilos o transactional=False). Cada paso y cada compensación se mide en /metrics
+    como statement="saga <nombre>.<paso>". Se declara una vez por proceso (a nivel
+    de módulo): el nombre la registra para compensar las abandonadas.
+    """
+
+    def __init__(self, name, steps, log=None):
+        self.name = name
+        self.steps = {step.name: step for step in steps}
+        self.order = [step.name for step in steps]
+        self.log = log if log is not None else saga_log
+        for step in steps:
+            missing = [dep for dep in step.after if dep not in self.steps]
+            if missing:
+                raise ValueError(f"Saga {name}: el paso {step.name} depende de pasos inexistentes: {missing}")
+        if name in _sagas:
+            raise ValueError(f"Saga {name} ya declarada")
+        _sagas[name] = self
+
+    def _durable_context(self, context):
+        return {key: value for key, value in context.items()
+                if key not in self.steps or self.steps[key].durable}
+
+    def _save(self, saga_id, status, context, completed, **kwargs):
+        try:
+            self.log.save(saga_id, self.name, status, self._durable_context(context), completed, **kwargs)
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo guardar el estado de la saga {self.name} ({saga_id}): {e}")
+
+    def _timed(self, label, func, context, node):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = func(context)
+            ok = True
+            return result
+        finally:
+            query_metrics.record(f"saga {self.name}.{label}", node, execute=time.perf_counter() - started, ok=ok)
+
+    def _run_wave(self, names, context):
+        """Ejecuta una oleada; devuelve ({paso: resultado}, (paso, excepción) o None, en_hilo_actual)"""
+        node = context.get('node')
+        if len(names) == 1 or pending_writes_unit() is not None:
+            # En el hilo de la petición (comparte su unidad de trabajo): un solo paso, o
+            # una oleada después de escribir, que en otro hilo no vería esas escrituras
+            results = {}
+            for name in names:
+                try:
+                    results[name] = self._timed(name, self.steps[name].action, context, node)
+                except Exception as e:
+                    return results, (name, e), True
+            return results, None, True
+
+        snapshot = dict(context)
+        futures = {get_saga_executor().submit(self._timed, name, self.steps[name].action, snapshot, node): name
+                   for name in names}
+        wait(futures)
+        results, failure = {}, None
+        for future, name in futures.items():
+            if future.exception() is not None:
+                failure = failure or (name, future.exception())
+            else:
+                results[name] = future.result()
+        return results, failure, False
+
+    def _committed(self, completed, context):
+        """Pasos completados cuyos efectos ya están confirmados (los que hay que compensar)"""
+        deferred = set(context.get(DEFERRED_STEPS_KEY, ()))
+        return [name for name in completed if name not in deferred]
+
+    def _compensate(self, completed, context):
+        """Compensa en orden inverso; devuelve el error de la primera compensación fallida o None"""
+        error = None
+        node = context.get('node')
+        for name in reversed(completed):
+            step = self.steps.get(name)
+            if step is None or step.compensation is None:
+                continue
+            try:
+                self._timed(f"{name} (compensación)", step.compensation, context, node)
+                print(f"🔄 Saga {self.name}: paso {name} compensado")
+            except Exception as e:
+                print(f"❌ Saga {self.name}: falló la compensación de {name}: {e}")
+                error = error or f"{name}: {e}"
+        return error
+
+    def run(self, **context):
+        """Ejecuta la saga; devuelve {'success', 'saga_id', 'context'} o el error y el paso que falló"""
+        saga_id = uuid.uuid4().hex
+        completed = []
+        started = time.perf_counter()
+        unit = current_unit_of_work()
+        context[DEFERRED_STEPS_KEY] = []
+        try:
+            self.log.save(saga_id, self.name, 'running', self._durable_context(context), completed, created=True)
+        except sqlite3.Error as e:
+            print(f"⚠️ Saga {self.name} sin estado persistido: {e}")
+
+        pending = list(self.order)
+        failure = None
+        while pending and failure is None:
+            wave = [name for name in pending if all(dep in completed for dep in self.steps[name].after)]
+            if not wave:
+                raise ValueError(f"Saga {self.name}: dependencias circulares entre {pending}")
+            results, failure, in_unit = self._run_wave(wave, context)
+            for name in wave:
+                if name in results:
+                    context[name] = results[name]
+                    completed.append(name)
+                    pending.remove(name)
+                    if in_unit and unit is not None and self.steps[name].transactional:
+                        context[DEFERRED_STEPS_KEY].append(name)
+            self._save(saga_id, 'running', context, completed)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if failure is None:
+            print(f"⏱️ Saga {self.name} completada en {elapsed_ms:.0f} ms")
+            self._finish_with_unit(saga_id, context, completed)
+            return {'success': True, 'saga_id': saga_id, 'context': context}
+
+        failed_step, exception = failure
+        print(f"⚠️ Saga {self.name}: falló el paso {failed_step} ({exception}), compensando...")
+        self._save(saga_id, 'compensating', context, completed, failed_step=failed_step, error=str(exception))
+        if unit is not None:
+            # Lo escrito en la unidad no se confirma: se descarta en lugar de compensarlo
+            unit.fail(f"saga {self.name}: falló el paso {failed_step}")
+        compensation_error = self._compensate(self._committed(completed, context), context)
+        self._save(saga_id, 'failed' if compensation_error else 'compensated', context, completed,
+                   failed_step=failed_step, error=compensation_error or str(exception))
+        return {
+            'success': False,
+            'saga_id': saga_id,
+            'failed_step': failed_step,
+            'error': str(exception) if isinstance(exception, SagaError) else f'{failed_step}: {exception}',
+            'compensated': compensation_error is None,
+            'context': context
+        }
+
+    def _finish_with_unit(self, saga_id, context, completed):
+        """Guarda 'done' al confirmar la petición; si se revierte, compensa los pasos confirmados
+
+        Sin unidad de trabajo los pasos ya están confirmados y se guarda de inmediato.
+        Hasta que la petición termine la saga sigue en 'running': si el proceso cae, se
+        compensa como abandonada (también solo los pasos confirmados).
+        """
+        def done():
+            self._save(saga_id, 'done', context, completed)
+
+        def rolled_back():
+            # Las escrituras de la unidad nunca se confirmaron: no hay filas que deshacer
+            print(f"⚠️ Saga {self.name}: la petición se revirtió, compensando lo ya confirmado...")
+            error = self._compensate(self._committed(completed, context), context)
+            self._save(saga_id, 'failed' if error else 'compensated', context, completed,
+                       error=error or 'petición revertida')
+
+        unit = current_unit_of_work()
+        if unit is None:
+            done()
+        else:
+            unit.on_commit(done)
+            unit.on_rollback(rolled_back)
+
+    def resume(self, state):
+        """Compensa una saga abandonada (tomada con SagaLog.claim_abandoned)"""
+        print(f"🔄 Saga {self.name} ({state['id']}) abandonada en {state['status']}, compensando...")
+        error = self._compensate(self._committed(state['completed'], state['context']), state['context'])
+        self._save(state['id'], 'failed' if error else 'compensated', state['context'], state['completed'],
+                   failed_step=state['failed_step'], error=error or state['error'] or 'abandonada')
+        return error is None
+
+
+# Sagas declaradas en el proceso, por nombre (para compensar las abandonadas)
+_sagas = {}
+
+def resume_abandoned_sagas(log=None):
+    """Compensa las sagas que un proceso dejó a medias; devuelve cuántas se compensaron"""
+    log = log or saga_log
+    try:
+        abandoned = log.claim_abandoned()
+        log.purge()
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo revisar el estado de las sagas: {e}")
+        return 0
+
+    compensated = 0
+    for state in abandoned:
+        saga = _sagas.get(state['name'])
+        if saga is None:
+            print(f"⚠️ Saga desconocida en el estado persistido: {state['name']} ({state['id']})")
+            continue
+        try:
+            compensated += saga.resume(state)
+        except Exception as e:
+            print(f"❌ Error compensando la saga {state['name']} ({state['id']}): {e}")
+    return compensated
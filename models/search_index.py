@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+from .changes import ChangeWatcher
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Segundos tras los que el índice se reconstruye en segundo plano (escrituras de otros procesos)
+SEARCH_INDEX_TTL = float(os.getenv('SEARCH_INDEX_TTL', '300'))
+
+# Longitud máxima de los n-gramas indexados; términos más largos se buscan por sus trigramas
+MAX_GRAM = 3
+
+
+def normalize(text):
+    """Minúsculas y sin tildes, para que 'jose' encuentre 'José'"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def grams_of_size(text, size):
+    return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+
+def grams(text):
+    """n-gramas de longitud 1..MAX_GRAM de un texto ya normalizado"""
+    result = set()
+    for size in range(1, MAX_GRAM + 1):
+        result |= grams_of_size(text, size)
+    return result
+
+
+class SearchIndex:
+    """Índice de subcadenas (n-gramas) en memoria sobre algunos campos de una vista
+
+    Responde lo mismo que Campo LIKE '%término%' sobre cualquiera de los campos, sin
+    recorrer la vista: intersecta las listas de los n-gramas del término y verifica
+    solo los candidatos. Con change_entity, una escritura de otro worker (registro de
+    cambios) lo marca para reconstruir sin esperar al TTL.
+    """
+
+    def __init__(self, key_columns, text_columns, ttl=SEARCH_INDEX_TTL, change_entity=None):
+        self.key_columns = tuple(key_columns)
+        self.text_columns = tuple(text_columns)
+        self.ttl = ttl
+        self._changes = ChangeWatcher(change_entity) if change_entity else None
+        # Otro worker cambió la entidad después de la última carga
+        self._outdated = False
+
+        self._rows = {}
+        self._texts = {}
+        self._postings = defaultdict(set)
+        self._built_at = None
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        # Escrituras ocurridas mientras se reconstruye; se reaplican sobre el índice nuevo
+        self._journal = None
+
+    @property
+    def ready(self):
+        return self._built_at is not None
+
+    def is_stale(self):
+        if self._changes is not None and self._changes.changed():
+            self._outdated = True
+        return (self._outdated or self._built_at is None
+                or time.monotonic() - self._built_at >= self.ttl)
+
+    def _key(self, row):
+        return tuple(row[column] for column in self.key_columns)
+
+    def _add(self, structures, row):
+        rows, texts_by_key, postings = structures
+        key = self._key(row)
+        texts = tuple(normalize(row[column]) for column in self.text_columns
+                      if row.get(column) is not None)
+        rows[key] = row
+        texts_by_key[key] = texts
+        for text in texts:
+            for gram in grams(text):
+                postings[gram].add(key)
+
+    def _remove(self, structures, key):
+        rows, texts_by_key, postings = structures
+        texts = texts_by_key.pop(key, None)
+        rows.pop(key, None)
+        if texts is None:
+            return
+        for text in texts:
+            for gram in grams(text):
+                keys = postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del postings[gram]
+
+    def _structures(self):
+        return self._rows, self._texts, self._postings
+
+    def rebuild_from(self, loader):
+        """Reconstruye el índice con loader() -> filas (o None si la consulta falla)
+
+        Se arma aparte y se reemplaza al final, así las búsquedas no esperan la carga.
+        """
+        with self._lock:
+            self._journal = []
+            # Un cambio ajeno posterior a este punto vuelve a marcarlo
+            self._outdated = False
+        try:
+            rows = loader()
+            if rows is None:
+                with self._lock:
+                    self._outdated = True
+                return False
+
+            structures = ({}, {}, defaultdict(set))
+            for row in rows:
+                self._add(structures, row)
+
+            with self._lock:
+                self._rows, self._texts, self._postings = structures
+                for operation, value in self._journal:
+                    if operation == 'upsert':
+                        self._remove(structures, self._key(value))
+                        self._add(structures, value)
+                    else:
+                        self._remove(structures, value)
+                self._built_at = time.monotonic()
+            return True
+        finally:
+            with self._lock:
+                self._journal = None
+
+    def upsert(self, row):
+        """Agrega o reemplaza una fila (después de crear o actualizar)"""
+        with self._lock:
+            structures = self._structures()
+            self._remove(structures, self._key(row))
+            self._add(structures, row)
+            if self._journal is not None:
+                self._journal.append(('upsert', row))
+
+    def remove(self, key):
+        """Quita una fila por su clave (después de eliminar)"""
+        key = tuple(key)
+        with self._lock:
+            self._remove(self._structures(), key)
+            if self._journal is not None:
+                self._journal.append(('remove', key))
+
+    def search(self, term, where=None):
+        """Filas cuyo algún campo contiene el término, ordenadas por clave; None si el índice está frío
+
+        where(row) -> bool filtra adicionalmente (ej. solo el hospital local).
+        """
+        if not self.ready:
+            return None
+
+        needle = normalize(term.strip())
+        with self._lock:
+            if not needle:
+                keys = set(self._rows)
+            elif len(needle) <= MAX_GRAM:
+                keys = set(self._postings.get(needle, ()))
+            else:
+                postings = [self._postings.get(gram, set()) for gram in grams_of_size(needle, MAX_GRAM)]
+                postings.sort(key=len)
+                keys = set(postings[0]).intersection(*postings[1:])
+                # Los trigramas pueden coincidir en distinto orden: confirmar la subcadena
+                keys = {key for key in keys if any(needle in text for text in self._texts[key])}
+
+            rows = [self._rows[key] for key in sorted(keys)]
+
+        if where is not None:
+            rows = [row for row in rows if where(row)]
+        return rows
+
+    def start_rebuild(self, loader):
+        """Reconstruye en segundo plano (una sola reconstrucción a la vez)"""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild_from(loader)
+            except Exception as e:
+                print(f"❌ Error reconstruyendo índice de búsqueda: {e}")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name='search-index-rebuild', daemon=True).start()
+
+
+# Índices compartidos por todo el proceso, uno por (entidad, nodo)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(entity, node, key_columns, text_columns, change_entity=None):
+    """Obtiene (o crea vacío) el índice de búsqueda de (entidad, nodo)
+
+    change_entity es el nombre de la entidad en el registro de cambios, si se registra.
+    """
+    key = (entity, node)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SearchIndex(key_columns, text_columns, change_entity=change_entity)
+            _indexes[key] = index
+        return index
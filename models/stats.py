@@ -0,0 +1,108 @@
+import os
+
+from dotenv import load_dotenv
+
+from .base import DatabaseConnection
+from .cache import AggregateCache
+from .changes import ChangeWatcher
+from .fanout import fan_out, DISTRIBUTED_TIMEOUT
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Hospital de cada nodo (el filtro por ID_Hospital hace que la vista particionada
+# solo lea la tabla miembro local, sin pasar por el linked server)
+HOSPITAL_BY_NODE = {'quito': 1, 'guayaquil': 2}
+
+# Conteos de las tres vistas distribuidas y de Especialidad en un solo viaje al servidor
+STATS_QUERY = """
+SELECT 'pacientes' AS Entidad, ID_Hospital, COUNT(*) AS Total
+FROM Vista_Paciente WHERE ID_Hospital = ? GROUP BY ID_Hospital
+UNION ALL
+SELECT 'citas', ID_Hospital, COUNT(*)
+FROM Vista_Atencion_Medica WHERE ID_Hospital = ? GROUP BY ID_Hospital
+UNION ALL
+SELECT 'personal_medico', ID_Hospital, COUNT(*)
+FROM Vista_INF_Personal WHERE ID_Hospital = ? GROUP BY ID_Hospital
+UNION ALL
+SELECT 'especialidades', NULL, COUNT(*) FROM Especialidad
+"""
+
+
+_stats_cache = AggregateCache(float(os.getenv('STATS_CACHE_TTL', '60')))
+
+
+# invalidate_stats() solo limpia la caché del worker que escribió; las escrituras de
+# los demás workers llegan por el registro de cambios de las entidades contadas
+_stats_watchers = [ChangeWatcher(entity) for entity in ('pacientes', 'atenciones', 'personal-medico', 'especialidades')]
+
+
+def invalidate_stats():
+    """Descarta las estadísticas cacheadas (llamar después de crear o eliminar registros)"""
+    _stats_cache.invalidate()
+
+
+class HospitalStatsModel(DatabaseConnection):
+    """Estadísticas del hospital: un conteo agrupado por nodo, consultados en paralelo"""
+
+    def _count_hospital(self, hospital_id, node):
+        """Conteos de un hospital ejecutados en el nodo indicado; None si el nodo falla"""
+        return self.execute_query(STATS_QUERY, (hospital_id, hospital_id, hospital_id), node=node,
+                                  timeout=DISTRIBUTED_TIMEOUT)
+
+    def _load_stats(self):
+        """Calcula las estadísticas; devuelve (stats, completo)"""
+        nodes = list(HOSPITAL_BY_NODE)
+        results, _ = fan_out(
+            lambda node: self._count_hospital(HOSPITAL_BY_NODE[node], node),
+            nodes, DISTRIBUTED_TIMEOUT
+        )
+
+        # Si un nodo no respondió directamente, pedir su partición a otro nodo vía linked server
+        reachable = [node for node in nodes if results[node] is not None]
+        for node in nodes:
+            if results[node] is None and reachable:
+                print(f"⚠️ Estadísticas: nodo {node} sin respuesta, consultando vía {reachable[0]}")
+                results[node] = self._count_hospital(HOSPITAL_BY_NODE[node], reachable[0])
+
+        stats = {'total_especialidades': 0}
+        totals = {'pacientes': 0, 'citas': 0, 'personal_medico': 0}
+        for node in nodes:
+            per_node = {'pacientes': 0, 'citas': 0, 'personal_medico': 0}
+            for row in results[node] or []:
+                count = int(row['Total'] or 0)
+                if row['Entidad'] == 'especialidades':
+                    # Especialidad está replicada: todos los nodos devuelven el mismo conteo
+                    stats['total_especialidades'] = max(stats['total_especialidades'], count)
+                else:
+                    per_node[row['Entidad']] = count
+                    totals[row['Entidad']] += count
+            stats[node] = per_node
+
+        stats['total_pacientes'] = totals['pacientes']
+        stats['total_citas'] = totals['citas']
+        stats['total_personal'] = totals['personal_medico']
+
+        complete = all(results[node] is not None for node in nodes)
+        return stats, complete
+
+    def get_hospital_stats(self):
+        """Estadísticas desde la caché; solo se consulta la base al expirar o tras una escritura"""
+        try:
+            # Se consultan todos los vigilantes (cada uno actualiza su referencia)
+            if any([watcher.changed() for watcher in _stats_watchers]):
+                invalidate_stats()
+            stats, cached = _stats_cache.get(self._load_stats)
+            if not cached:
+                print(f"📊 DEBUG: Estadísticas calculadas: {stats}")
+            return {
+                'success': True,
+                'stats': stats,
+                'cached': cached
+            }
+        except Exception as e:
+            print(f"❌ Error al obtener estadísticas del hospital: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
@@ -1,4 +1,7 @@
 from .base import DatabaseConnection
+from .cache import tipo_atencion_cache
+from .unit_of_work import after_commit
+from .changes import record_change
 
 class TipoAtencionModel(DatabaseConnection):
     """Modelo para manejar operaciones con la tabla Tipo_Atención"""
@@ -7,7 +10,7 @@ class TipoAtencionModel(DatabaseConnection):
         super().__init__()
     
     def get_all_tipos_atencion(self, node=None):
-        """Obtiene todos los tipos de atención desde la tabla Tipo_Atención"""
+        """Obtiene todos los tipos de atención (desde la caché del catálogo; la base solo en el primer acceso)"""
         try:
             current_node = node or self.detect_current_node()
             if not current_node:
@@ -20,10 +23,12 @@ class TipoAtencionModel(DatabaseConnection):
                 }
             
             query = "SELECT ID_Tipo, Tipo FROM Tipo_Atención ORDER BY ID_Tipo"
-            results = self.execute_query(query, node=current_node)
+            results, cached = tipo_atencion_cache.get(
+                current_node, lambda: self.execute_query(query, node=current_node)
+            )
             
-            # Debug: Ver qué campos están disponibles
-            if results and len(results) > 0:
+            # Debug: Ver qué campos están disponibles (solo cuando se leyó de la base)
+            if results and not cached:
                 print(f"Campos disponibles en Tipo_Atención: {list(results[0].keys())}")
                 print(f"Primer registro: {results[0]}")
             
@@ -41,6 +46,7 @@ class TipoAtencionModel(DatabaseConnection):
                 'tipos_atencion': results,
                 'node': current_node,
                 'total': len(results),
+                'cached': cached,
                 'error': None
             }
             
@@ -53,6 +59,13 @@ class TipoAtencionModel(DatabaseConnection):
                 'total': 0
             }
     
+    def warm_catalog_cache(self, node=None):
+        """Carga el catálogo de tipos de atención en memoria al arrancar; True si quedó cacheado"""
+        result = self.get_all_tipos_atencion(node)
+        if not result['success']:
+            print(f"⚠️ No se pudo precargar el catálogo de tipos de atención: {result['error']}")
+        return result['success']
+    
     def get_tipo_atencion_by_id(self, id_tipo, node=None):
         """Obtiene un tipo de atención específico por ID"""
         try:
@@ -133,6 +146,9 @@ class TipoAtencionModel(DatabaseConnection):
             result = self.execute_query(query, params, node=current_node)
             
             if result is not None and result > 0:
+                after_commit(tipo_atencion_cache.invalidate)
+                # Los demás workers invalidan su copia al ver el cambio
+                record_change('tipos-atencion')
                 return {
                     'success': True,
                     'message': f'Tipo de atención creado exitosamente en nodo {current_node} con ID {next_id}',
@@ -176,6 +192,8 @@ class TipoAtencionModel(DatabaseConnection):
             result = self.execute_query(query, params, node=current_node)
             
             if result is not None and result > 0:
+                after_commit(tipo_atencion_cache.invalidate)
+                record_change('tipos-atencion')
                 return {
                     'success': True,
                     'message': f'Tipo de atención actualizado exitosamente en nodo {current_node}'
@@ -212,6 +230,8 @@ class TipoAtencionModel(DatabaseConnection):
             result = self.execute_query(query, (id_tipo,), node=current_node)
             
             if result is not None and result > 0:
+                after_commit(tipo_atencion_cache.invalidate)
+                record_change('tipos-atencion')
                 return {
                     'success': True,
                     'message': f'Tipo de atención eliminado exitosamente del nodo {current_node}'
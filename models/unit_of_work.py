@@ -0,0 +1,198 @@
+import threading
+from contextlib import contextmanager
+
+import pyodbc
+
+# Marca los hilos que están ejecutando los callbacks de fin de una unidad
+_finishing = threading.local()
+# Marca los hilos que trabajan fuera de la unidad de su petición (outside_unit_of_work)
+_detached = threading.local()
+
+
+class UnitConnection:
+    """Conexión compartida por una unidad de trabajo
+
+    Se comporta como la conexión pyodbc, salvo que commit() se difiere hasta el final
+    de la unidad y rollback() descarta el trabajo del nodo y marca la unidad como fallida
+    si había escrituras pendientes.
+    """
+
+    def __init__(self, unit, node, connection):
+        object.__setattr__(self, '_unit', unit)
+        object.__setattr__(self, 'node', node)
+        object.__setattr__(self, 'raw', connection)
+        # Hubo escrituras que el modelo quiso confirmar (se confirman al cerrar la unidad)
+        object.__setattr__(self, 'dirty', False)
+        object.__setattr__(self, 'broken', False)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        # timeout, autocommit, etc. van a la conexión real
+        setattr(self.raw, name, value)
+
+    def commit(self):
+        object.__setattr__(self, 'dirty', True)
+
+    def rollback(self):
+        if self.dirty:
+            self._unit.fail(f"rollback en {self.node} con escrituras pendientes")
+        object.__setattr__(self, 'dirty', False)
+        try:
+            self.raw.rollback()
+        except pyodbc.Error:
+            object.__setattr__(self, 'broken', True)
+
+
+class UnitOfWork:
+    """Unidad de trabajo de una petición: una conexión por nodo y un solo commit al final
+
+    Las conexiones se piden al pool la primera vez que se usa cada nodo y se devuelven
+    en finish(), que confirma todos los nodos o, si la petición falló, los revierte.
+    Está pensada para un solo hilo (el de la petición); las consultas en paralelo
+    (fan_out, oleadas de sagas) usan conexiones propias del pool, salvo que la unidad ya
+    tenga escrituras pendientes: entonces corren en el hilo de la petición, porque otra
+    conexión no vería esas escrituras y podría quedar esperando sus bloqueos.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._rollback_callbacks = []
+        self._commit_callbacks = []
+        self.failed = False
+        self.failure = None
+        self._thread = threading.get_ident()
+
+    def fail(self, reason):
+        if not self.failed:
+            print(f"⚠️ Unidad de trabajo fallida: {reason}")
+        self.failed = True
+        self.failure = self.failure or reason
+
+    def on_rollback(self, callback):
+        """callback() se ejecuta si la unidad termina sin confirmar (ej. deshacer una caché write-through)"""
+        self._rollback_callbacks.append(callback)
+
+    def on_commit(self, callback):
+        """callback() se ejecuta si la unidad termina confirmada (ej. liberar una escritura en cola)"""
+        self._commit_callbacks.append(callback)
+
+    def owns_thread(self):
+        return threading.get_ident() == self._thread
+
+    def has_pending_writes(self):
+        """True si algún nodo tiene escrituras sin confirmar (y sus bloqueos tomados)"""
+        return any(connection.dirty for connection, _ in self._connections.values())
+
+    @contextmanager
+    def use(self, node, pool):
+        """Presta la conexión compartida del nodo; una excepción en el bloque revierte el nodo"""
+        entry = self._connections.get(node)
+        if entry is None:
+            entry = (UnitConnection(self, node, pool.acquire()), pool)
+            self._connections[node] = entry
+        connection = entry[0]
+        try:
+            yield connection
+        except Exception:
+            connection.rollback()
+            raise
+
+    def finish(self, success=True):
+        """Confirma (o revierte) cada nodo y devuelve las conexiones a su pool
+
+        Devuelve True si todo lo pendiente quedó confirmado.
+        """
+        commit = success and not self.failed
+        committed = not self.failed
+        for node, (connection, pool) in self._connections.items():
+            broken = connection.broken
+            try:
+                if not broken:
+                    if commit and connection.dirty:
+                        connection.raw.commit()
+                    else:
+                        connection.raw.rollback()
+            except pyodbc.Error as e:
+                print(f"❌ Error cerrando unidad de trabajo en {node}: {e}")
+                broken = True
+                committed = committed and not connection.dirty
+            if connection.dirty and not commit:
+                committed = False
+            pool.release(connection.raw, discard=broken)
+        self._connections.clear()
+        # Los callbacks corren fuera de la unidad: si consultan la base usan conexiones
+        # propias del pool (la petición ya no debe abrir otra unidad que nadie cierra)
+        _finishing.active = True
+        try:
+            for callback in self._commit_callbacks if committed else self._rollback_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"❌ Error en callback de unidad de trabajo: {e}")
+        finally:
+            _finishing.active = False
+        self._rollback_callbacks.clear()
+        self._commit_callbacks.clear()
+        return committed
+
+
+# Quién expone la unidad de trabajo actual (la app la liga a flask.g por petición)
+_provider = None
+
+
+def set_unit_of_work_provider(provider):
+    """provider() -> UnitOfWork activa o None; None desactiva las unidades de trabajo"""
+    global _provider
+    _provider = provider
+
+
+def current_unit_of_work():
+    """Unidad de trabajo activa en este hilo, o None (scripts, hilos de fan_out, modo async)"""
+    if _provider is None or getattr(_finishing, 'active', False) or getattr(_detached, 'active', False):
+        return None
+    unit = _provider()
+    if unit is not None and not unit.owns_thread():
+        return None
+    return unit
+
+
+@contextmanager
+def outside_unit_of_work():
+    """Dentro del bloque el hilo no usa la unidad de trabajo de la petición
+
+    Para trabajos largos que confirman por su cuenta (ej. una importación): sus consultas
+    usan conexiones propias del pool y no dejan bloqueos abiertos hasta el fin de la petición.
+    """
+    previous = getattr(_detached, 'active', False)
+    _detached.active = True
+    try:
+        yield
+    finally:
+        _detached.active = previous
+
+
+def pending_writes_unit():
+    """Unidad de trabajo de este hilo si tiene escrituras pendientes, o None
+
+    El trabajo en otros hilos (fan_out, pasos paralelos de sagas) se hace en el hilo de
+    la petición mientras esto no sea None.
+    """
+    unit = current_unit_of_work()
+    if unit is not None and unit.has_pending_writes():
+        return unit
+    return None
+
+
+def after_commit(callback):
+    """Ejecuta callback() cuando la unidad de trabajo actual confirme; sin unidad, de inmediato
+
+    Para efectos fuera de la base (cachés, índices, IDs liberados) que no deben verse
+    antes del commit ni quedar aplicados si la petición se revierte.
+    """
+    unit = current_unit_of_work()
+    if unit is not None:
+        unit.on_commit(callback)
+    else:
+        callback()
@@ -156,6 +156,195 @@ BEGIN
     END CATCH
 END;
 
+-- ===============================================
+-- OPERACIONES POR LOTE (TABLE-VALUED PARAMETERS)
+-- N pacientes en una sola transacción distribuida: todo o nada.
+-- Devuelven una fila por paciente (Fila, ID_Hospital, ID_Paciente, Error);
+-- Error NULL = aplicado. Si alguna fila falla la validación no se aplica ninguna.
+-- ===============================================
+
+CREATE TYPE TipoPacienteLote AS TABLE (
+    Fila INT NOT NULL PRIMARY KEY,
+    ID_Hospital INT NOT NULL,
+    ID_Paciente INT NOT NULL,
+    Nombre VARCHAR(50),
+    Apellido VARCHAR(50),
+    Direccion VARCHAR(100),
+    FechaNacimiento DATE,
+    Sexo CHAR(1),
+    Telefono VARCHAR(20)
+);
+
+CREATE TYPE TipoPacienteClaveLote AS TABLE (
+    Fila INT NOT NULL PRIMARY KEY,
+    ID_Hospital INT NOT NULL,
+    ID_Paciente INT NOT NULL
+);
+
+CREATE PROCEDURE SP_Create_Pacientes_Lote
+    @Pacientes TipoPacienteLote READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    DECLARE @Resultado TABLE (Fila INT PRIMARY KEY, ID_Hospital INT, ID_Paciente INT, Error NVARCHAR(200));
+    
+    BEGIN DISTRIBUTED TRANSACTION;
+    
+    BEGIN TRY
+        -- 1. Validar todas las filas: ID ya existente o repetido dentro del lote
+        INSERT INTO @Resultado (Fila, ID_Hospital, ID_Paciente, Error)
+        SELECT p.Fila, p.ID_Hospital, p.ID_Paciente,
+               CASE
+                   WHEN EXISTS (SELECT 1 FROM Vista_Paciente v
+                                WHERE v.ID_Hospital = p.ID_Hospital AND v.ID_Paciente = p.ID_Paciente)
+                       THEN N'Ya existe un paciente con ese ID'
+                   WHEN COUNT(*) OVER (PARTITION BY p.ID_Hospital, p.ID_Paciente) > 1
+                       THEN N'ID de paciente repetido en el lote'
+               END
+        FROM @Pacientes p;
+        
+        IF EXISTS (SELECT 1 FROM @Resultado WHERE Error IS NOT NULL)
+        BEGIN
+            ROLLBACK TRANSACTION;
+            SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+            RETURN;
+        END
+        
+        -- 2. Insertar todas las filas en Vista_Paciente con una sola sentencia
+        INSERT INTO Vista_Paciente (
+            ID_Hospital, ID_Paciente, Nombre, Apellido, Dirección, FechaNacimiento, Sexo, Teléfono
+        )
+        SELECT ID_Hospital, ID_Paciente, Nombre, Apellido, Direccion, FechaNacimiento, Sexo, Telefono
+        FROM @Pacientes;
+        
+        COMMIT TRANSACTION;
+        
+        SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+        
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+        
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        DECLARE @ErrorSeverity INT = ERROR_SEVERITY();
+        DECLARE @ErrorState INT = ERROR_STATE();
+        
+        RAISERROR('Error en SP_Create_Pacientes_Lote: %s', @ErrorSeverity, @ErrorState, @ErrorMessage);
+    END CATCH
+END;
+
+CREATE PROCEDURE SP_Update_Pacientes_Lote
+    @Pacientes TipoPacienteLote READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    DECLARE @Resultado TABLE (Fila INT PRIMARY KEY, ID_Hospital INT, ID_Paciente INT, Error NVARCHAR(200));
+    
+    BEGIN DISTRIBUTED TRANSACTION;
+    
+    BEGIN TRY
+        -- 1. Validar que existan todos los pacientes
+        INSERT INTO @Resultado (Fila, ID_Hospital, ID_Paciente, Error)
+        SELECT p.Fila, p.ID_Hospital, p.ID_Paciente,
+               CASE
+                   WHEN NOT EXISTS (SELECT 1 FROM Vista_Paciente v
+                                    WHERE v.ID_Hospital = p.ID_Hospital AND v.ID_Paciente = p.ID_Paciente)
+                       THEN N'No existe el paciente'
+                   WHEN COUNT(*) OVER (PARTITION BY p.ID_Hospital, p.ID_Paciente) > 1
+                       THEN N'Paciente repetido en el lote'
+               END
+        FROM @Pacientes p;
+        
+        IF EXISTS (SELECT 1 FROM @Resultado WHERE Error IS NOT NULL)
+        BEGIN
+            ROLLBACK TRANSACTION;
+            SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+            RETURN;
+        END
+        
+        -- 2. Actualizar todas las filas con una sola sentencia
+        UPDATE v
+        SET Nombre = p.Nombre,
+            Apellido = p.Apellido,
+            Dirección = p.Direccion,
+            FechaNacimiento = p.FechaNacimiento,
+            Sexo = p.Sexo,
+            Teléfono = p.Telefono
+        FROM Vista_Paciente v
+        INNER JOIN @Pacientes p ON v.ID_Hospital = p.ID_Hospital AND v.ID_Paciente = p.ID_Paciente;
+        
+        COMMIT TRANSACTION;
+        
+        SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+        
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+        
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        DECLARE @ErrorSeverity INT = ERROR_SEVERITY();
+        DECLARE @ErrorState INT = ERROR_STATE();
+        
+        RAISERROR('Error en SP_Update_Pacientes_Lote: %s', @ErrorSeverity, @ErrorState, @ErrorMessage);
+    END CATCH
+END;
+
+CREATE PROCEDURE SP_Delete_Pacientes_Lote
+    @Pacientes TipoPacienteClaveLote READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    DECLARE @Resultado TABLE (Fila INT PRIMARY KEY, ID_Hospital INT, ID_Paciente INT, Error NVARCHAR(200));
+    
+    BEGIN DISTRIBUTED TRANSACTION;
+    
+    BEGIN TRY
+        -- 1. Validar que existan todos los pacientes
+        INSERT INTO @Resultado (Fila, ID_Hospital, ID_Paciente, Error)
+        SELECT p.Fila, p.ID_Hospital, p.ID_Paciente,
+               CASE
+                   WHEN NOT EXISTS (SELECT 1 FROM Vista_Paciente v
+                                    WHERE v.ID_Hospital = p.ID_Hospital AND v.ID_Paciente = p.ID_Paciente)
+                       THEN N'No existe el paciente'
+                   WHEN COUNT(*) OVER (PARTITION BY p.ID_Hospital, p.ID_Paciente) > 1
+                       THEN N'Paciente repetido en el lote'
+               END
+        FROM @Pacientes p;
+        
+        IF EXISTS (SELECT 1 FROM @Resultado WHERE Error IS NOT NULL)
+        BEGIN
+            ROLLBACK TRANSACTION;
+            SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+            RETURN;
+        END
+        
+        -- 2. Eliminar todas las filas con una sola sentencia
+        DELETE v
+        FROM Vista_Paciente v
+        INNER JOIN @Pacientes p ON v.ID_Hospital = p.ID_Hospital AND v.ID_Paciente = p.ID_Paciente;
+        
+        COMMIT TRANSACTION;
+        
+        SELECT Fila, ID_Hospital, ID_Paciente, Error FROM @Resultado ORDER BY Fila;
+        
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+        
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        DECLARE @ErrorSeverity INT = ERROR_SEVERITY();
+        DECLARE @ErrorState INT = ERROR_STATE();
+        
+        RAISERROR('Error en SP_Delete_Pacientes_Lote: %s', @ErrorSeverity, @ErrorState, @ErrorMessage);
+    END CATCH
+END;
+
 -- ===============================================
 -- SCRIPT DE PRUEBA
 -- ===============================================
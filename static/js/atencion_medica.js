@@ -6,6 +6,26 @@
 class AtencionMedicaManager {
     constructor() {
         this.currentNode = null;
+        this.loader = new KeysetLoader('/api/atenciones');
+        this.changes = new DeltaStore('atenciones', ['ID_Hospital', 'ID_Atención'], 'atenciones');
+        // Solo se pintan las filas visibles; el filtro por tipo y el orden corren en un worker
+        this.table = new VirtualTable(
+            document.querySelector('.table-responsive'),
+            document.getElementById('tbody-atenciones') || document.querySelector('tbody'),
+            atencion => this.renderRow(atencion),
+            {
+                emptyHtml: `
+                    <tr>
+                        <td colspan="11" class="text-center text-muted py-4">
+                            <i class="bi bi-database-x"></i> 
+                            No hay atenciones médicas disponibles en Vista_Atencion_Medica
+                        </td>
+                    </tr>
+                `,
+                // Con orden o filtros activos se traen las páginas que faltan
+                loadAll: () => this.loadAllAtenciones()
+            }
+        );
         this.atenciones = [];
         this.filteredAtenciones = [];
         this.init();
@@ -39,6 +59,13 @@ class AtencionMedicaManager {
             searchInput.addEventListener('input', (e) => this.handleSearch(e.target.value));
         }
 
+        // Scroll infinito: pedir la siguiente página al acercarse al final de la tabla
+        this.loader.attachScroll(document.querySelector('.table-responsive'), () => {
+            if (!searchInput || !searchInput.value.trim()) {
+                this.loadMoreAtenciones();
+            }
+        });
+
         // Filtro por tipo
         const tipoFilter = document.getElementById('filterTipo');
         if (tipoFilter) {
@@ -47,32 +74,57 @@ class AtencionMedicaManager {
     }
 
     async loadAtenciones() {
+        // Reiniciar el cursor: la primera página reemplaza el contenido de la tabla
+        this.loader.reset();
+        this.showLoading();
+        await this.loadMoreAtenciones();
+    }
+
+    async loadMoreAtenciones() {
+        const firstPage = this.loader.after === null;
         try {
-            this.showLoading();
-            
-            const response = await fetch('/api/atenciones');
-            const data = await response.json();
+            const data = await this.loader.next();
+            if (!data) {
+                return;
+            }
             
             if (data.success) {
                 // Asegurar que tenemos un array válido
-                this.atenciones = Array.isArray(data.atenciones) ? data.atenciones : [];
-                this.filteredAtenciones = [...this.atenciones];
+                const page = Array.isArray(data.atenciones) ? data.atenciones : [];
+                this.atenciones = firstPage ? page : this.atenciones.concat(page);
                 this.currentNode = data.node;
-                this.updateTable();
-                this.updateStats(data.total || 0, data.node);
-                this.showSuccess(`Cargadas ${data.total || 0} atenciones desde Vista_Atencion_Medica (${data.node})`);
+                if (firstPage) {
+                    this.changes.reset(data.version);
+                }
+                this.applyFilters();
+                if (firstPage) {
+                    this.showSuccess(`Cargadas ${this.atenciones.length} atenciones desde Vista_Atencion_Medica (${data.node})`);
+                }
             } else {
-                this.atenciones = [];
-                this.filteredAtenciones = [];
+                if (firstPage) {
+                    this.atenciones = [];
+                    this.filteredAtenciones = [];
+                }
                 this.showError('Error al cargar atenciones: ' + data.error);
             }
         } catch (error) {
-            this.atenciones = [];
-            this.filteredAtenciones = [];
+            if (firstPage) {
+                this.atenciones = [];
+                this.filteredAtenciones = [];
+            }
             this.showError('Error de conexión: ' + error.message);
         }
     }
 
+    loadAllAtenciones() {
+        // Los resultados de la búsqueda ya vienen completos del servidor
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return null;
+        }
+        return this.loader.loadRest(() => this.loadMoreAtenciones());
+    }
+
     async searchAtenciones(searchTerm) {
         if (!searchTerm.trim()) {
             this.filteredAtenciones = [...this.atenciones];
@@ -107,89 +159,83 @@ class AtencionMedicaManager {
         }, 500);
     }
 
-    applyFilters() {
+    async applyFilters() {
         const tipoFilter = document.getElementById('filterTipo');
         
-        // Asegurar que tenemos un array válido
-        let filtered = Array.isArray(this.atenciones) ? [...this.atenciones] : [];
-        
-        // Filtro por tipo de atención
+        // Filtro por tipo de atención (se evalúa en el worker de la tabla, fuera del hilo principal)
+        const filters = {};
         if (tipoFilter && tipoFilter.value && tipoFilter.value !== '') {
-            const tipoId = parseInt(tipoFilter.value);
-            filtered = filtered.filter(a => a.ID_Tipo === tipoId);
+            filters.ID_Tipo = parseInt(tipoFilter.value);
         }
         
-        this.filteredAtenciones = filtered;
-        this.updateTable();
-        this.updateStats(filtered.length, this.currentNode);
+        // Asegurar que tenemos un array válido
+        const atenciones = Array.isArray(this.atenciones) ? this.atenciones : [];
+        this.filteredAtenciones = await this.table.show(atenciones, filters);
+        this.updateStats(this.filteredAtenciones.length, this.currentNode);
     }
 
     updateTable() {
-        const tbody = document.getElementById('tbody-atenciones') || 
-                     document.querySelector('tbody');
-        
-        if (!tbody) {
-            console.error('No se encontró el tbody de la tabla');
-            return;
-        }
-
-        // Debug: Ver qué datos estamos recibiendo
-        console.log('Datos de atenciones:', this.filteredAtenciones);
-
         // Asegurar que filteredAtenciones es un array válido
         const atenciones = Array.isArray(this.filteredAtenciones) ? this.filteredAtenciones : [];
 
-        if (atenciones.length === 0) {
-            tbody.innerHTML = `
-                <tr>
-                    <td colspan="11" class="text-center text-muted py-4">
-                        <i class="bi bi-database-x"></i> 
-                        No hay atenciones médicas disponibles en Vista_Atencion_Medica
-                    </td>
-                </tr>
-            `;
-            return;
+        // La tabla virtual solo crea las filas visibles y las reutiliza al hacer scroll
+        this.table.show(atenciones, {});
+    }
+
+    renderRow(atencion) {
+        const nodeColor = atencion.ID_Hospital === 1 ? 'success' : 'info';
+        const nodeName = atencion.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
+        
+        return `
+            <tr data-key="${this.changes.keyAttr(atencion)}" data-id-hospital="${atencion.ID_Hospital}" data-id-atencion="${atencion['ID_Atención']}">
+                <td class="text-center"><strong>${atencion.ID_Hospital}</strong></td>
+                <td class="text-center"><strong>${atencion['ID_Atención']}</strong></td>
+                <td class="text-center">${atencion.ID_Paciente || 'N/A'}</td>
+                <td class="text-center">${atencion.ID_Personal || 'N/A'}</td>
+                <td class="text-center">${atencion.ID_Tipo || 'N/A'}</td>
+                <td class="text-center">${atencion.Fecha || 'N/A'}</td>
+                <td>${this.escapeHtml(atencion.Diagnostico || 'Sin diagnóstico')}</td>
+                <td>${this.escapeHtml(atencion['Descripción'] || 'Sin descripción')}</td>
+                <td>${this.escapeHtml(atencion.Tratamiento || 'Sin tratamiento')}</td>
+                <td class="text-center">
+                    <span class="badge bg-${nodeColor}">${nodeName}</span>
+                </td>
+                <td class="text-center">
+                    <button class="btn btn-sm btn-outline-warning me-1" 
+                            onclick="atencionMedicaManager.editAtencion(${atencion.ID_Hospital}, ${atencion['ID_Atención']})" 
+                            title="Editar">
+                        <i class="bi bi-pencil"></i>
+                    </button>
+                    <button class="btn btn-sm btn-outline-danger" 
+                            onclick="atencionMedicaManager.deleteAtencion(${atencion.ID_Hospital}, ${atencion['ID_Atención']})" 
+                            title="Eliminar">
+                        <i class="bi bi-trash"></i>
+                    </button>
+                </td>
+            </tr>
+        `;
+    }
+
+    async syncChanges() {
+        // Tras una escritura: aplicar solo las filas que cambiaron (con búsqueda activa se recarga)
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return this.loadAtenciones();
         }
 
-        let html = '';
-        atenciones.forEach(atencion => {
-            // Debug: Ver cada atención individualmente
-            console.log('Atención individual:', atencion);
-            
-            const nodeColor = atencion.ID_Hospital === 1 ? 'success' : 'info';
-            const nodeName = atencion.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
-            
-            html += `
-                <tr data-id-hospital="${atencion.ID_Hospital}" data-id-atencion="${atencion['ID_Atención']}">
-                    <td class="text-center"><strong>${atencion.ID_Hospital}</strong></td>
-                    <td class="text-center"><strong>${atencion['ID_Atención']}</strong></td>
-                    <td class="text-center">${atencion.ID_Paciente || 'N/A'}</td>
-                    <td class="text-center">${atencion.ID_Personal || 'N/A'}</td>
-                    <td class="text-center">${atencion.ID_Tipo || 'N/A'}</td>
-                    <td class="text-center">${atencion.Fecha || 'N/A'}</td>
-                    <td>${this.escapeHtml(atencion.Diagnostico || 'Sin diagnóstico')}</td>
-                    <td>${this.escapeHtml(atencion['Descripción'] || 'Sin descripción')}</td>
-                    <td>${this.escapeHtml(atencion.Tratamiento || 'Sin tratamiento')}</td>
-                    <td class="text-center">
-                        <span class="badge bg-${nodeColor}">${nodeName}</span>
-                    </td>
-                    <td class="text-center">
-                        <button class="btn btn-sm btn-outline-warning me-1" 
-                                onclick="atencionMedicaManager.editAtencion(${atencion.ID_Hospital}, ${atencion['ID_Atención']})" 
-                                title="Editar">
-                            <i class="bi bi-pencil"></i>
-                        </button>
-                        <button class="btn btn-sm btn-outline-danger" 
-                                onclick="atencionMedicaManager.deleteAtencion(${atencion.ID_Hospital}, ${atencion['ID_Atención']})" 
-                                title="Eliminar">
-                            <i class="bi bi-trash"></i>
-                        </button>
-                    </td>
-                </tr>
-            `;
-        });
+        try {
+            const delta = await this.changes.sync(this.atenciones, this.loader);
+            if (delta.reset) {
+                return this.loadAtenciones();
+            }
 
-        tbody.innerHTML = html;
+            // La tabla virtual vuelve a pintar solo las filas visibles que cambiaron
+            this.atenciones = delta.rows;
+            await this.applyFilters();
+        } catch (error) {
+            console.error('Error sincronizando cambios:', error);
+            this.loadAtenciones();
+        }
     }
 
     updateStats(total, node) {
@@ -423,7 +469,7 @@ class AtencionMedicaManager {
         .then(data => {
             if (data.success) {
                 this.showSuccess(data.message || 'Atención médica guardada exitosamente');
-                this.loadAtenciones();
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
                 const modal = bootstrap.Modal.getInstance(document.getElementById('atencionEditModal'));
                 modal.hide();
             } else {
@@ -493,7 +539,7 @@ class AtencionMedicaManager {
         .then(data => {
             if (data.success) {
                 this.showSuccess(data.message || 'Atención médica eliminada exitosamente');
-                this.loadAtenciones();
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al eliminar atención médica: ' + (data.error || 'Error desconocido'));
             }
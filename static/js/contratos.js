@@ -4,9 +4,14 @@
 let contratosData = [];
 let filteredContratos = [];
 let currentEditingContrato = null;
+// Paginación por cursor para el scroll infinito
+let contratosLoader = null;
 
 // Inicializar cuando el DOM esté listo
 document.addEventListener('DOMContentLoaded', function() {
+    // main.js se carga después de este script: el loader se crea cuando el DOM está listo
+    contratosLoader = new KeysetLoader('/api/contratos');
+    
     // Deshabilitar funcionalidades de creación y eliminación para mantener consistencia
     disableCreateDeleteFunctionality();
     
@@ -30,6 +35,9 @@ function setupEventListeners() {
     if (hospitalFilter) {
         hospitalFilter.addEventListener('change', () => applyFilters());
     }
+    
+    // Scroll infinito: pedir la siguiente página al acercarse al final de la tabla
+    contratosLoader.attachScroll(document.querySelector('.table-responsive'), () => loadMoreContratos());
 }
 
 // Deshabilitar creación y eliminación para mantener consistencia con Personal Médico
@@ -54,17 +62,28 @@ function disableCreateDeleteFunctionality() {
     }
 }
 
-// Cargar todos los contratos desde la API
+// Cargar la primera página de contratos desde la API
 function loadContratos() {
-    fetch('/api/contratos')
-        .then(response => response.json())
+    // Reiniciar el cursor: la primera página reemplaza el contenido de la tabla
+    contratosLoader.reset();
+    loadMoreContratos();
+}
+
+// Cargar la siguiente página de contratos (scroll infinito)
+function loadMoreContratos() {
+    const firstPage = contratosLoader.after === null;
+    
+    contratosLoader.next()
         .then(data => {
+            if (!data) return;
+            
             if (data.success) {
-                contratosData = data.contratos || [];
-                filteredContratos = [...contratosData];
-                updateContratosTable(filteredContratos);
-                showToast('Contratos actualizados exitosamente', 'success');
-                updateContratosCount(data.total);
+                const page = data.contratos || [];
+                contratosData = firstPage ? page : contratosData.concat(page);
+                applyFilters();
+                if (firstPage) {
+                    showToast('Contratos actualizados exitosamente', 'success');
+                }
             } else {
                 showToast('Error al cargar contratos: ' + data.error, 'error');
                 console.error('Error al cargar contratos:', data.error);
@@ -6,6 +6,26 @@
 class ExperienciaManager {
     constructor() {
         this.currentNode = null;
+        this.loader = new KeysetLoader('/api/experiencias');
+        this.changes = new DeltaStore('experiencias', ['ID_Hospital', 'ID_Personal', 'Cargo'], 'experiencias');
+        // Solo se pintan las filas visibles; el orden por columna corre en un worker
+        this.table = new VirtualTable(
+            document.querySelector('.table-responsive'),
+            document.getElementById('tbody-experiencias') || document.querySelector('tbody'),
+            experiencia => this.renderRow(experiencia),
+            {
+                emptyHtml: `
+                    <tr>
+                        <td colspan="6" class="text-center text-muted py-4">
+                            <i class="bi bi-database-x"></i> 
+                            No hay experiencias disponibles en Vista_Experiencia
+                        </td>
+                    </tr>
+                `,
+                // Con orden o filtros activos se traen las páginas que faltan
+                loadAll: () => this.loadAllExperiencias()
+            }
+        );
         this.experiencias = [];
         this.filteredExperiencias = [];
         this.searchTimeout = null;
@@ -34,6 +54,13 @@ class ExperienciaManager {
             searchInput.addEventListener('input', (e) => this.handleSearch(e.target.value));
         }
 
+        // Scroll infinito: pedir la siguiente página al acercarse al final de la tabla
+        this.loader.attachScroll(document.querySelector('.table-responsive'), () => {
+            if (!searchInput || !searchInput.value.trim()) {
+                this.loadMoreExperiencias();
+            }
+        });
+
         // Botón nueva experiencia
         const btnNueva = document.querySelector('.btn-success');
         if (btnNueva) {
@@ -48,29 +75,52 @@ class ExperienciaManager {
     }
 
     async loadExperiencias() {
+        // Reiniciar el cursor: la primera página reemplaza el contenido de la tabla
+        this.loader.reset();
+        this.showLoading();
+        await this.loadMoreExperiencias();
+    }
+
+    async loadMoreExperiencias() {
+        const firstPage = this.loader.after === null;
         try {
-            this.showLoading();
-            
-            const response = await fetch('/api/experiencias');
-            const data = await response.json();
+            const data = await this.loader.next();
+            if (!data) {
+                return;
+            }
             
             if (data.success) {
-                this.experiencias = Array.isArray(data.experiencias) ? data.experiencias : [];
-                this.filteredExperiencias = [...this.experiencias];
+                // Asegurar que tenemos un array válido
+                const page = Array.isArray(data.experiencias) ? data.experiencias : [];
+                this.experiencias = firstPage ? page : this.experiencias.concat(page);
                 this.currentNode = data.node;
-                this.updateTable();
-                this.updateStats(data.total || 0, data.node);
-                this.showSuccess(`Cargadas ${data.total || 0} experiencias desde Vista_Experiencia (${data.node})`);
+                if (firstPage) {
+                    this.changes.reset(data.version);
+                }
+                this.filteredExperiencias = await this.table.show(this.experiencias, {});
+                this.updateStats(this.experiencias.length, data.node);
+                if (firstPage) {
+                    this.showSuccess(`Cargadas ${this.experiencias.length} experiencias desde Vista_Experiencia (${data.node})`);
+                }
             } else {
                 // Solo mostrar toast de error, NO vaciar las listas ni actualizar tabla
                 this.showError('Error al cargar experiencias: ' + data.error);
             }
         } catch (error) {
-            // Solo mostrar toast de error, NO vaciar las listas ni actualizar tabla  
+            // Solo mostrar toast de error, NO vaciar las listas ni actualizar tabla
             this.showError('Error de conexión: ' + error.message);
         }
     }
 
+    loadAllExperiencias() {
+        // Los resultados de la búsqueda ya vienen completos del servidor
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return null;
+        }
+        return this.loader.loadRest(() => this.loadMoreExperiencias());
+    }
+
     async searchExperiencias(searchTerm) {
         if (!searchTerm.trim()) {
             this.filteredExperiencias = [...this.experiencias];
@@ -104,58 +154,62 @@ class ExperienciaManager {
     }
 
     updateTable() {
-        const tbody = document.getElementById('tbody-experiencias') || document.querySelector('tbody');
-        
-        if (!tbody) {
-            console.error('No se encontró el tbody de la tabla');
-            return;
-        }
-
         const experiencias = Array.isArray(this.filteredExperiencias) ? this.filteredExperiencias : [];
 
-        if (experiencias.length === 0) {
-            tbody.innerHTML = `
-                <tr>
-                    <td colspan="6" class="text-center text-muted py-4">
-                        <i class="bi bi-database-x"></i> 
-                        No hay experiencias disponibles en Vista_Experiencia
-                    </td>
-                </tr>
-            `;
-            return;
+        // La tabla virtual solo crea las filas visibles y las reutiliza al hacer scroll
+        this.table.show(experiencias, {});
+    }
+
+    renderRow(experiencia) {
+        const nodeColor = experiencia.ID_Hospital === 1 ? 'success' : 'info';
+        const nodeName = experiencia.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
+        
+        return `
+            <tr data-key="${this.changes.keyAttr(experiencia)}" data-id-hospital="${experiencia.ID_Hospital}" data-id-personal="${experiencia.ID_Personal}">
+                <td class="text-center"><strong>${experiencia.ID_Hospital}</strong></td>
+                <td class="text-center"><strong>${experiencia.ID_Personal}</strong></td>
+                <td>${this.escapeHtml(experiencia.Cargo || 'Sin cargo')}</td>
+                <td class="text-center">${experiencia.Años_exp !== null ? experiencia.Años_exp + ' años' : 'N/A'}</td>
+                <td class="text-center">
+                    <span class="badge bg-${nodeColor}">${nodeName}</span>
+                </td>
+                <td class="text-center">
+                    <button class="btn btn-sm btn-outline-warning me-1" 
+                            onclick="experienciaManager.editExperiencia(${experiencia.ID_Hospital}, ${experiencia.ID_Personal})" 
+                            title="Editar">
+                        <i class="bi bi-pencil"></i>
+                    </button>
+                    <button class="btn btn-sm btn-outline-danger" 
+                            onclick="experienciaManager.deleteExperiencia(${experiencia.ID_Hospital}, ${experiencia.ID_Personal}, '${this.escapeHtml(experiencia.Cargo)}')" 
+                            title="Eliminar">
+                        <i class="bi bi-trash"></i>
+                    </button>
+                </td>
+            </tr>
+        `;
+    }
+
+    async syncChanges() {
+        // Tras una escritura: aplicar solo las filas que cambiaron (con búsqueda activa se recarga)
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return this.loadExperiencias();
         }
 
-        let html = '';
-        experiencias.forEach(experiencia => {
-            const nodeColor = experiencia.ID_Hospital === 1 ? 'success' : 'info';
-            const nodeName = experiencia.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
-            
-            html += `
-                <tr data-id-hospital="${experiencia.ID_Hospital}" data-id-personal="${experiencia.ID_Personal}">
-                    <td class="text-center"><strong>${experiencia.ID_Hospital}</strong></td>
-                    <td class="text-center"><strong>${experiencia.ID_Personal}</strong></td>
-                    <td>${this.escapeHtml(experiencia.Cargo || 'Sin cargo')}</td>
-                    <td class="text-center">${experiencia.Años_exp !== null ? experiencia.Años_exp + ' años' : 'N/A'}</td>
-                    <td class="text-center">
-                        <span class="badge bg-${nodeColor}">${nodeName}</span>
-                    </td>
-                    <td class="text-center">
-                        <button class="btn btn-sm btn-outline-warning me-1" 
-                                onclick="experienciaManager.editExperiencia(${experiencia.ID_Hospital}, ${experiencia.ID_Personal})" 
-                                title="Editar">
-                            <i class="bi bi-pencil"></i>
-                        </button>
-                        <button class="btn btn-sm btn-outline-danger" 
-                                onclick="experienciaManager.deleteExperiencia(${experiencia.ID_Hospital}, ${experiencia.ID_Personal}, '${this.escapeHtml(experiencia.Cargo)}')" 
-                                title="Eliminar">
-                            <i class="bi bi-trash"></i>
-                        </button>
-                    </td>
-                </tr>
-            `;
-        });
+        try {
+            const delta = await this.changes.sync(this.experiencias, this.loader);
+            if (delta.reset) {
+                return this.loadExperiencias();
+            }
 
-        tbody.innerHTML = html;
+            // La tabla virtual vuelve a pintar solo las filas visibles que cambiaron
+            this.experiencias = delta.rows;
+            this.filteredExperiencias = await this.table.show(this.experiencias, {});
+            this.updateStats(this.experiencias.length, this.currentNode);
+        } catch (error) {
+            console.error('Error sincronizando cambios:', error);
+            this.loadExperiencias();
+        }
     }
 
     updateStats(total, node) {
@@ -387,7 +441,7 @@ class ExperienciaManager {
             if (result.success) {
                 this.showSuccess(result.message || (isEdit ? 'Experiencia actualizada exitosamente' : 'Experiencia creada exitosamente'));
                 bootstrap.Modal.getInstance(document.getElementById('experienciaModal')).hide();
-                this.loadExperiencias(); // Recargar la tabla
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al guardar experiencia: ' + result.error);
             }
@@ -481,7 +535,7 @@ class ExperienciaManager {
             
             if (data.success) {
                 this.showSuccess('Experiencia eliminada exitosamente');
-                this.loadExperiencias(); // Recargar tabla
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al eliminar: ' + data.error);
             }
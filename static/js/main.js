@@ -198,6 +198,13 @@ function performSearch(input) {
     
     if (!table) return;
     
+    // Tabla virtual: el <tbody> solo tiene las filas visibles, se filtran sus datos
+    const virtualTable = virtualTables.get(table);
+    if (virtualTable) {
+        virtualTable.search(input.value.trim());
+        return;
+    }
+    
     const rows = table.getElementsByTagName('tr');
     let visibleRows = 0;
     
@@ -371,6 +378,522 @@ function updateStats() {
         });
 }
 
+/**
+ * Paginación por cursor (keyset) para las APIs de listado
+ * Cada llamada a next() pide la página siguiente usando el cursor next_after de la anterior
+ */
+class KeysetLoader {
+    constructor(url, pageSize = 100) {
+        this.url = url;
+        this.pageSize = pageSize;
+        this.reset();
+    }
+
+    reset() {
+        this.after = null;
+        this.done = false;
+        this.loading = false;
+        this.inflight = null;
+    }
+
+    async next() {
+        // null si ya no hay más páginas o si hay una carga en curso
+        if (this.done || this.loading) {
+            return null;
+        }
+
+        this.loading = true;
+        const request = this.fetchPage();
+        this.inflight = request;
+        try {
+            return await request;
+        } finally {
+            this.loading = false;
+        }
+    }
+
+    async fetchPage() {
+        const params = new URLSearchParams({ limit: this.pageSize });
+        if (this.after) {
+            params.set('after', JSON.stringify(this.after));
+        }
+
+        const response = await fetch(`${this.url}?${params}`);
+        const data = await response.json();
+
+        if (data.success) {
+            this.after = data.next_after || null;
+            this.done = !this.after;
+        }
+        return data;
+    }
+
+    /**
+     * Pide todas las páginas que faltan con loadPage() (la misma carga del scroll infinito)
+     * Para ordenar o filtrar la lista completa; se detiene si una página no avanza el cursor
+     */
+    async loadRest(loadPage) {
+        while (!this.done) {
+            if (this.loading) {
+                await this.inflight.catch(() => null);
+                continue;
+            }
+            const after = this.after;
+            await loadPage();
+            if (!this.done && this.after === after) {
+                return;
+            }
+        }
+    }
+
+    /**
+     * Llama a onNearEnd cuando el scroll del contenedor se acerca al final (scroll infinito)
+     */
+    attachScroll(container, onNearEnd, threshold = 200) {
+        if (!container) {
+            return;
+        }
+
+        container.addEventListener('scroll', () => {
+            if (container.scrollTop + container.clientHeight >= container.scrollHeight - threshold) {
+                onNearEnd();
+            }
+        });
+    }
+}
+
+/**
+ * Sincronización por deltas con /api/<entidad>/changes
+ * Guarda la versión de la lista cargada; después de una escritura pide solo las filas
+ * que cambiaron y parcha esas filas de la tabla en lugar de volver a renderizarla
+ */
+class DeltaStore {
+    constructor(entity, keyColumns, rowsKey) {
+        this.entity = entity;
+        this.keyColumns = keyColumns;
+        this.rowsKey = rowsKey;
+        this.version = null;
+    }
+
+    reset(version) {
+        // null: el servidor no tiene registro de cambios, cada sincronización recarga la lista
+        this.version = version === undefined ? null : version;
+    }
+
+    key(row) {
+        return this.keyColumns.map(column => row[column]);
+    }
+
+    keyAttr(row) {
+        // Valor para data-key de la fila (seguro dentro de un atributo HTML)
+        return encodeURIComponent(JSON.stringify(this.key(row)));
+    }
+
+    compare(a, b) {
+        for (let i = 0; i < Math.min(a.length, b.length); i++) {
+            if (a[i] < b[i]) return -1;
+            if (a[i] > b[i]) return 1;
+        }
+        return 0;
+    }
+
+    matches(row, changedKey) {
+        // La clave cambiada puede ser un prefijo (ej. todas las experiencias de un personal)
+        return changedKey.every((value, i) => row[this.keyColumns[i]] === value);
+    }
+
+    /**
+     * Aplica a rows (cargadas hasta el cursor de loader) los cambios desde la última versión
+     * Devuelve {reset: true} si hay que recargar la lista, o {rows, removed, upserted}
+     */
+    async sync(rows, loader) {
+        if (this.version === null) {
+            return { reset: true };
+        }
+
+        const response = await fetch(`/api/${this.entity}/changes?since=${this.version}`);
+        const data = await response.json();
+        if (!data.success || data.reset) {
+            return { reset: true };
+        }
+        this.version = data.version;
+
+        const changed = data.changed || [];
+        const removed = rows.filter(row => changed.some(key => this.matches(row, key)));
+        // Las filas después del cursor llegan con las páginas siguientes
+        const upserted = (data[this.rowsKey] || []).filter(row =>
+            loader.done || !loader.after || this.compare(this.key(row), loader.after) <= 0
+        );
+
+        const merged = rows.filter(row => !removed.includes(row)).concat(upserted);
+        merged.sort((a, b) => this.compare(this.key(a), this.key(b)));
+        return { reset: false, rows: merged, removed, upserted };
+    }
+
+    /**
+     * Parcha en tbody solo las filas del delta; renderRow(row) devuelve el HTML del <tr data-key>
+     * Devuelve false si la tabla no tiene filas de datos (o quedó vacía) y hay que renderizarla
+     */
+    patchTable(tbody, delta, renderRow) {
+        const existing = new Map();
+        tbody.querySelectorAll('tr[data-key]').forEach(tr => existing.set(tr.dataset.key, tr));
+        if (existing.size === 0 || delta.rows.length === 0) {
+            return false;
+        }
+
+        const fresh = new Set(delta.upserted.map(row => this.keyAttr(row)));
+        delta.removed.forEach(row => {
+            const key = this.keyAttr(row);
+            if (!fresh.has(key) && existing.has(key)) {
+                existing.get(key).remove();
+                existing.delete(key);
+            }
+        });
+
+        delta.upserted.forEach(row => {
+            const template = document.createElement('template');
+            template.innerHTML = renderRow(row).trim();
+            const tr = template.content.firstElementChild;
+            const current = existing.get(tr.dataset.key);
+            if (current) {
+                current.replaceWith(tr);
+            } else {
+                // Insertar en orden de clave, antes de la primera fila con clave mayor
+                const key = this.key(row);
+                const next = Array.from(tbody.querySelectorAll('tr[data-key]')).find(other =>
+                    this.compare(JSON.parse(decodeURIComponent(other.dataset.key)), key) > 0
+                );
+                tbody.insertBefore(tr, next || null);
+            }
+            existing.set(tr.dataset.key, tr);
+        });
+        return true;
+    }
+}
+
+/**
+ * Compara dos celdas para ordenar (números, texto en español y fechas dd/mm/aaaa); vacías al final
+ */
+function compareCells(a, b) {
+    if (a === b) return 0;
+    if (a === null || a === undefined || a === '') return 1;
+    if (b === null || b === undefined || b === '') return -1;
+    if (typeof a === 'string' && typeof b === 'string') {
+        const fecha = /^(\d{2})\/(\d{2})\/(\d{4})$/;
+        const fa = a.match(fecha);
+        const fb = b.match(fecha);
+        if (fa && fb) {
+            a = fa[3] + fa[2] + fa[1];
+            b = fb[3] + fb[2] + fb[1];
+        } else {
+            return a.localeCompare(b, 'es');
+        }
+    }
+    return a < b ? -1 : (a > b ? 1 : 0);
+}
+
+/**
+ * Mayúsculas y sin tildes, para que 'jose' encuentre 'José' (como el índice de búsqueda del servidor)
+ */
+function normalizeText(value) {
+    return String(value).normalize('NFD').replace(/[\u0300-\u036f]/g, '').toUpperCase();
+}
+
+/**
+ * Índices de las filas que cumplen filters ({columna: valor}) y contienen text en algún campo,
+ * en el orden de sort ({column, direction})
+ */
+function queryRows(rows, filters, sort, text) {
+    const conditions = Object.entries(filters || {});
+    const needle = text ? normalizeText(text) : '';
+    const indices = [];
+    for (let i = 0; i < rows.length; i++) {
+        if (conditions.every(([column, value]) => rows[i][column] === value) &&
+            (!needle || Object.values(rows[i]).some(value =>
+                value !== null && value !== undefined && normalizeText(value).includes(needle)))) {
+            indices.push(i);
+        }
+    }
+    if (sort) {
+        const factor = sort.direction === 'desc' ? -1 : 1;
+        indices.sort((a, b) => factor * compareCells(rows[a][sort.column], rows[b][sort.column]) || a - b);
+    }
+    return indices;
+}
+
+/**
+ * Worker con una copia de las filas de la tabla: filtra y ordena fuera del hilo principal
+ * Se arma desde las mismas funciones (sin archivo aparte); null si el navegador no lo permite
+ */
+function createTableWorker() {
+    if (typeof Worker === 'undefined' || typeof Blob === 'undefined') {
+        return null;
+    }
+    const source = `${compareCells}
+${normalizeText}
+${queryRows}
+let rows = [];
+self.onmessage = event => {
+    const message = event.data;
+    if (message.type === 'set') {
+        rows = message.rows;
+    } else if (message.type === 'append') {
+        for (const row of message.rows) rows.push(row);
+    } else if (message.type === 'query') {
+        self.postMessage({ id: message.id, indices: queryRows(rows, message.filters, message.sort, message.text) });
+    }
+};`;
+    try {
+        const url = URL.createObjectURL(new Blob([source], { type: 'text/javascript' }));
+        const worker = new Worker(url);
+        URL.revokeObjectURL(url);
+        return worker;
+    } catch (error) {
+        console.warn('Tabla sin worker, se filtra en el hilo principal:', error);
+        return null;
+    }
+}
+
+// Tabla virtual de cada <table>, para que performSearch filtre sus datos y no el DOM
+const virtualTables = new WeakMap();
+
+/**
+ * Tabla con scroll virtual para las listas grandes
+ * Solo existen en el DOM las filas visibles (más un margen) entre dos espaciadores que mantienen
+ * el alto del scroll; al desplazarse se reutilizan los mismos <tr> con otras filas. El filtrado
+ * y el orden se calculan en un worker, así el costo de pintar no crece con el número de filas.
+ * Con orden, filtros o texto activos se llama a options.loadAll() para traer las páginas que
+ * faltan: ordenar o filtrar solo lo cargado por scroll dejaría fuera filas de las páginas siguientes.
+ */
+class VirtualTable {
+    constructor(container, tbody, renderRow, options = {}) {
+        this.container = container;
+        this.tbody = tbody;
+        this.renderRow = renderRow;
+        this.rowHeight = options.rowHeight || 49;
+        this.overscan = options.overscan || 10;
+        this.emptyHtml = options.emptyHtml || '';
+        this.loadAll = options.loadAll || null;
+        this.loadingAll = null;
+        this.rows = [];
+        this.view = [];
+        this.filters = {};
+        this.sort = null;
+        this.text = '';
+        this.pool = [];
+        this.rendered = new WeakMap();
+        this.measured = false;
+        this.frame = null;
+        this.requestId = 0;
+        this.pending = new Map();
+        this.latest = Promise.resolve([]);
+        this.template = document.createElement('template');
+
+        const table = tbody ? tbody.closest('table') : null;
+        const columns = table ? table.querySelectorAll('thead th').length : 0;
+        this.topSpacer = this.createSpacer(columns);
+        this.bottomSpacer = this.createSpacer(columns);
+
+        this.worker = createTableWorker();
+        if (this.worker) {
+            this.worker.onmessage = event => {
+                const resolve = this.pending.get(event.data.id);
+                this.pending.delete(event.data.id);
+                if (resolve) resolve(event.data.indices);
+            };
+            this.worker.onerror = error => {
+                // Si el worker falla, las consultas pendientes y siguientes se resuelven aquí
+                console.warn('Worker de la tabla detenido, se filtra en el hilo principal:', error.message);
+                this.worker.terminate();
+                this.worker = null;
+                this.pending.forEach(resolve => resolve(queryRows(this.rows, this.filters, this.sort, this.text)));
+                this.pending.clear();
+            };
+        }
+
+        if (container) {
+            container.addEventListener('scroll', () => this.scheduleRender(), { passive: true });
+        }
+        if (table) {
+            virtualTables.set(table, this);
+            this.attachSort(table);
+        }
+    }
+
+    createSpacer(columns) {
+        const tr = document.createElement('tr');
+        tr.setAttribute('aria-hidden', 'true');
+        const td = document.createElement('td');
+        td.colSpan = columns || 1;
+        td.style.cssText = 'padding: 0; border: 0; height: 0;';
+        tr.appendChild(td);
+        return tr;
+    }
+
+    /**
+     * Muestra rows filtradas por filters; devuelve (promesa) las filas que quedaron visibles en la tabla
+     */
+    show(rows, filters = this.filters) {
+        this.filters = filters;
+        this.syncRows(rows);
+        this.requestAll();
+        return this.query();
+    }
+
+    /**
+     * Filtra por texto en cualquier campo (buscador genérico de main.js); '' quita el filtro
+     */
+    search(text) {
+        this.text = text;
+        this.requestAll();
+        return this.query();
+    }
+
+    isNarrowed() {
+        return this.sort !== null || this.text !== '' || Object.keys(this.filters).length > 0;
+    }
+
+    requestAll() {
+        // Una sola carga completa a la vez; cada página que llega vuelve a consultar la vista
+        if (!this.loadAll || this.loadingAll || !this.isNarrowed()) {
+            return;
+        }
+        this.loadingAll = Promise.resolve()
+            .then(() => this.loadAll())
+            .catch(error => console.warn('No se pudo cargar la lista completa:', error))
+            .finally(() => {
+                this.loadingAll = null;
+            });
+    }
+
+    syncRows(rows) {
+        if (rows === this.rows) {
+            return;
+        }
+        // Si solo se agregaron filas al final (página siguiente), se envían solo las nuevas
+        const previous = this.rows;
+        const appended = previous.length > 0 && rows.length >= previous.length &&
+            previous.every((row, i) => rows[i] === row);
+        this.rows = rows;
+        if (!this.worker) {
+            return;
+        }
+        if (appended) {
+            this.worker.postMessage({ type: 'append', rows: rows.slice(previous.length) });
+        } else {
+            this.worker.postMessage({ type: 'set', rows });
+        }
+    }
+
+    query() {
+        const id = ++this.requestId;
+        const rows = this.rows;
+        let indices;
+        if (this.worker) {
+            indices = new Promise(resolve => this.pending.set(id, resolve));
+            this.worker.postMessage({ type: 'query', id, filters: this.filters, sort: this.sort, text: this.text });
+        } else {
+            indices = Promise.resolve(queryRows(rows, this.filters, this.sort, this.text));
+        }
+
+        this.latest = indices.then(result => {
+            // Una consulta más reciente ya reemplazó a esta: se devuelve la vista de esa
+            if (id !== this.requestId) {
+                return this.latest;
+            }
+            this.view = result.map(i => rows[i]);
+            this.scheduleRender();
+            return this.view;
+        });
+        return this.latest;
+    }
+
+    attachSort(table) {
+        // Encabezados con data-sort="Columna": click ordena ascendente, otro click descendente
+        table.querySelectorAll('thead th[data-sort]').forEach(th => {
+            th.style.cursor = 'pointer';
+            th.addEventListener('click', () => {
+                const column = th.dataset.sort;
+                const direction = this.sort && this.sort.column === column && this.sort.direction === 'asc' ? 'desc' : 'asc';
+                this.sort = { column, direction };
+                table.querySelectorAll('thead th[data-sort] .sort-icon').forEach(icon => icon.remove());
+                th.insertAdjacentHTML('beforeend',
+                    ` <i class="bi bi-caret-${direction === 'asc' ? 'up' : 'down'}-fill sort-icon"></i>`);
+                this.requestAll();
+                this.query();
+            });
+        });
+    }
+
+    scheduleRender() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => this.render());
+        }
+    }
+
+    fill(tr, row) {
+        // Reutiliza el <tr>: copia atributos y celdas de la fila renderizada
+        this.template.innerHTML = this.renderRow(row).trim();
+        const fresh = this.template.content.firstElementChild;
+        Array.from(tr.attributes).forEach(attribute => tr.removeAttribute(attribute.name));
+        Array.from(fresh.attributes).forEach(attribute => tr.setAttribute(attribute.name, attribute.value));
+        tr.replaceChildren(...fresh.childNodes);
+        this.rendered.set(tr, row);
+    }
+
+    render() {
+        this.frame = null;
+        const tbody = this.tbody;
+        if (!tbody) {
+            return;
+        }
+
+        if (this.view.length === 0) {
+            tbody.innerHTML = this.emptyHtml;
+            this.pool = [];
+            return;
+        }
+        // Otro código reemplazó el contenido (ej. el indicador de carga): reconstruir
+        if (this.topSpacer.parentNode !== tbody || this.bottomSpacer.parentNode !== tbody) {
+            tbody.replaceChildren(this.topSpacer, this.bottomSpacer);
+            this.pool = [];
+        }
+
+        const scrollTop = this.container ? this.container.scrollTop : 0;
+        const height = this.container ? this.container.clientHeight : 600;
+        const first = Math.max(0, Math.min(Math.floor(scrollTop / this.rowHeight) - this.overscan, this.view.length - 1));
+        const last = Math.min(this.view.length, first + Math.ceil(height / this.rowHeight) + 2 * this.overscan);
+
+        while (this.pool.length < last - first) {
+            const tr = document.createElement('tr');
+            tbody.insertBefore(tr, this.bottomSpacer);
+            this.pool.push(tr);
+        }
+        while (this.pool.length > last - first) {
+            this.pool.pop().remove();
+        }
+
+        for (let i = first; i < last; i++) {
+            const tr = this.pool[i - first];
+            if (this.rendered.get(tr) !== this.view[i]) {
+                this.fill(tr, this.view[i]);
+            }
+        }
+
+        this.topSpacer.firstChild.style.height = `${first * this.rowHeight}px`;
+        this.bottomSpacer.firstChild.style.height = `${(this.view.length - last) * this.rowHeight}px`;
+
+        // El alto real de las filas se mide una vez con la primera fila pintada
+        if (!this.measured && this.pool[0].offsetHeight > 0) {
+            this.measured = true;
+            if (this.pool[0].offsetHeight !== this.rowHeight) {
+                this.rowHeight = this.pool[0].offsetHeight;
+                this.scheduleRender();
+            }
+        }
+    }
+}
+
 /**
  * Utilidades globales
  */
@@ -379,7 +902,10 @@ window.HospitalSystem = {
     confirmAction,
     formatNumber,
     updateStats,
-    validateCedula: isValidEcuadorianCedula
+    validateCedula: isValidEcuadorianCedula,
+    KeysetLoader,
+    DeltaStore,
+    VirtualTable
 };
 
 /**
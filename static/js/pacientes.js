@@ -6,6 +6,26 @@
 class PacientesManager {
     constructor() {
         this.currentNode = null;
+        this.loader = new KeysetLoader('/api/pacientes');
+        this.changes = new DeltaStore('pacientes', ['ID_Hospital', 'ID_Paciente'], 'pacientes');
+        // Solo se pintan las filas visibles; el filtro por sexo y el orden corren en un worker
+        this.table = new VirtualTable(
+            document.querySelector('.table-responsive'),
+            document.getElementById('tbody-pacientes') || document.querySelector('tbody'),
+            paciente => this.renderRow(paciente),
+            {
+                emptyHtml: `
+                    <tr>
+                        <td colspan="10" class="text-center text-muted py-4">
+                            <i class="bi bi-database-x"></i> 
+                            No hay pacientes disponibles en Vista_Paciente
+                        </td>
+                    </tr>
+                `,
+                // Con orden o filtros activos se traen las páginas que faltan
+                loadAll: () => this.loadAllPacientes()
+            }
+        );
         this.pacientes = [];
         this.filteredPacientes = [];
         this.searchTimeout = null;
@@ -34,6 +54,13 @@ class PacientesManager {
             searchInput.addEventListener('input', (e) => this.handleSearch(e.target.value));
         }
 
+        // Scroll infinito: pedir la siguiente página al acercarse al final de la tabla
+        this.loader.attachScroll(document.querySelector('.table-responsive'), () => {
+            if (!searchInput || !searchInput.value.trim()) {
+                this.loadMorePacientes();
+            }
+        });
+
         // Filtro de sexo
         const sexoFilter = document.getElementById('filterSexo');
         if (sexoFilter) {
@@ -42,32 +69,57 @@ class PacientesManager {
     }
 
     async loadPacientes() {
+        // Reiniciar el cursor: la primera página reemplaza el contenido de la tabla
+        this.loader.reset();
+        this.showLoading();
+        await this.loadMorePacientes();
+    }
+
+    async loadMorePacientes() {
+        const firstPage = this.loader.after === null;
         try {
-            this.showLoading();
-            
-            const response = await fetch('/api/pacientes');
-            const data = await response.json();
+            const data = await this.loader.next();
+            if (!data) {
+                return;
+            }
             
             if (data.success) {
                 // Asegurar que tenemos un array válido
-                this.pacientes = Array.isArray(data.pacientes) ? data.pacientes : [];
-                this.filteredPacientes = [...this.pacientes];
+                const page = Array.isArray(data.pacientes) ? data.pacientes : [];
+                this.pacientes = firstPage ? page : this.pacientes.concat(page);
                 this.currentNode = data.node;
-                this.updateTable();
-                this.updateStats(data.total || 0, data.node);
-                this.showSuccess(`Cargados ${data.total || 0} pacientes desde Vista_Paciente (${data.node})`);
+                if (firstPage) {
+                    this.changes.reset(data.version);
+                }
+                this.applyFilters();
+                if (firstPage) {
+                    this.showSuccess(`Cargados ${this.pacientes.length} pacientes desde Vista_Paciente (${data.node})`);
+                }
             } else {
-                this.pacientes = [];
-                this.filteredPacientes = [];
+                if (firstPage) {
+                    this.pacientes = [];
+                    this.filteredPacientes = [];
+                }
                 this.showError('Error al cargar pacientes: ' + data.error);
             }
         } catch (error) {
-            this.pacientes = [];
-            this.filteredPacientes = [];
+            if (firstPage) {
+                this.pacientes = [];
+                this.filteredPacientes = [];
+            }
             this.showError('Error de conexión: ' + error.message);
         }
     }
 
+    loadAllPacientes() {
+        // Los resultados de la búsqueda ya vienen completos del servidor
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return null;
+        }
+        return this.loader.loadRest(() => this.loadMorePacientes());
+    }
+
     async searchPacientes(searchTerm) {
         if (!searchTerm.trim()) {
             this.filteredPacientes = [...this.pacientes];
@@ -102,82 +154,82 @@ class PacientesManager {
         }, 500);
     }
 
-    applyFilters() {
+    async applyFilters() {
         const sexoFilter = document.getElementById('filterSexo');
         
-        // Asegurar que pacientes es un array válido
-        let filtered = Array.isArray(this.pacientes) ? [...this.pacientes] : [];
-        
-        // Filtro por sexo
+        // Filtro por sexo (se evalúa en el worker de la tabla, fuera del hilo principal)
+        const filters = {};
         if (sexoFilter && sexoFilter.value && sexoFilter.value !== '') {
-            const sexo = sexoFilter.value === 'Masculino' ? 'M' : 'F';
-            filtered = filtered.filter(p => p.Sexo === sexo);
+            filters.Sexo = sexoFilter.value === 'Masculino' ? 'M' : 'F';
         }
         
-        this.filteredPacientes = filtered;
-        this.updateTable();
-        this.updateStats(filtered.length, this.currentNode);
+        // Asegurar que pacientes es un array válido
+        const pacientes = Array.isArray(this.pacientes) ? this.pacientes : [];
+        this.filteredPacientes = await this.table.show(pacientes, filters);
+        this.updateStats(this.filteredPacientes.length, this.currentNode);
     }
 
     updateTable() {
-        const tbody = document.getElementById('tbody-pacientes') || 
-                     document.querySelector('tbody');
-        
-        if (!tbody) {
-            console.error('No se encontró el tbody de la tabla');
-            return;
-        }
-
         // Asegurar que filteredPacientes es un array válido
         const pacientes = Array.isArray(this.filteredPacientes) ? this.filteredPacientes : [];
 
-        if (pacientes.length === 0) {
-            tbody.innerHTML = `
-                <tr>
-                    <td colspan="10" class="text-center text-muted py-4">
-                        <i class="bi bi-database-x"></i> 
-                        No hay pacientes disponibles en Vista_Paciente
-                    </td>
-                </tr>
-            `;
-            return;
+        // La tabla virtual solo crea las filas visibles y las reutiliza al hacer scroll
+        this.table.show(pacientes, {});
+    }
+
+    renderRow(paciente) {
+        const nodeColor = paciente.ID_Hospital === 1 ? 'success' : 'info';
+        const nodeName = paciente.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
+        
+        return `
+            <tr data-key="${this.changes.keyAttr(paciente)}" data-id-hospital="${paciente.ID_Hospital}" data-id-paciente="${paciente.ID_Paciente}">
+                <td class="text-center"><strong>${paciente.ID_Hospital}</strong></td>
+                <td class="text-center"><strong>${paciente.ID_Paciente}</strong></td>
+                <td>${this.escapeHtml(paciente.Nombre || 'N/A')}</td>
+                <td>${this.escapeHtml(paciente.Apellido || 'N/A')}</td>
+                <td>${this.escapeHtml(paciente.Direccion || 'Sin dirección')}</td>
+                <td class="text-center">${paciente.FechaNacimiento || 'N/A'}</td>
+                <td class="text-center">${paciente.Sexo || 'N/A'}</td>
+                <td>${this.escapeHtml(paciente.Telefono || 'Sin teléfono')}</td>
+                <td class="text-center">
+                    <span class="badge bg-${nodeColor}">${nodeName}</span>
+                </td>
+                <td class="text-center">
+                    <button class="btn btn-sm btn-outline-warning me-1" 
+                            onclick="pacientesManager.editPaciente(${paciente.ID_Hospital}, ${paciente.ID_Paciente})" 
+                            title="Editar">
+                        <i class="bi bi-pencil"></i>
+                    </button>
+                    <button class="btn btn-sm btn-outline-danger" 
+                            onclick="pacientesManager.deletePaciente(${paciente.ID_Hospital}, ${paciente.ID_Paciente})" 
+                            title="Eliminar">
+                        <i class="bi bi-trash"></i>
+                    </button>
+                </td>
+            </tr>
+        `;
+    }
+
+    async syncChanges() {
+        // Tras una escritura: aplicar solo las filas que cambiaron (con búsqueda activa se recarga)
+        const searchInput = document.getElementById('searchInput');
+        if (searchInput && searchInput.value.trim()) {
+            return this.loadPacientes();
         }
 
-        let html = '';
-        pacientes.forEach(paciente => {
-            const nodeColor = paciente.ID_Hospital === 1 ? 'success' : 'info';
-            const nodeName = paciente.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
-            
-            html += `
-                <tr data-id-hospital="${paciente.ID_Hospital}" data-id-paciente="${paciente.ID_Paciente}">
-                    <td class="text-center"><strong>${paciente.ID_Hospital}</strong></td>
-                    <td class="text-center"><strong>${paciente.ID_Paciente}</strong></td>
-                    <td>${this.escapeHtml(paciente.Nombre || 'N/A')}</td>
-                    <td>${this.escapeHtml(paciente.Apellido || 'N/A')}</td>
-                    <td>${this.escapeHtml(paciente.Direccion || 'Sin dirección')}</td>
-                    <td class="text-center">${paciente.FechaNacimiento || 'N/A'}</td>
-                    <td class="text-center">${paciente.Sexo || 'N/A'}</td>
-                    <td>${this.escapeHtml(paciente.Telefono || 'Sin teléfono')}</td>
-                    <td class="text-center">
-                        <span class="badge bg-${nodeColor}">${nodeName}</span>
-                    </td>
-                    <td class="text-center">
-                        <button class="btn btn-sm btn-outline-warning me-1" 
-                                onclick="pacientesManager.editPaciente(${paciente.ID_Hospital}, ${paciente.ID_Paciente})" 
-                                title="Editar">
-                            <i class="bi bi-pencil"></i>
-                        </button>
-                        <button class="btn btn-sm btn-outline-danger" 
-                                onclick="pacientesManager.deletePaciente(${paciente.ID_Hospital}, ${paciente.ID_Paciente})" 
-                                title="Eliminar">
-                            <i class="bi bi-trash"></i>
-                        </button>
-                    </td>
-                </tr>
-            `;
-        });
+        try {
+            const delta = await this.changes.sync(this.pacientes, this.loader);
+            if (delta.reset) {
+                return this.loadPacientes();
+            }
 
-        tbody.innerHTML = html;
+            // La tabla virtual vuelve a pintar solo las filas visibles que cambiaron
+            this.pacientes = delta.rows;
+            await this.applyFilters();
+        } catch (error) {
+            console.error('Error sincronizando cambios:', error);
+            this.loadPacientes();
+        }
     }
 
     updateStats(total, node) {
@@ -323,7 +375,7 @@ class PacientesManager {
             if (data.success) {
                 this.showSuccess(data.message || 'Paciente creado exitosamente');
                 bootstrap.Modal.getInstance(document.getElementById('pacienteModal')).hide();
-                this.loadPacientes(); // Recargar la tabla
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al crear paciente: ' + data.error);
             }
@@ -408,7 +460,7 @@ class PacientesManager {
             if (data.success) {
                 this.showSuccess(data.message || 'Paciente actualizado exitosamente');
                 bootstrap.Modal.getInstance(document.getElementById('pacienteModal')).hide();
-                this.loadPacientes(); // Recargar la tabla
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al actualizar paciente: ' + data.error);
             }
@@ -501,7 +553,7 @@ class PacientesManager {
             
             if (data.success) {
                 this.showSuccess('Paciente eliminado exitosamente');
-                this.loadPacientes(); // Recargar tabla
+                this.syncChanges(); // Actualizar solo las filas que cambiaron
             } else {
                 this.showError('Error al eliminar: ' + data.error);
             }
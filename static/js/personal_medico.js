@@ -1,9 +1,16 @@
 // Variables globales
 let personalMedicoData = [];
 let currentNode = 'quito';
+// Paginación por cursor para el scroll infinito
+let personalMedicoLoader = null;
+// Versión de la lista cargada, para aplicar solo los cambios después de una escritura
+let personalMedicoChanges = null;
 
 // Inicializar cuando el DOM esté listo
 document.addEventListener('DOMContentLoaded', function() {
+    // main.js se carga después de este script: el loader se crea cuando el DOM está listo
+    personalMedicoLoader = new KeysetLoader('/api/personal-medico');
+    personalMedicoChanges = new DeltaStore('personal-medico', ['ID_Hospital', 'ID_Personal'], 'personal_medico');
     loadPersonalMedico();
     initializeEventListeners();
 });
@@ -33,6 +40,13 @@ function initializeEventListeners() {
         hospitalFilter.addEventListener('change', () => applyFilters());
     }
 
+    // Scroll infinito: pedir la siguiente página al acercarse al final de la tabla
+    personalMedicoLoader.attachScroll(document.querySelector('.table-responsive'), () => {
+        if (!searchInput || !searchInput.value.trim()) {
+            loadMorePersonalMedico();
+        }
+    });
+
     // Botón nuevo personal médico - usar el botón del modal
     const btnNuevo = document.querySelector('button[data-bs-target="#modalNuevoPersonal"]');
     if (btnNuevo) {
@@ -50,30 +64,42 @@ function initializeEventListeners() {
 }
 
 function loadPersonalMedico() {
+    // Reiniciar el cursor: la primera página reemplaza el contenido de la tabla
+    personalMedicoLoader.reset();
     showLoading(true);
+    loadMorePersonalMedico();
+}
+
+function loadMorePersonalMedico() {
+    const firstPage = personalMedicoLoader.after === null;
     
-    fetch('/api/personal-medico')
-        .then(response => response.json())
+    personalMedicoLoader.next()
         .then(data => {
+            if (!data) return;
             showLoading(false);
             
             if (data.success) {
-                personalMedicoData = data.personal_medico;
+                const page = data.personal_medico || [];
+                personalMedicoData = firstPage ? page : personalMedicoData.concat(page);
                 currentNode = data.node;
-                updateTable(personalMedicoData);
+                if (firstPage) {
+                    personalMedicoChanges.reset(data.version);
+                }
+                applyFilters();
                 updateNodeIndicator(data.node);
-                updatePersonalMedicoStats(data.total);
-                showSuccess(`Cargados ${data.total || 0} registros de personal médico desde Vista_INF_Personal (${data.node})`);
+                if (firstPage) {
+                    showSuccess(`Cargados ${personalMedicoData.length} registros de personal médico desde Vista_INF_Personal (${data.node})`);
+                }
             } else {
                 showError('Error al cargar personal médico: ' + data.error);
-                updateTable([]);
+                if (firstPage) updateTable([]);
             }
         })
         .catch(error => {
             showLoading(false);
             console.error('Error:', error);
             showError('Error de conexión al cargar personal médico');
-            updateTable([]);
+            if (firstPage) updateTable([]);
         });
 }
 
@@ -81,8 +107,6 @@ function updateTable(personalMedico) {
     const tbody = document.querySelector('tbody');
     if (!tbody) return;
     
-    tbody.innerHTML = '';
-    
     if (personalMedico.length === 0) {
         tbody.innerHTML = `
             <tr>
@@ -95,12 +119,15 @@ function updateTable(personalMedico) {
         return;
     }
     
-    personalMedico.forEach(personal => {
-        const nodeColor = personal.ID_Hospital === 1 ? 'success' : 'info';
-        const nodeName = personal.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
-        
-        const row = document.createElement('tr');
-        row.innerHTML = `
+    tbody.innerHTML = personalMedico.map(renderPersonalRow).join('');
+}
+
+function renderPersonalRow(personal) {
+    const nodeColor = personal.ID_Hospital === 1 ? 'success' : 'info';
+    const nodeName = personal.ID_Hospital === 1 ? 'Quito' : 'Guayaquil';
+    
+    return `
+        <tr data-key="${personalMedicoChanges.keyAttr(personal)}">
             <td class="text-center"><strong>${personal.ID_Hospital}</strong></td>
             <td class="text-center"><strong>${personal.ID_Personal}</strong></td>
             <td class="text-center">${personal.ID_Especialidad || 'N/A'}</td>
@@ -122,9 +149,34 @@ function updateTable(personalMedico) {
                     <i class="bi bi-trash"></i>
                 </button>
             </td>
-        `;
-        tbody.appendChild(row);
-    });
+        </tr>
+    `;
+}
+
+async function syncPersonalMedicoChanges() {
+    // Tras una escritura: aplicar solo las filas que cambiaron (con búsqueda o filtros se recarga)
+    const searchInput = document.getElementById('searchInput');
+    const hospitalFilter = document.getElementById('filterHospital');
+    if ((searchInput && searchInput.value.trim()) || (hospitalFilter && hospitalFilter.value)) {
+        return loadPersonalMedico();
+    }
+    
+    try {
+        const delta = await personalMedicoChanges.sync(personalMedicoData, personalMedicoLoader);
+        if (delta.reset) {
+            return loadPersonalMedico();
+        }
+        
+        personalMedicoData = delta.rows;
+        const tbody = document.querySelector('tbody');
+        if (!tbody || !personalMedicoChanges.patchTable(tbody, delta, renderPersonalRow)) {
+            updateTable(personalMedicoData);
+        }
+        updatePersonalMedicoStats(personalMedicoData.length);
+    } catch (error) {
+        console.error('Error sincronizando cambios:', error);
+        loadPersonalMedico();
+    }
 }
 
 function searchPersonalMedico(searchTerm) {
@@ -247,8 +299,8 @@ function savePersonalMedicoWithContrato() {
                 modal.hide();
             }
             
-            // Recargar datos
-            loadPersonalMedico();
+            // Actualizar solo las filas que cambiaron
+            syncPersonalMedicoChanges();
             
             // Mostrar mensaje de éxito
             showToast('Personal médico y contrato creados exitosamente', 'success');
@@ -371,7 +423,7 @@ function savePersonalMedico() {
         if (data.success) {
             showSuccess(`Personal médico agregado exitosamente con ID ${data.id_personal} en Hospital ${data.id_hospital}`);
             bootstrap.Modal.getInstance(document.getElementById('personalMedicoModal')).hide();
-            loadPersonalMedico(); // Recargar datos
+            syncPersonalMedicoChanges(); // Actualizar solo las filas que cambiaron
         } else {
             showError('Error al agregar personal médico: ' + data.error);
         }
@@ -431,7 +483,7 @@ function updatePersonalMedico() {
         if (data.success) {
             showSuccess('Personal médico actualizado exitosamente');
             bootstrap.Modal.getInstance(document.getElementById('personalMedicoModal')).hide();
-            loadPersonalMedico(); // Recargar datos
+            syncPersonalMedicoChanges(); // Actualizar solo las filas que cambiaron
         } else {
             showError('Error al actualizar personal médico: ' + data.error);
         }
@@ -514,7 +566,7 @@ function confirmDeletePersonalMedico(idHospital, idPersonal) {
         console.log('🗑️ DEBUG DELETE - Response data:', data);
         if (data.success) {
             showSuccess('Personal médico eliminado exitosamente');
-            loadPersonalMedico(); // Recargar datos
+            syncPersonalMedicoChanges(); // Actualizar solo las filas que cambiaron
         } else {
             // Solo mostrar toast, NO modificar la tabla
             showError('Error al eliminar personal médico: ' + data.error);
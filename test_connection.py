@@ -1,34 +1,25 @@
-    # Test de conexión a las bases de datos
-import pyodbc
-import os
-from dotenv import load_dotenv
+# Test de conexión a las bases de datos
+from models.base import DatabaseConnection
 
-load_dotenv()
+db = DatabaseConnection()
 
-def test_connection(node_name, server, database, username, password):
+def test_connection(node_name, node):
     try:
-        connection_string = (
-            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            f"UID={username};"
-            f"PWD={password};"
-            f"TrustServerCertificate=yes;"
-        )
+        config = db.quito_config if node == 'quito' else db.guayaquil_config
         
         print(f"🔄 Probando conexión a {node_name}...")
-        print(f"   Servidor: {server}")
-        print(f"   Base de datos: {database}")
+        print(f"   Servidor: {config['server']}")
+        print(f"   Base de datos: {config['database']}")
         
-        connection = pyodbc.connect(connection_string)
-        cursor = connection.cursor()
-        cursor.execute("SELECT @@VERSION")
-        version = cursor.fetchone()[0]
+        with db.connection(node) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT @@VERSION")
+            version = cursor.fetchone()[0]
+            cursor.close()
         
         print(f"✅ {node_name}: Conexión exitosa!")
         print(f"   Versión SQL Server: {version[:50]}...")
         
-        connection.close()
         return True
         
     except Exception as e:
@@ -40,26 +31,14 @@ if __name__ == "__main__":
     print("🔍 Verificando conexiones a bases de datos distribuidas\n")
     
     # Probar Quito (principal)
-    quito_ok = test_connection(
-        "QUITO (Principal)",
-        os.getenv('DB_QUITO_SERVER'),
-        os.getenv('DB_QUITO_DATABASE'),
-        os.getenv('DB_QUITO_USERNAME'),
-        os.getenv('DB_QUITO_PASSWORD')
-    )
+    quito_ok = test_connection("QUITO (Principal)", 'quito')
     
     print()
     
     # Probar Guayaquil (secundario - puede estar offline)
     print("🔄 Probando conexión a GUAYAQUIL (Secundario)...")
     print("   (Nota: Esta máquina puede estar apagada)")
-    guayaquil_ok = test_connection(
-        "GUAYAQUIL (Secundario)",
-        os.getenv('DB_GUAYAQUIL_SERVER'),
-        os.getenv('DB_GUAYAQUIL_DATABASE'),
-        os.getenv('DB_GUAYAQUIL_USERNAME'),
-        os.getenv('DB_GUAYAQUIL_PASSWORD')
-    )
+    guayaquil_ok = test_connection("GUAYAQUIL (Secundario)", 'guayaquil')
     
     print("\n" + "="*50)
     if quito_ok:
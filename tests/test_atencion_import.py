@@ -0,0 +1,114 @@
+"""Pruebas de la importación de atenciones contra un rango de IDs acotado (sin base de datos)"""
+import csv
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+# models/__init__ importa base, que requiere el driver
+pytest.importorskip('pyodbc')
+
+from models import atencion_import
+from models.atencion_import import AtencionImport, ImportCheckpoint
+from models.id_allocator import IdRangeAllocator
+
+
+class FakeCursor:
+    def __init__(self, inserted):
+        self.inserted = inserted
+
+    def execute(self, query, params=None):
+        pass
+
+    def executemany(self, query, params):
+        self.inserted.extend(params)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, inserted):
+        self.inserted = inserted
+
+    def cursor(self):
+        return FakeCursor(self.inserted)
+
+    def commit(self):
+        pass
+
+
+class FakeModel:
+    """AtencionMedicaModel mínimo: lookups fijos y un allocator real sobre [1, max_id]"""
+
+    def __init__(self, max_id, used=()):
+        self.ID_RANGES = {'quito': {'min': 1, 'max': max_id}}
+        self.allocator = IdRangeAllocator(1, max_id, lambda: list(used))
+        self.inserted = []
+
+    def get_hospital_id_by_node(self, node):
+        return 1
+
+    def execute_query(self, query, params=None, node=None, compact=False, **kwargs):
+        return SimpleNamespace(rows=[(1,)])
+
+    def execute_cursor(self, cursor, query, params=None, node=None, statement=None, many=False):
+        (cursor.executemany if many else cursor.execute)(query, params)
+
+    def available_ids(self, node):
+        return self.allocator.available()
+
+    def reserve_ids(self, node, count):
+        return self.allocator.reserve_many(count)
+
+    def release_ids(self, ids, resync=False):
+        for id_value in ids:
+            self.allocator.release(id_value)
+
+    @contextmanager
+    def connection(self, node=None, shared=True):
+        yield FakeConnection(self.inserted)
+
+
+@pytest.fixture(autouse=True)
+def no_side_effects(monkeypatch):
+    tipos = {'success': True, 'tipos_atencion': [{'ID_Tipo': 1}]}
+    monkeypatch.setattr(atencion_import, 'TipoAtencionModel',
+                        lambda: SimpleNamespace(get_all_tipos_atencion=lambda node: tipos))
+    monkeypatch.setattr(atencion_import, 'invalidate_stats', lambda: None)
+    monkeypatch.setattr(atencion_import, 'record_change', lambda *args, **kwargs: None)
+
+
+def write_csv(path, count):
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(atencion_import.IMPORT_COLUMNS)
+        for number in range(count):
+            writer.writerow([1, 1, 1, '2024-01-15', f'Diagnóstico {number}', 'Control', 'Reposo'])
+
+
+def importer(model, path, checkpoints, chunk_size):
+    job = AtencionImport(model, str(path), 'quito', chunk_size=chunk_size, progress=None)
+    job.checkpoint = ImportCheckpoint(job.job_id, str(checkpoints))
+    return job
+
+
+def test_import_larger_than_the_range_stops_cleanly_and_resumes(tmp_path):
+    path = tmp_path / 'atenciones.csv'
+    write_csv(path, 50)
+
+    model = FakeModel(max_id=40)
+    report = importer(model, path, tmp_path, chunk_size=15).run()
+
+    assert report['success'] is False and report['range_exhausted'] is True
+    assert 'Rango de IDs de atención agotado' in report['error']
+    assert report['inserted'] == 40 and report['rows_done'] == 40
+    assert [row[1] for row in model.inserted] == list(range(1, 41))
+
+    # Rango ampliado: se continúa desde la fila 41 sin repetir las ya insertadas
+    wider = FakeModel(max_id=100, used=range(1, 41))
+    report = importer(wider, path, tmp_path, chunk_size=15).run()
+
+    assert report['success'] is True and report['finished'] is True
+    assert report['inserted'] == 50
+    assert [row[1] for row in wider.inserted] == list(range(41, 51))
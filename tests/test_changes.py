@@ -0,0 +1,52 @@
+"""Pruebas del registro de cambios (SQLite en un directorio temporal)"""
+import pytest
+
+pytest.importorskip('pyodbc')
+
+from models import changes
+from models.changes import ChangeLog
+
+
+@pytest.fixture
+def log(tmp_path):
+    return ChangeLog(str(tmp_path / 'changes.sqlite3'))
+
+
+def test_changes_since_returns_keys_after_version(log):
+    first = log.append('pacientes', (1, 1))
+    log.append('pacientes', (1, 2))
+    log.append('atenciones', (1, 7))
+    delta = log.changes_since('pacientes', first)
+    assert delta == {'version': 3, 'reset': False, 'keys': [[1, 2]]}
+
+
+def test_changes_since_current_version_is_empty(log):
+    version = log.append('pacientes', (1, 1))
+    assert log.changes_since('pacientes', version) == {'version': version, 'reset': False, 'keys': []}
+
+
+def test_changes_since_future_version_resets(log):
+    log.append('pacientes', (1, 1))
+    assert log.changes_since('pacientes', 5)['reset'] is True
+
+
+def test_changes_since_before_retention_resets(log):
+    for id_paciente in range(1, 6):
+        log.append('pacientes', (1, id_paciente))
+    log.prune(keep=2)
+    # Se conservan las versiones 4 y 5: desde 3 todavía se puede responder, desde 2 no
+    assert log.changes_since('pacientes', 3) == {'version': 5, 'reset': False, 'keys': [[1, 4], [1, 5]]}
+    assert log.changes_since('pacientes', 2)['reset'] is True
+
+
+def test_whole_entity_change_resets(log):
+    version = log.append('pacientes', (1, 1))
+    log.append('pacientes', ())
+    assert log.changes_since('pacientes', version)['reset'] is True
+
+
+def test_too_many_keys_resets(log, monkeypatch):
+    monkeypatch.setattr(changes, 'MAX_DELTA_KEYS', 2)
+    for id_paciente in range(1, 4):
+        log.append('pacientes', (1, id_paciente))
+    assert log.changes_since('pacientes', 0)['reset'] is True
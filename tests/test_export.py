@@ -0,0 +1,66 @@
+"""Pruebas de los timeouts de la exportación con un nodo colgado (sin base de datos)"""
+import threading
+
+import pytest
+
+# models/__init__ importa base, que requiere el driver
+pytest.importorskip('pyodbc')
+
+from models import export
+from models.export import ExportModel, NodeReader
+
+
+class FakeResultSet:
+    """StreamingResultSet que entrega sus filas cuando se libera release"""
+
+    def __init__(self, rows=(), hang=False):
+        self._rows = list(rows)
+        self.release = threading.Event()
+        if not hang:
+            self.release.set()
+        self.closed = threading.Event()
+
+    @property
+    def rows(self):
+        self.release.wait(5)
+        return iter(self._rows)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_reader_times_out_on_a_hung_node_and_closes_it():
+    resultset = FakeResultSet([(1,), (2,)], hang=True)
+    reader = NodeReader('quito', resultset, timeout=0.1)
+
+    with pytest.raises(TimeoutError):
+        list(reader)
+
+    resultset.release.set()
+    assert resultset.closed.wait(2)
+
+
+def test_open_partitions_closes_opened_and_late_cursors_on_timeout(monkeypatch):
+    monkeypatch.setattr(export, 'DISTRIBUTED_TIMEOUT', 0.1)
+    fast = FakeResultSet()
+    late = FakeResultSet()
+    late_opened = threading.Event()
+    hang = threading.Event()
+
+    def open_partition(source, filters, hospital_id, nodes):
+        if hospital_id == 1:
+            return 'quito', fast
+        hang.wait(5)
+        late_opened.set()
+        return 'guayaquil', late
+
+    model = ExportModel.__new__(ExportModel)
+    monkeypatch.setattr(model, '_open_partition', open_partition)
+
+    assert model._open_partitions(None, {}, {1: ['quito'], 2: ['guayaquil']}) is None
+    assert fast.closed.is_set()
+
+    # El nodo lento termina de abrir después del timeout: su cursor se cierra igual
+    hang.set()
+    assert late_opened.wait(2)
+    assert late.closed.wait(2)
@@ -0,0 +1,87 @@
+"""Pruebas del allocator de IDs por rango (sin base de datos)"""
+import pytest
+
+# models/__init__ importa base, que requiere el driver
+pytest.importorskip('pyodbc')
+
+from models.id_allocator import IdRangeAllocator, is_duplicate_key
+
+
+def allocator(used=(), min_id=1, max_id=10):
+    return IdRangeAllocator(min_id, max_id, lambda: list(used))
+
+
+def test_reserve_many_takes_lowest_free_ids_across_gaps():
+    ids = allocator(used=[2, 3, 6]).reserve_many(4)
+    assert ids == [1, 4, 5, 7]
+
+
+def test_reserve_many_without_enough_ids_reserves_nothing():
+    ids_allocator = allocator(used=range(1, 9))
+    assert ids_allocator.reserve_many(3) is None
+    assert ids_allocator.reserve_many(2) == [9, 10]
+
+
+def test_release_returns_id_and_merges_intervals():
+    ids_allocator = allocator()
+    assert ids_allocator.reserve_many(3) == [1, 2, 3]
+    ids_allocator.release(2)
+    assert ids_allocator.reserve() == 2
+    ids_allocator.release(1)
+    ids_allocator.release(2)
+    ids_allocator.release(3)
+    assert ids_allocator.reserve_many(10) == list(range(1, 11))
+
+
+def test_reservation_survives_reseed():
+    ids_allocator = allocator()
+    assert ids_allocator.reserve() == 1
+    ids_allocator.invalidate()
+    # La base todavía no tiene el ID 1 (INSERT en curso): no se vuelve a entregar
+    assert ids_allocator.reserve() == 2
+
+
+def test_excluded_id_is_not_released():
+    ids_allocator = allocator()
+    assert ids_allocator.reserve() == 1
+    ids_allocator.exclude(1)
+    ids_allocator.exclude(2)
+    ids_allocator.release(1)
+    assert ids_allocator.reserve() == 3
+    assert ids_allocator.claim(2) is False
+
+
+def test_reseed_rereads_exclusions():
+    contratos = {1, 2}
+    ids_allocator = IdRangeAllocator(1, 10, lambda: [], load_excluded=lambda: set(contratos))
+    assert ids_allocator.reserve() == 3
+    ids_allocator.exclude(4)
+    ids_allocator.invalidate()
+    # El 4 no tiene contrato en la base: la exclusión no sobrevive a la resincronización
+    assert ids_allocator.reserve_many(2) == [4, 5]
+
+
+def test_released_id_returns_after_its_contrato_is_deleted():
+    contratos = {1}
+    ids_allocator = IdRangeAllocator(1, 10, lambda: [], load_excluded=lambda: set(contratos))
+    assert ids_allocator.reserve() == 2
+    ids_allocator.release(1)
+    assert ids_allocator.reserve() == 3
+
+    # Baja del contrato en otro proceso: la siembra siguiente lo vuelve a ofrecer
+    contratos.discard(1)
+    ids_allocator.invalidate()
+    assert ids_allocator.reserve() == 1
+
+    # Baja en este proceso: se quita la exclusión y el release lo devuelve
+    ids_allocator.exclude(5)
+    ids_allocator.unexclude(5)
+    ids_allocator.release(3)
+    ids_allocator.release(5)
+    assert ids_allocator.reserve_many(3) == [3, 4, 5]
+
+
+def test_is_duplicate_key():
+    assert is_duplicate_key(Exception("Violation of PRIMARY KEY constraint 'PK_Paciente'. "
+                                      "Cannot insert duplicate key in object 'dbo.Paciente'. (2627)"))
+    assert not is_duplicate_key(Exception("The INSERT statement conflicted with the FOREIGN KEY constraint (547)"))
@@ -0,0 +1,35 @@
+"""Pruebas de las etiquetas de consulta para /metrics"""
+import os
+
+import pytest
+
+pytest.importorskip('pyodbc')
+
+from models.metrics import QueryMetrics, statement_label
+
+
+@pytest.mark.parametrize('sql, label', [
+    ("{CALL SP_Create_Paciente (?, ?, ?)}", 'CALL SP_Create_Paciente'),
+    ("SELECT * FROM Vista_Paciente WHERE ID_Hospital = ?", 'SELECT Vista_Paciente'),
+    ("select count(*) from [dbo].[Contratos]", 'SELECT Contratos'),
+    ("INSERT INTO Vista_INF_Personal (ID_Hospital) VALUES (?)", 'INSERT Vista_INF_Personal'),
+    ("UPDATE Especialidad SET Área = ? WHERE ID_Especialidad = ?", 'UPDATE Especialidad'),
+    ("DELETE FROM Tipo_Atención WHERE ID_Tipo = ?", 'DELETE Tipo_Atención'),
+    ("SELECT 1", 'SELECT'),
+    ("   ", 'vacía'),
+])
+def test_statement_label(sql, label):
+    assert statement_label(sql) == label
+
+
+def test_render_labels_series_with_worker_pid():
+    metrics = QueryMetrics(slow_ms=10_000)
+    metrics.record('SELECT Vista_Paciente', 'quito', execute=0.002, fetch=0.001, rows=3)
+    metrics.record_checkout('quito', 0.0005)
+    text = metrics.render([{'node': 'quito', 'idle': 1, 'in_use': 0}])
+
+    pid = f'pid="{os.getpid()}"'
+    series = [line for line in text.splitlines() if line and not line.startswith('#')]
+    assert series
+    assert all(pid in line for line in series)
+    assert f'db_query_rows_total{{statement="SELECT Vista_Paciente",node="quito",{pid}}} 3' in series
@@ -0,0 +1,37 @@
+"""Pruebas de la paginación por cursor (keyset)"""
+import pytest
+
+pytest.importorskip('pyodbc')
+
+from models.pagination import KeysetPage
+
+
+def test_condition_single_column():
+    page = KeysetPage(('ID',), after=[5])
+    assert page._condition(page.key_columns, page.after) == ("ID > ?", [5])
+
+
+def test_condition_expands_tuple_comparison():
+    page = KeysetPage(('ID_Hospital', 'ID_Paciente'), after=[1, 20])
+    sql, params = page._condition(page.key_columns, page.after)
+    assert sql == "(ID_Hospital > ? OR (ID_Hospital = ? AND ID_Paciente > ?))"
+    assert params == [1, 1, 20]
+
+
+def test_condition_three_columns():
+    page = KeysetPage(('A', 'B', 'C'), after=[1, 2, 3])
+    sql, params = page._condition(page.key_columns, page.after)
+    assert sql == "(A > ? OR (A = ? AND (B > ? OR (B = ? AND C > ?))))"
+    assert params == [1, 1, 2, 2, 3]
+
+
+def test_where_and_params_follow_sql_order():
+    page = KeysetPage(('ID_Hospital', 'ID_Paciente'), after=[1, 20], limit=50, keys=[[2]])
+    assert page.where() == (" AND (ID_Hospital > ? OR (ID_Hospital = ? AND ID_Paciente > ?))"
+                            " AND ((ID_Hospital = ?))")
+    assert page.params() == [1, 1, 20, 2, 50]
+
+
+def test_cursor_with_wrong_length_is_rejected():
+    with pytest.raises(ValueError):
+        KeysetPage(('ID_Hospital', 'ID_Paciente'), after=[1])
@@ -0,0 +1,105 @@
+"""Pruebas de las sagas con y sin unidad de trabajo (sin base de datos)"""
+import uuid
+
+import pytest
+
+# models/__init__ importa base, que requiere el driver
+pytest.importorskip('pyodbc')
+
+from models import unit_of_work
+from models.saga import Saga, SagaError, SagaLog, SagaStep
+from models.unit_of_work import UnitOfWork, set_unit_of_work_provider
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def acquire(self):
+        return FakeConnection()
+
+    def release(self, connection, discard=False):
+        pass
+
+
+@pytest.fixture
+def unit():
+    previous = unit_of_work._provider
+    unit = UnitOfWork()
+    set_unit_of_work_provider(lambda: unit)
+    yield unit
+    set_unit_of_work_provider(previous)
+
+
+@pytest.fixture
+def log(tmp_path):
+    return SagaLog(str(tmp_path / 'sagas.sqlite3'))
+
+
+def build_saga(log, compensated, fail_at=None):
+    """reservar (en memoria) -> escribir (en la base) -> confirmar_remoto; fail_at hace fallar un paso"""
+    def action(name, writes):
+        def run(context):
+            if name == fail_at:
+                raise SagaError(f'{name} falló')
+            current = unit_of_work.current_unit_of_work()
+            if writes and current is not None:
+                with current.use('quito', FakePool()) as connection:
+                    connection.commit()
+            return name
+        return run
+
+    def compensation(name):
+        return lambda context: compensated.append(name)
+
+    return Saga(f'prueba-{uuid.uuid4().hex}', [
+        SagaStep('reservar', action('reservar', False), compensation('reservar'), transactional=False),
+        SagaStep('escribir', action('escribir', True), compensation('escribir'), after=('reservar',)),
+        SagaStep('remoto', action('remoto', True), compensation('remoto'), after=('escribir',)),
+    ], log=log)
+
+
+def test_failed_step_in_unit_discards_writes_instead_of_compensating(unit, log):
+    compensated = []
+    result = build_saga(log, compensated, fail_at='remoto').run(node='quito')
+
+    assert result['success'] is False and result['compensated'] is True
+    # 'escribir' nunca se confirmó: la unidad se revierte y solo se deshace la reserva
+    assert compensated == ['reservar']
+    assert unit.failed
+    assert log.status()['counts']['compensated'] == 1
+
+
+def test_unit_rollback_after_saga_marks_it_compensated(unit, log):
+    compensated = []
+    result = build_saga(log, compensated).run(node='quito')
+    assert result['success'] is True
+    assert log.status()['counts']['running'] == 1
+
+    assert unit.finish(success=False) is False
+    assert compensated == ['reservar']
+    counts = log.status()['counts']
+    assert counts['compensated'] == 1 and counts['failed'] == 0
+
+
+def test_unit_commit_marks_saga_done(unit, log):
+    compensated = []
+    build_saga(log, compensated).run(node='quito')
+
+    assert unit.finish(success=True) is True
+    assert compensated == []
+    assert log.status()['counts']['done'] == 1
+
+
+def test_without_unit_every_completed_step_is_compensated(log):
+    compensated = []
+    result = build_saga(log, compensated, fail_at='remoto').run(node='quito')
+
+    assert result['success'] is False
+    assert compensated == ['escribir', 'reservar']
+    assert log.status()['counts']['compensated'] == 1
@@ -0,0 +1,56 @@
+"""Pruebas del índice de búsqueda por n-gramas"""
+import pytest
+
+pytest.importorskip('pyodbc')
+
+from models.search_index import SearchIndex
+
+ROWS = [
+    {'ID_Hospital': 1, 'ID_Paciente': 1, 'Nombre': 'José', 'Apellido': 'Pérez'},
+    {'ID_Hospital': 1, 'ID_Paciente': 2, 'Nombre': 'Ana', 'Apellido': 'Joseph'},
+    {'ID_Hospital': 2, 'ID_Paciente': 12, 'Nombre': 'Luis', 'Apellido': 'Mora'},
+]
+
+
+def build_index(rows=ROWS):
+    index = SearchIndex(('ID_Hospital', 'ID_Paciente'), ('Nombre', 'Apellido', 'ID_Paciente'))
+    assert index.rebuild_from(lambda: [dict(row) for row in rows])
+    return index
+
+
+def ids(rows):
+    return [row['ID_Paciente'] for row in rows]
+
+
+def test_cold_index_returns_none():
+    index = SearchIndex(('ID',), ('Nombre',))
+    assert index.search('a') is None
+
+
+def test_short_and_long_terms_ignore_case_and_accents():
+    index = build_index()
+    assert ids(index.search('jos')) == [1, 2]
+    assert ids(index.search('JOSE')) == [1, 2]
+    assert ids(index.search('pérez')) == [1]
+    assert ids(index.search('perez')) == [1]
+
+
+def test_long_term_requires_contiguous_substring():
+    # 'osé' y 'jos' están en 'josé', pero 'josep' solo en 'joseph'
+    index = build_index()
+    assert ids(index.search('josep')) == [2]
+    assert index.search('sejo') == []
+
+
+def test_numeric_ids_and_where_filter():
+    index = build_index()
+    assert ids(index.search('12')) == [12]
+    assert ids(index.search('', where=lambda row: row['ID_Hospital'] == 1)) == [1, 2]
+
+
+def test_upsert_and_remove():
+    index = build_index()
+    index.upsert({'ID_Hospital': 1, 'ID_Paciente': 2, 'Nombre': 'Ana', 'Apellido': 'Ruiz'})
+    assert ids(index.search('jos')) == [1]
+    index.remove((1, 1))
+    assert index.search('jos') == []
@@ -0,0 +1,92 @@
+"""Pruebas de la unidad de trabajo por petición (sin base de datos)"""
+import threading
+
+import pytest
+
+# models/__init__ importa base, que requiere el driver
+pytest.importorskip('pyodbc')
+
+from models import unit_of_work
+from models.fanout import fan_out
+from models.unit_of_work import UnitOfWork, current_unit_of_work, outside_unit_of_work, set_unit_of_work_provider
+
+
+class FakeConnection:
+    def __init__(self):
+        self.committed = False
+        self.rolled_back = False
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakePool:
+    def acquire(self):
+        return FakeConnection()
+
+    def release(self, connection, discard=False):
+        pass
+
+
+@pytest.fixture
+def unit():
+    previous = unit_of_work._provider
+    unit = UnitOfWork()
+    set_unit_of_work_provider(lambda: unit)
+    yield unit
+    set_unit_of_work_provider(previous)
+
+
+def write(unit, node='quito'):
+    with unit.use(node, FakePool()) as connection:
+        connection.commit()
+        return connection.raw
+
+
+def test_fan_out_uses_other_threads_before_writing(unit):
+    results, status = fan_out(lambda node: threading.get_ident(), ['quito', 'guayaquil'])
+    assert status == {'quito': 'ok', 'guayaquil': 'ok'}
+    assert threading.get_ident() not in results.values()
+
+
+def test_fan_out_runs_in_request_thread_after_writing(unit):
+    write(unit)
+    results, status = fan_out(lambda node: threading.get_ident(), ['quito', 'guayaquil'])
+    assert status == {'quito': 'ok', 'guayaquil': 'ok'}
+    assert set(results.values()) == {threading.get_ident()}
+
+
+def test_outside_unit_of_work_detaches_the_thread(unit):
+    with outside_unit_of_work():
+        assert current_unit_of_work() is None
+    assert current_unit_of_work() is unit
+
+
+def test_failed_json_response_rolls_back_the_request():
+    flask = pytest.importorskip('flask')
+    import app as app_module
+
+    unit = UnitOfWork()
+    with app_module.app.test_request_context('/api/pacientes/add', method='POST'):
+        flask.g.unit_of_work = unit
+        raw = write(unit)
+        # Error capturado por el modelo: 200 con success=False
+        app_module.mark_failed_request(flask.jsonify({'success': False, 'error': 'SP falló'}))
+        app_module.finish_unit_of_work(None)
+    assert raw.rolled_back and not raw.committed
+
+
+def test_successful_json_response_commits_the_request():
+    flask = pytest.importorskip('flask')
+    import app as app_module
+
+    unit = UnitOfWork()
+    with app_module.app.test_request_context('/api/pacientes/add', method='POST'):
+        flask.g.unit_of_work = unit
+        raw = write(unit)
+        app_module.mark_failed_request(flask.jsonify({'success': True}))
+        app_module.finish_unit_of_work(None)
+    assert raw.committed and not raw.rolled_back
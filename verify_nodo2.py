@@ -21,9 +21,7 @@ def test_connectivity():
     
     # Test Quito
     try:
-        conn_quito = db.get_connection('quito')
-        if conn_quito:
-            conn_quito.close()
+        if db.get_pool('quito').ping():
             print("✅ Conexión a Quito: OK")
         else:
             print("❌ Conexión a Quito: FALLO")
@@ -34,9 +32,7 @@ def test_connectivity():
     
     # Test Guayaquil
     try:
-        conn_guayaquil = db.get_connection('guayaquil')
-        if conn_guayaquil:
-            conn_guayaquil.close()
+        if db.get_pool('guayaquil').ping():
             print("✅ Conexión a Guayaquil: OK")
         else:
             print("❌ Conexión a Guayaquil: FALLO")
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+🚀 PUNTO DE ENTRADA WSGI - Sistema Hospitalario
+Expone la aplicación sin inicializarla: con gunicorn (preload_app) el módulo se importa
+una vez en el proceso maestro y cada worker ejecuta warm_up() después del fork, así
+ningún worker hereda conexiones ODBC ni hilos del maestro.
+
+Uso (requiere gunicorn):
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+from app import get_app
+
+application = get_app(warm=False)